@@ -3,15 +3,18 @@
 DingTalk ⇄ ZenTao SSO 网关
 - PC 一键：/dingtalk/login → 授权 → callback(J|...) → 由网关中继 Cookie 后直进首页
 - 扫码：   /dingtalk/qrcode → 授权 → callback(Q|ticket) → 仅显示“成功，可关闭”，PC 端可轮询 /dingtalk/status
-- 健康：   /health
+          （?wait=N 长轮询，或 /dingtalk/status/stream SSE）
+- 健康：   /health（存活）；/health?deep=1（就绪：读取后台探测缓存的 MySQL / 禅道 / 钉钉状态）
+- 指标：   /metrics（Prometheus 文本格式，多 worker 汇总）
 """
-from flask import Flask, request, redirect, render_template, send_file, Response, jsonify, make_response
-import logging, urllib.parse, qrcode, os, time, uuid, json, re, requests
-from io import BytesIO
+from flask import Flask, request, redirect, render_template, Response, jsonify, make_response
+import logging, urllib.parse, os, re, json, time, uuid, hmac, hashlib, importlib, threading
 
 # ---------- 配置 ----------
 import config as _cfg
-from services import zentao_api
+from services import zentao_api, ticket_store, qr_render, event_sync, metrics, db_pool, account_cache, log_pipeline
+from services import rate_limit, provisioning, breaker, deadline, health, single_flight, dt_callback
+from services.http_client import client as _http_client, add_hook as _http_add_hook
 from services.bind_store import get as bind_get, put as bind_put
 import mapping as _map
 
@@ -26,6 +29,17 @@ ALLOW_AUTO_CREATE_BY_NAME        = getattr(_cfg, "ALLOW_AUTO_CREATE_BY_NAME", Tr
 DEFAULT_GROUPS          = getattr(_cfg, "DEFAULT_GROUPS", ["pm"])
 AUTO_JOIN_PROJECT_ID    = getattr(_cfg, "AUTO_JOIN_PROJECT_ID", 0)
 AUTO_JOIN_PROJECT_ROLE  = getattr(_cfg, "AUTO_JOIN_PROJECT_ROLE", "pm")
+PROVISION_POLICY        = provisioning.policy_version(DEFAULT_GROUPS, AUTO_JOIN_PROJECT_ID, AUTO_JOIN_PROJECT_ROLE)
+
+ACCOUNT_PRELOAD = getattr(_cfg, "ACCOUNT_PRELOAD", False)
+ZENTAO_API_MIRROR = getattr(_cfg, "ZENTAO_API_MIRROR", True)
+EVENT_SYNC_ENABLED = getattr(_cfg, "EVENT_SYNC_ENABLED", True)
+
+QR_FORMAT = getattr(_cfg, "QR_FORMAT", "png")   # png / svg
+
+RELAY_MODE             = getattr(_cfg, "RELAY_MODE", "fast")          # fast / legacy
+RELAY_WARMUP           = getattr(_cfg, "RELAY_WARMUP", "auto")        # auto / always / never
+RELAY_FOLLOW_REDIRECTS = getattr(_cfg, "RELAY_FOLLOW_REDIRECTS", False)
 
 ACCOUNT_MAP = getattr(_map, "ACCOUNT_MAP", {})
 DEPT_MAP    = getattr(_map,  "DEPT_MAP", {})
@@ -33,43 +47,194 @@ DEPT_MAP    = getattr(_map,  "DEPT_MAP", {})
 # ---------- 日志 ----------
 LOG_PATH  = getattr(_cfg, "LOG_FILE", "/var/log/dingtalk_login.log") or "/var/log/dingtalk_login.log"
 LOG_LEVEL = getattr(_cfg, "LOG_LEVEL", "INFO")
-_log_dir = os.path.dirname(LOG_PATH)
-if _log_dir:
-    os.makedirs(_log_dir, exist_ok=True)
-try:
-    if not os.path.exists(LOG_PATH):
-        open(LOG_PATH, "a").close()
-except Exception:
-    LOG_PATH = "/tmp/dingtalk_login.log"
-handlers = [logging.FileHandler(LOG_PATH, encoding="utf-8"), logging.StreamHandler()]
-logging.basicConfig(level=getattr(logging, (LOG_LEVEL or "INFO").upper(), logging.INFO),
-                    format="%(asctime)s | %(levelname)s | %(message)s",
-                    handlers=handlers)
+LOG_FORMAT = getattr(_cfg, "LOG_FORMAT", "json")             # json / text
+LOG_QUEUE_SIZE = int(getattr(_cfg, "LOG_QUEUE_SIZE", 10000) or 10000)
+LOG_SAMPLE = getattr(_cfg, "LOG_SAMPLE", {"status": 0.01, "event": 0.1, "limited": 0.01})
+
+def _setup_logging():
+    global LOG_PATH
+    try:
+        _log_dir = os.path.dirname(LOG_PATH)
+        if _log_dir:
+            os.makedirs(_log_dir, exist_ok=True)
+        if not os.path.exists(LOG_PATH):
+            open(LOG_PATH, "a").close()
+    except Exception:
+        LOG_PATH = "/tmp/dingtalk_login.log"
+    log_pipeline.setup(LOG_PATH, LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_SAMPLE)
 
 app = Flask(__name__)
+_zentao_http = _http_client("zentao")
+
+# ---------- 指标 ----------
+METRICS_ENABLED = getattr(_cfg, "METRICS_ENABLED", True)
+
+def _collect_gauges():
+    out = [(f"db_pool_{k}", {}, v) for k, v in db_pool.stats().items() if isinstance(v, (int, float))]
+    st = account_cache.stats()
+    for cache in ("exists", "realname"):
+        out += [(f"account_cache_{k}", {"cache": cache}, v) for k, v in st[cache].items()]
+    out.append(("account_index_size", {}, st["index"]["accounts"]))
+    out += [(f"log_{k}", {}, v) for k, v in log_pipeline.stats().items()]
+    out += [(f"provision_{k}", {}, v) for k, v in provisioning.stats().items()]
+    for name, st in breaker.stats().items():
+        out.append(("breaker_state", {"upstream": name}, st["state"]))
+        out.append(("breaker_rejected", {"upstream": name}, st["rejected"]))
+    out += health.gauges()
+    return out
+
+if METRICS_ENABLED:
+    _http_add_hook(metrics.http_hook)
+    metrics.add_collector(_collect_gauges)
+
+    @app.before_request
+    def _metrics_start():
+        request.environ["sso.t0"] = time.perf_counter()
+
+    @app.after_request
+    def _metrics_end(resp):
+        t0 = request.environ.get("sso.t0")
+        if t0 is not None:
+            route = request.url_rule.rule if request.url_rule else "other"
+            metrics.observe("request_seconds", time.perf_counter() - t0, route=route)
+            metrics.inc("requests_total", route=route, status=str(resp.status_code))
+        return resp
 
-# ---------- 票据（扫码轮询可选） ----------
-TICKET_FILE = "/tmp/dt_tickets.json"
-def _load_tickets():
+# 每个请求一条结构化日志（request_id / 路由 / 状态 / 耗时 / 各阶段耗时）；状态轮询与事件按 LOG_SAMPLE 采样
+# 整条回调链（钉钉 / MySQL / 禅道中继）共享一个截止时间；上游熔断或预算耗尽时快速返回 503
+REQUEST_DEADLINE = float(getattr(_cfg, "REQUEST_DEADLINE", 12) or 0)
+_SAMPLED_ROUTES = {"/dingtalk/status": "status", "/dingtalk/status/stream": "status", "/dingtalk/event": "event"}
+
+@app.before_request
+def _request_start():
+    rid = request.headers.get("X-Request-Id") or uuid.uuid4().hex[:16]
+    log_pipeline.set_request_id(rid[:64])
+    request.environ["sso.log_t0"] = time.perf_counter()
+    request.environ["sso.stages"] = metrics.track_stages()
+    deadline.start(REQUEST_DEADLINE)
+
+@app.after_request
+def _request_log(resp):
+    route = request.url_rule.rule if request.url_rule else "other"
+    ms = round((time.perf_counter() - request.environ.get("sso.log_t0", time.perf_counter())) * 1000, 1)
+    extra = {"route": route, "status": resp.status_code, "ms": ms, "ip": _client_ip()}
+    stages = request.environ.get("sso.stages")
+    if stages: extra["stages"] = stages
+    if route in _SAMPLED_ROUTES: extra["sample"] = _SAMPLED_ROUTES[route]
+    if resp.status_code == 429: extra["sample"] = "limited"
+    logging.info("%s %s %d %.1fms", request.method, route, resp.status_code, ms, extra=extra)
+    resp.headers["X-Request-Id"] = log_pipeline.request_id()
+    return resp
+
+@app.teardown_request
+def _request_end(_exc):
+    log_pipeline.clear_request_id()
+    deadline.clear()
+
+# ---------- 准入控制 ----------
+# 在视图之前判定：被拒请求不生成票据、不渲染二维码、不访问票据库；429 带 Retry-After
+RATE_LIMIT_ENABLED     = getattr(_cfg, "RATE_LIMIT_ENABLED", True)
+TICKET_MAX_OUTSTANDING = int(getattr(_cfg, "TICKET_MAX_OUTSTANDING", 20000) or 0)
+_ticket_count = [0.0, 0]          # [取数时间, 未过期票据数]，每秒最多 COUNT 一次
+
+def _outstanding_tickets() -> int:
+    now = time.monotonic()
+    if now - _ticket_count[0] > 1.0:
+        _ticket_count[:] = [now, ticket_store.count()]
+    return _ticket_count[1]
+
+def _limit_bucket():
+    ep = request.endpoint
+    if ep == "dingtalk_newticket" or (ep == "dingtalk_qrcode" and not request.args.get("ticket")):
+        return "ticket"
+    if ep in ("dingtalk_status", "dingtalk_status_stream", "dingtalk_qrcode"):
+        return "status"
+    return None
+
+def _too_many(bucket: str, retry_after: int, reason: str):
+    metrics.inc("rate_limited_total", bucket=bucket, reason=reason)
+    resp = jsonify({"error": "请求过于频繁，请稍后再试", "retry_after": retry_after})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(retry_after)
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.before_request
+def _admission():
+    if not RATE_LIMIT_ENABLED: return None
+    bucket = _limit_bucket()
+    if not bucket: return None
+    ok, retry_after = rate_limit.allow(bucket, _client_ip())
+    if not ok:
+        return _too_many(bucket, retry_after, "ip")
+    if bucket == "ticket" and TICKET_MAX_OUTSTANDING and _outstanding_tickets() >= TICKET_MAX_OUTSTANDING:
+        return _too_many(bucket, 5, "tickets")
+    return None
+
+# ---------- 依赖探测 ----------
+# 后台线程按 HEALTH_INTERVAL 探测，/health?deep=1 只读缓存；探测项可用 HEALTH_CHECKS 裁剪
+HEALTH_CHECKS = getattr(_cfg, "HEALTH_CHECKS", None)
+if HEALTH_CHECKS is None:             # 默认按部署方式：API 模式不依赖 MySQL
+    HEALTH_CHECKS = (["mysql"] if zentao_api.ZENTAO_CREATE_MODE == "mysql" else []) + ["zentao", "dingtalk"]
+
+def _ping_dingtalk():
+    from services import dingtalk_api
+    dingtalk_api.ping()
+
+for _name, _fn in (("mysql", zentao_api.ping_db), ("zentao", zentao_api.ping_web), ("dingtalk", _ping_dingtalk)):
+    if _name in HEALTH_CHECKS: health.register(_name, _fn)
+
+# ---------- 进程初始化 ----------
+# 导入 app 只定义路由与配置；日志写线程、账号索引、事件消费线程等在 init_worker() 中按进程启动。
+# gunicorn preload_app 模式（SSO_PRELOAD=1，gunicorn.conf.py 设置 SSO_DEFER_INIT）下 master 只导入，由 post_fork 在每个 worker 里调用；
+# 其余情况（非 preload、python app.py）导入时即调用。连接池 / Session / SQLite 连接均按 pid 懒建。
+_worker_pid = 0
+_init_lock = threading.Lock()
+
+def init_worker():
+    global _worker_pid
+    with _init_lock:
+        if _worker_pid == os.getpid(): return
+        _worker_pid = os.getpid()
+    _setup_logging()
+    if ACCOUNT_PRELOAD or (zentao_api.ZENTAO_CREATE_MODE == "api" and ZENTAO_API_MIRROR):
+        zentao_api.preload_accounts()
+    if EVENT_SYNC_ENABLED:
+        if getattr(_cfg, "DT_APP_SECRET", ""):
+            from services import dingtalk_api as _dt
+            event_sync.set_token_provider(_dt.get_app_access_token)
+        event_sync.start_worker()
+    health.start()
+
+def warm_imports():
+    """preload 模式下在 master 预先导入按需加载的模块，fork 后各 worker 写时复制共享。"""
+    importlib.import_module("requests.adapters")
     try:
-        with open(TICKET_FILE, "r", encoding="utf-8") as f: return json.load(f)
-    except Exception:
-        return {}
-def _save_tickets(data: dict):
-    tmp = TICKET_FILE + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f: json.dump(data, f)
-    os.replace(tmp, TICKET_FILE)
+        importlib.import_module("qrcode")
+        if QR_FORMAT == "png": importlib.import_module("qrcode.image.pil")
+    except ImportError:
+        pass
+
+if os.getenv("SSO_DEFER_INIT") == "1":
+    warm_imports()
+else:
+    init_worker()
+
+# ---------- 票据（扫码轮询可选） ----------
 def ticket_new(return_url: str) -> str:
-    data = _load_tickets(); t = uuid.uuid4().hex
-    data[t] = {"ok": False, "created": int(time.time()), "return": return_url}
-    _save_tickets(data); return t
+    return ticket_store.new(return_url)
 def ticket_ok(t: str, account: str, redirect_url: str):
-    data = _load_tickets()
-    if t in data:
-        data[t].update({"ok": True, "account": account, "redirect": redirect_url, "ts": int(time.time())})
-        _save_tickets(data)
+    ticket_store.ok(t, account, redirect_url)
 def ticket_get(t: str):
-    return _load_tickets().get(t)
+    return ticket_store.get(t)
+
+# 长轮询 / SSE：限制同时挂起的等待数，超出时立即返回并带 retry（秒）与 Retry-After，前端按其间隔轮询。
+# 同步 worker 下每个等待占一个线程，只能挂起少数几个，其余页面按原 2 秒间隔轮询；大批量挂起用 ASGI 模式（asgi.py）
+LONGPOLL_TIMEOUT     = int(getattr(_cfg, "LONGPOLL_TIMEOUT", 25) or 25)
+LONGPOLL_MAX_WAITERS = int(getattr(_cfg, "LONGPOLL_MAX_WAITERS", 2) or 2)
+LONGPOLL_BUSY_RETRY  = max(int(getattr(_cfg, "LONGPOLL_BUSY_RETRY", 2) or 2), 2)
+SSE_TIMEOUT          = int(getattr(_cfg, "SSE_TIMEOUT", 120) or 120)
+_waiters = threading.BoundedSemaphore(LONGPOLL_MAX_WAITERS)
 
 # ---------- 工具 ----------
 def _norm_return() -> str:
@@ -94,33 +259,54 @@ def build_auth_url(return_url: str, state: str = "", src: str = "jump") -> str:
         f"&return_url={urllib.parse.quote(return_url)}"
     )
 
+SINGLE_FLIGHT_ENABLED = getattr(_cfg, "SINGLE_FLIGHT_ENABLED", True)
+
+def _final_error(e: Exception) -> bool:
+    """重试同一授权码也不会成功的失败（如无权限 PermissionError）；熔断 / 超时 / 网络与数据库连接错误除外。"""
+    from requests import RequestException
+    from pymysql.err import OperationalError
+    return not isinstance(e, (breaker.CircuitOpen, deadline.DeadlineExceeded, RequestException,
+                              ConnectionError, TimeoutError, OperationalError))
+
 def _ensure_account_from_dingtalk(code: str) -> str:
     """从 code 换取用户并确保在禅道存在；必要时创建并配权。"""
     from services import dingtalk_api
-    access_token = dingtalk_api.get_user_access_token(code)
+    with metrics.stage("dingtalk_user_token"):
+        access_token = dingtalk_api.get_user_access_token(code)
     if not access_token:
         raise RuntimeError("获取 accessToken 失败")
 
-    user = dingtalk_api.get_user_me(access_token)
+    with metrics.stage("dingtalk_user_me"):
+        user = dingtalk_api.get_user_me(access_token)
     ding_uid = user.get("userId") or user.get("openId")
     if not ding_uid:
         raise RuntimeError(f"获取钉钉用户信息失败：{user}")
+    if not SINGLE_FLIGHT_ENABLED:
+        return _resolve_account(ding_uid, user)
+    # 同一钉钉用户并发登录（两次扫码等）只解析 / 创建一次
+    return single_flight.do("uid", ding_uid, lambda: _resolve_account(ding_uid, user))
+
+def _resolve_account(ding_uid: str, user: dict) -> str:
+    """按映射 / 绑定 / 姓名解析禅道账号，不存在时创建并配权。"""
     display_name = (user.get("name") or user.get("nick") or "").strip()
 
-    account = ACCOUNT_MAP.get(ding_uid) or bind_get(ding_uid)
-    if not account and BIND_BY_REALNAME_ON_FIRST_LOGIN and hasattr(zentao_api, "find_account_by_realname"):
-        if display_name:
-            matched = zentao_api.find_account_by_realname(display_name)
-            if matched:
-                account = matched
-                bind_put(ding_uid, account)
+    with metrics.stage("account_resolve"):
+        account = ACCOUNT_MAP.get(ding_uid) or bind_get(ding_uid)
+        if not account and BIND_BY_REALNAME_ON_FIRST_LOGIN and hasattr(zentao_api, "find_account_by_realname"):
+            if display_name:
+                matched = zentao_api.find_account_by_realname(display_name)
+                if matched:
+                    account = matched
+                    bind_put(ding_uid, account)
 
     if not account:
         account = ding_uid if ACCOUNT_STRATEGY == "ding_userid" else _normalize_account(display_name, ding_uid)
 
-    logging.info(f"[sso] will login/create account={account}  ding_uid={ding_uid}  display={display_name!r}")
+    logging.info("[sso] will login/create account=%s ding_uid=%s display=%r", account, ding_uid, display_name)
 
-    if not zentao_api.user_exists(account):
+    with metrics.stage("zentao_user_exists"):
+        exists = zentao_api.user_exists(account)
+    if not exists:
         if not ALLOW_AUTO_CREATE_BY_NAME and not bind_get(ding_uid):
             raise PermissionError("账号未映射且未允许自动创建")
 
@@ -132,53 +318,77 @@ def _ensure_account_from_dingtalk(code: str) -> str:
             "dept": DEPT_MAP.get(raw_dept, DEFAULT_DEPT_ID),
             "visions": "rnd"
         }
-        ret = zentao_api.create_user(account, fields)
-        logging.info(f"create_user({account}) => {ret}")
+        with metrics.stage("provision_new"):
+            ret = zentao_api.provision_user(account, fields, DEFAULT_GROUPS,
+                                            AUTO_JOIN_PROJECT_ID, AUTO_JOIN_PROJECT_ROLE)
+        logging.info("provision_user(%s) => %s", account, ret)
         if not ret or not ret.get("ok"):
             raise RuntimeError(f"创建用户失败：{ret}")
         bind_put(ding_uid, account)
+        if ret.get("provisioned", True):
+            provisioning.mark(account, PROVISION_POLICY)
+        else:
+            _provision_existing(account)          # 账号已建好，加组 / 入项目交后台重试
+        return account
 
-    # 统一配权（若实现）
-    try:
-        zentao_api.ensure_user_groups(account, DEFAULT_GROUPS)
-        if AUTO_JOIN_PROJECT_ID:
-            zentao_api.add_user_to_project(AUTO_JOIN_PROJECT_ID, account, role=AUTO_JOIN_PROJECT_ROLE)
-    except Exception as e:
-        logging.warning("post provision failed: %s", e)
-
+    _provision_existing(account)
     return account
 
+def _provision_existing(account: str):
+    """老用户：已按当前策略配权则跳过；否则交给后台执行（带重试），不阻塞跳转。"""
+    with metrics.stage("provision_existing"):
+        provisioning.ensure(account, PROVISION_POLICY,
+                            lambda: zentao_api.provision_user(account, None, DEFAULT_GROUPS,
+                                                              AUTO_JOIN_PROJECT_ID, AUTO_JOIN_PROJECT_ROLE))
+
 def _apilogin_url(account: str) -> str:
     url = zentao_api.apilogin_url(account)  # index.php?m=user&f=apilogin...
     connector = "&" if "?" in url else "?"
     return f"{url}{connector}referer=%2F"  # 防止回到受限页再跳登录
 
+def _client_ip() -> str:
+    xff = request.headers.get("X-Forwarded-For", "")
+    return (xff.split(",")[0].strip() if xff else request.remote_addr) or "127.0.0.1"
+
+def _relay_headers(apilogin_url: str, ua: str, client_ip: str) -> dict:
+    """中继 apilogin 时透传的请求头（真实 IP / UA），同步与 ASGI 模式共用。"""
+    return {
+        "Host": urllib.parse.urlparse(apilogin_url).netloc,
+        "X-Real-IP": client_ip,
+        "X-Forwarded-For": client_ip,
+        "User-Agent": ua,
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    }
+
 def _relay_apilogin_cookies(apilogin_url: str, final_return: str = "/"):
     """
-    先访问禅道首页拿会话，再调用 apilogin，最后把 cookie 写回浏览器并 302。
-    同时透传用户真实 IP/UA，避免会话失效。
+    调用 apilogin 拿禅道会话 Cookie，写回浏览器并 302。同时透传用户真实 IP/UA，避免会话失效。
+    RELAY_MODE="fast"（默认）：复用到禅道的 keep-alive 连接池，不跟随跳转（不渲染首页）；
+      RELAY_WARMUP="auto" 时仅在 apilogin 未返回 Cookie 时才预热首页并重试。
+    RELAY_MODE="legacy"：原流程，新建连接预热首页，再跟随跳转调用 apilogin。
     """
     try:
-        from urllib.parse import urlparse
-        xff = request.headers.get("X-Forwarded-For", "")
-        client_ip = (xff.split(",")[0].strip() if xff else request.remote_addr) or "127.0.0.1"
-        ua = request.headers.get("User-Agent", "Mozilla/5.0")
-        host = urlparse(apilogin_url).netloc
-
-        headers = {
-            "Host": host,
-            "X-Real-IP": client_ip,
-            "X-Forwarded-For": client_ip,
-            "User-Agent": ua,
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-            "Connection": "close",
-        }
-
-        s = requests.Session()
-        # 1) 预热首页
-        s.get(f"{_cfg.ZENTAO_BASE}/", timeout=8, allow_redirects=True, headers=headers)
-        # 2) apilogin（允许跟随，拿最终 cookie）
-        r = s.get(apilogin_url, timeout=8, allow_redirects=True, headers=headers)
+        headers = _relay_headers(apilogin_url, request.headers.get("User-Agent", "Mozilla/5.0"), _client_ip())
+        home = f"{_cfg.ZENTAO_BASE}/"
+
+        if RELAY_MODE == "legacy":
+            import requests
+            headers["Connection"] = "close"
+            s = _zentao_http.guard(requests.Session())
+            # 1) 预热首页
+            s.get(home, timeout=8, allow_redirects=True, headers=headers)
+            # 2) apilogin（允许跟随，拿最终 cookie）
+            r = s.get(apilogin_url, timeout=8, allow_redirects=True, headers=headers)
+        else:
+            s = _zentao_http.isolated_session()
+            follow = RELAY_FOLLOW_REDIRECTS
+            if RELAY_WARMUP == "always":
+                s.get(home, timeout=8, allow_redirects=False, headers=headers)
+            r = s.get(apilogin_url, timeout=8, allow_redirects=follow, headers=headers)
+            if not s.cookies and RELAY_WARMUP == "auto":
+                logging.info("relay: no cookie from apilogin, warm up and retry")
+                s.get(home, timeout=8, allow_redirects=False, headers=headers)
+                r = s.get(apilogin_url, timeout=8, allow_redirects=follow, headers=headers)
 
         # 日志 cookie
         try:
@@ -204,6 +414,27 @@ def _relay_apilogin_cookies(apilogin_url: str, final_return: str = "/"):
         logging.exception("relay apilogin failed")
         return redirect(final_return or "/", code=302)
 
+# 扫码授权成功页（钉钉内尝试自动关闭）
+SUCCESS_HTML = """<!doctype html><meta charset="utf-8">
+<meta name="viewport" content="width=device-width,initial-scale=1">
+<title>授权成功</title>
+<div style="font:16px/1.6 system-ui;padding:28px">
+  <h2>授权成功</h2>
+  <p>您可以关闭此页面，回到电脑端继续。</p>
+  <p style="color:#64748b">若未自动关闭，请手动返回钉钉。</p>
+  <button id="closeBtn" style="padding:10px 14px;margin-top:12px;border-radius:10px;border:1px solid #e5e7eb">关闭</button>
+</div>
+<script>
+(function(){
+  function tryClose(){ try{ if(window.dd){ dd.biz.navigation.close({}); } else { window.close(); } }catch(e){} }
+  var s=document.createElement('script'); s.src='https://g.alicdn.com/dingding/open-develop/1.9.0/dingtalk.js';
+  s.onload=function(){ tryClose(); setTimeout(tryClose, 800); };
+  document.head.appendChild(s);
+  setTimeout(tryClose, 2000);
+  document.getElementById('closeBtn').onclick=tryClose;
+})();
+</script>"""
+
 # ---------- 路由 ----------
 @app.get("/")
 def home():
@@ -211,7 +442,7 @@ def home():
         "DingTalk ⇄ ZenTao SSO 运行中。<br>"
         "PC 一键授权：/dingtalk/login<br>"
         "（可选）二维码：/dingtalk/qrcode<br>"
-        "（可选）票据：/dingtalk/newticket, /dingtalk/status?ticket=xxx",
+        "（可选）票据：/dingtalk/newticket, /dingtalk/status?ticket=xxx[&wait=25], /dingtalk/status/stream?ticket=xxx",
         mimetype="text/html"
     )
 
@@ -222,12 +453,14 @@ def dingtalk_login():
 
 @app.get("/dingtalk/qrcode")
 def dingtalk_qrcode():
+    """?fmt=svg 返回 SVG（无需 PIL），默认 QR_FORMAT；同一票据重复请求命中渲染缓存。"""
     ret = _norm_return()
+    fmt = request.args.get("fmt") or QR_FORMAT
+    if fmt not in qr_render.MIMETYPES:
+        return "不支持的格式 fmt", 400
     t = request.args.get("ticket") or ticket_new(ret)
     auth_url = build_auth_url(ret, state=t, src="qr")
-    img = qrcode.make(auth_url)
-    buf = BytesIO(); img.save(buf, format="PNG"); buf.seek(0)
-    resp = send_file(buf, mimetype="image/png")
+    resp = Response(qr_render.render(auth_url, fmt), mimetype=qr_render.MIMETYPES[fmt])
     resp.headers["X-DT-Ticket"] = t
     resp.headers["Cache-Control"] = "no-store"
     return resp
@@ -240,36 +473,93 @@ def dingtalk_newticket():
 
 @app.get("/dingtalk/status")
 def dingtalk_status():
+    """?wait=N 时长轮询：挂起至票据授权或 N 秒（上限 LONGPOLL_TIMEOUT）后返回。"""
     t = request.args.get("ticket", "")
-    info = ticket_get(t) or {}
+    try:
+        wait = min(max(float(request.args.get("wait") or 0), 0), LONGPOLL_TIMEOUT)
+    except ValueError:
+        wait = 0
+    busy = False
+    if wait and _waiters.acquire(blocking=False):
+        try:
+            info = ticket_store.wait(t, wait) or {}
+        finally:
+            _waiters.release()
+    else:
+        busy = bool(wait)
+        info = ticket_get(t) or {}
     if info.get("ok"):
         return jsonify({"ok": True, "redirect": info.get("redirect", "/")})
+    if busy:                                # 未能挂起：立即返回，前端按 retry 秒（默认 2，即原轮询间隔）再查
+        return jsonify({"ok": False, "retry": LONGPOLL_BUSY_RETRY}), 200, {"Retry-After": str(LONGPOLL_BUSY_RETRY)}
     return jsonify({"ok": False})
 
+@app.get("/dingtalk/status/stream")
+def dingtalk_status_stream():
+    """SSE：授权后推送 event: ok；票据失效推送 event: gone；每 15 秒发心跳。"""
+    t = request.args.get("ticket", "")
+    if not _waiters.acquire(blocking=False):
+        return Response("retry: 2000\n\n", status=503, mimetype="text/event-stream",
+                        headers={"Retry-After": "2", "Cache-Control": "no-store"})
+    def gen():
+        deadline = time.monotonic() + SSE_TIMEOUT
+        yield "retry: 2000\n\n"
+        while time.monotonic() < deadline:
+            info = ticket_store.wait(t, min(15, deadline - time.monotonic()))
+            if info is None:
+                yield "event: gone\ndata: {}\n\n"; return
+            if info.get("ok"):
+                yield "event: ok\ndata: " + json.dumps({"ok": True, "redirect": info.get("redirect", "/")}) + "\n\n"
+                return
+            yield ": ping\n\n"
+    resp = Response(gen(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
+    resp.call_on_close(_waiters.release)    # 响应关闭时归还名额；生成器未被迭代（客户端提前断开）也会归还
+    return resp
+
+def _callback_failure(e: Exception):
+    """回调失败 -> (状态码, 提示, 额外响应头)：无权限 403；熔断 / 预算耗尽 503 + Retry-After；其余 500。"""
+    if isinstance(e, PermissionError):
+        metrics.inc("callback_total", outcome="denied")
+        return 403, str(e), {}
+    if isinstance(e, (breaker.CircuitOpen, deadline.DeadlineExceeded)) or deadline.expired():
+        logging.warning("callback shed: %s", e)
+        metrics.inc("callback_total", outcome="unavailable")
+        return 503, "登录服务繁忙，请稍后重试", {"Retry-After": str(int(getattr(e, "retry_after", 5)))}
+    logging.error("callback error", exc_info=e)
+    metrics.inc("callback_total", outcome="error")
+    return 500, str(e), {}
+
 @app.get("/dingtalk/callback")
 def dingtalk_callback():
     code  = request.args.get("code")
     state = request.args.get("state", "")  # J|... or Q|ticket
     if not code:
+        metrics.inc("callback_total", outcome="missing_code")
         return render_template("error.html", message="缺少 code"), 400
 
     src_flag, _, tail = state.partition('|')
     is_jump = (src_flag == 'J'); ticket = tail or ""
 
     try:
-        account = _ensure_account_from_dingtalk(code)
-    except PermissionError as e:
-        return render_template("error.html", message=str(e)), 403
+        if SINGLE_FLIGHT_ENABLED:
+            # 浏览器 / webview 重放同一回调时复用首个请求的结果，不重复换 token
+            account = single_flight.do("code", code, lambda: _ensure_account_from_dingtalk(code),
+                                       reuse_errors=_final_error)
+        else:
+            account = _ensure_account_from_dingtalk(code)
     except Exception as e:
-        logging.exception("callback error")
-        return render_template("error.html", message=str(e)), 500
+        status, message, headers = _callback_failure(e)
+        return render_template("error.html", message=message), status, headers
 
     apilogin = _apilogin_url(account)
 
     if is_jump:
-        logging.info(f"pc-jump login -> {account} | apilogin={apilogin}")
+        logging.info("pc-jump login -> %s", account)
         final_return = request.args.get("return") or "/"
-        return _relay_apilogin_cookies(apilogin, final_return=final_return)
+        metrics.inc("callback_total", outcome="jump")
+        with metrics.stage("relay"):
+            return _relay_apilogin_cookies(apilogin, final_return=final_return)
 
     # 扫码：仅标票据 + 成功页面（尝试自动关闭）
     if ticket:
@@ -277,54 +567,103 @@ def dingtalk_callback():
             ticket_ok(ticket, account, apilogin)
         except Exception:
             pass
+    metrics.inc("callback_total", outcome="qrcode")
 
-    SUCCESS_HTML = """<!doctype html><meta charset="utf-8">
-<meta name="viewport" content="width=device-width,initial-scale=1">
-<title>授权成功</title>
-<div style="font:16px/1.6 system-ui;padding:28px">
-  <h2>授权成功</h2>
-  <p>您可以关闭此页面，回到电脑端继续。</p>
-  <p style="color:#64748b">若未自动关闭，请手动返回钉钉。</p>
-  <button id="closeBtn" style="padding:10px 14px;margin-top:12px;border-radius:10px;border:1px solid #e5e7eb">关闭</button>
-</div>
-<script>
-(function(){
-  function tryClose(){ try{ if(window.dd){ dd.biz.navigation.close({}); } else { window.close(); } }catch(e){} }
-  var s=document.createElement('script'); s.src='https://g.alicdn.com/dingding/open-develop/1.9.0/dingtalk.js';
-  s.onload=function(){ tryClose(); setTimeout(tryClose, 800); };
-  document.head.appendChild(s);
-  setTimeout(tryClose, 2000);
-  document.getElementById('closeBtn').onclick=tryClose;
-})();
-</script>"""
     return Response(SUCCESS_HTML, status=200, headers={"Cache-Control": "no-store"})
 
 @app.get("/health")
-def health():
-    return "ok", 200
+def health_check():
+    if request.args.get("deep") not in ("1", "true"):
+        return "ok", 200
+    snap = health.snapshot()
+    return jsonify(snap), (200 if snap["ready"] else 503), {"Cache-Control": "no-store"}
+
+@app.get("/metrics")
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        return "metrics disabled", 404
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/error")
 def error():
     return render_template("error.html")
 
-# 全量同步
+# 全量同步（后台任务）
+# 触发需钉钉授权码 ?code=，或管理密钥（请求头 X-Sync-Secret，环境变量 SYNC_ADMIN_SECRET 优先）；
+# 进度查询需管理密钥，或启动时返回的 status_url 中的签名 sig（按任务 ID 的 HMAC）
+SYNC_ADMIN_SECRET = os.getenv("SYNC_ADMIN_SECRET") or getattr(_cfg, "SYNC_ADMIN_SECRET", "") or ""
+
+def _sync_admin() -> bool:
+    given = request.headers.get("X-Sync-Secret") or ""
+    return bool(SYNC_ADMIN_SECRET and given) and hmac.compare_digest(given, SYNC_ADMIN_SECRET)
+
+def _sync_sig(job_id: str) -> str:
+    key = (SYNC_ADMIN_SECRET or getattr(_cfg, "DT_APP_SECRET", "") or "").encode()
+    return hmac.new(key, job_id.encode(), hashlib.sha256).hexdigest()[:32]
+
 @app.get("/dingtalk/sync")
 def full_sync():
-    from services import dingtalk_api, org_sync
+    """需 ?code= 或 X-Sync-Secret（此时用应用 access_token）；&dry_run=1 只出差异；&resume=<job> 从检查点续跑。返回 202 + 任务 ID。"""
+    from services import dingtalk_api, sync_jobs
     code = request.args.get("code")
-    if not code: return "缺少授权码 code（?code=）", 400
-    access_token = dingtalk_api.get_user_access_token(code)
+    if not code and not _sync_admin():
+        return "缺少授权码 code（?code=）或管理密钥（X-Sync-Secret）", 401
+    access_token = dingtalk_api.get_user_access_token(code) if code else dingtalk_api.get_app_access_token()
     if not access_token: return "获取 accessToken 失败", 500
-    n = org_sync.full_sync(access_token)
-    return f"全量同步完成，共处理 {n} 个用户"
+    try:
+        if request.args.get("resume"):
+            job_id = sync_jobs.resume(request.args["resume"], access_token)["id"]
+        else:
+            job_id = sync_jobs.start(access_token, dry_run=request.args.get("dry_run") in ("1", "true"))
+    except sync_jobs.JobConflict as e:
+        return jsonify({"error": "已有同步任务在运行", "job": str(e)}), 409
+    except KeyError:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify({"job": job_id, "status_url": f"/dingtalk/sync/status?job={job_id}&sig={_sync_sig(job_id)}"}), 202
+
+@app.get("/dingtalk/sync/status")
+def full_sync_status():
+    from services import sync_jobs
+    job = request.args.get("job", "")
+    if not _sync_admin() and not hmac.compare_digest(request.args.get("sig", ""), _sync_sig(job)):
+        return jsonify({"error": "无权查看该任务"}), 403
+    info = sync_jobs.status(job)
+    if not info: return jsonify({"error": "任务不存在"}), 404
+    return jsonify(info)
+
+# 事件：钉钉推送的加密回调按 EVENT_TOKEN / EVENT_AES_KEY 验签解密（见 services.dt_callback），回复加密的 success；
+# 内部转发的明文事件须带请求头 X-Event-Secret（环境变量 EVENT_SECRET 优先）；其余一律 403
+EVENT_SECRET = os.getenv("EVENT_SECRET") or getattr(_cfg, "EVENT_SECRET", "") or ""
+
+def _event_secret_ok() -> bool:
+    given = request.headers.get("X-Event-Secret") or ""
+    return bool(EVENT_SECRET and given) and hmac.compare_digest(given, EVENT_SECRET)
 
-# 事件
 @app.post("/dingtalk/event")
 def dingtalk_event():
+    body = request.get_json(force=True, silent=True) or {}
+    if isinstance(body, dict) and body.get("encrypt"):
+        try:
+            data = json.loads(dt_callback.decrypt(request.args.get("msg_signature", ""), request.args.get("timestamp", ""),
+                                                  request.args.get("nonce", ""), str(body["encrypt"])))
+        except ValueError as e:             # InvalidCallback，或解密后不是 JSON
+            logging.warning("event rejected: %s", e, extra={"sample": "event"})
+            return {"code": 1, "msg": "forbidden"}, 403
+        ack = dt_callback.reply("success")
+    elif _event_secret_ok():
+        data, ack = body, {"code": 0, "msg": "ok"}
+    else:
+        logging.warning("event rejected: unsigned payload", extra={"sample": "event"})
+        return {"code": 1, "msg": "forbidden"}, 403
+    data = data if isinstance(data, dict) else {}
     try:
-        data = request.get_json(force=True, silent=True) or {}
-        logging.info(f"event received: {data}")
-        return {"code": 0, "msg": "ok"}
+        items = event_sync.parse(data)
+        n = event_sync.enqueue(items)
+        logging.info("event received: type=%s queued=%d",
+                     data.get("EventType") or (data.get("headers") or {}).get("eventType"), n,
+                     extra={"sample": "event"})
+        logging.debug("event payload: %s", data, extra={"sample": "event"})
+        return ack
     except Exception as e:
         logging.exception("event error")
         return {"code": 1, "msg": str(e)}, 500
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 网关（协程模式）
+  uvicorn asgi:app --host 127.0.0.1 --port 9000 --workers 2
+  gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+- 协程处理登录热路径：/dingtalk/login、/dingtalk/callback（换 token、取用户、查账号、中继 apilogin）、
+  /dingtalk/status（长轮询）、/dingtalk/status/stream（SSE）；等待上游 / 票据时不占线程，单进程可同时挂起数百个登录
+- 其余路由（二维码、票据、同步、事件、/metrics、/health ...）交给原 Flask 应用：装有 a2wsgi 时经其适配，
+  否则在线程池中执行并整体返回响应体
+- 外呼：装有 httpx / aiomysql 时走异步连接池（见 services.aio_http / aio_db）；未安装时同一协程改在线程池中
+  调用同步实现，功能一致，并发受线程池（ASYNC_THREADS）限制
+- 首次登录（姓名匹配、建号、绑定）较少，仍在线程池中执行 app._resolve_account；中继固定为 RELAY_MODE="fast"
+- 请求 ID、结构化日志、指标、限流、请求预算、熔断、回调去重与同步模式一致（去重锁表两种模式共用）
+- 票据 / 限流 / 去重 / 绑定 / 配权标记都在 SQLite 或文件锁上，可能因写锁等待阻塞：一律经 asyncio.to_thread 调用，
+  不在事件循环线程上执行，避免一次锁等待卡住所有挂起的长轮询
+"""
+import sys, json, time, uuid, asyncio, logging, urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from flask import render_template
+from werkzeug.http import dump_cookie
+from werkzeug.urls import iri_to_uri
+
+import config as _cfg
+import app as _sync
+from app import app as flask_app
+from services import ticket_store, metrics, log_pipeline, rate_limit, single_flight, deadline
+from services import zentao_api, dingtalk_api, aio_http
+from services.bind_store import get as bind_get
+
+ASYNC_THREADS = int(getattr(_cfg, "ASYNC_THREADS", 32) or 32)          # 同步回退 / Flask 路由的线程池
+MAX_WAITERS   = int(getattr(_cfg, "ASYNC_MAX_WAITERS", 1000) or 1000)  # 同时挂起的长轮询 / SSE 上限
+
+Body = Union[bytes, AsyncIterator[str]]
+Result = Tuple[int, List[Tuple[str, str]], Body]
+
+_waiting = [0]
+
+class Request:
+    __slots__ = ("method", "path", "args", "headers", "client_ip")
+
+    def __init__(self, scope: Dict[str, Any]):
+        self.method, self.path = scope["method"], scope["path"]
+        qs = scope.get("query_string", b"").decode("latin-1")
+        self.args = {k: v[0] for k, v in urllib.parse.parse_qs(qs, keep_blank_values=True).items()}
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        xff = self.headers.get("x-forwarded-for", "")
+        client = scope.get("client") or ("127.0.0.1", 0)
+        self.client_ip = (xff.split(",")[0].strip() if xff else client[0]) or "127.0.0.1"
+
+def _json(status: int, data: Any, headers: Optional[List[Tuple[str, str]]] = None) -> Result:
+    return status, [("Content-Type", "application/json")] + (headers or []), json.dumps(data, ensure_ascii=False).encode()
+
+def _page(req: Request, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> Result:
+    with flask_app.test_request_context(req.path):          # 模板中的 url_for 需要请求上下文
+        html = render_template("error.html", message=message)
+    return status, [("Content-Type", "text/html; charset=utf-8")] + list((headers or {}).items()), html.encode()
+
+# ---------- 路由 ----------
+async def login(req: Request) -> Result:
+    ret = req.args.get("return") or req.headers.get("referer") or "/"
+    return 302, [("Location", _sync.build_auth_url(ret, state="", src="jump"))], b""
+
+async def status(req: Request) -> Result:
+    """?wait=N 时长轮询（上限 LONGPOLL_TIMEOUT）；挂起数超过 ASYNC_MAX_WAITERS 时立即返回并带 retry。"""
+    t = req.args.get("ticket", "")
+    try:
+        wait = min(max(float(req.args.get("wait") or 0), 0), _sync.LONGPOLL_TIMEOUT)
+    except ValueError:
+        wait = 0
+    busy = False
+    if wait and _waiting[0] < MAX_WAITERS:
+        _waiting[0] += 1
+        try:
+            info = await ticket_store.await_ok(t, wait) or {}
+        finally:
+            _waiting[0] -= 1
+    else:
+        busy = bool(wait)
+        info = await asyncio.to_thread(ticket_store.get, t) or {}
+    if info.get("ok"):
+        return _json(200, {"ok": True, "redirect": info.get("redirect", "/")})
+    if busy:
+        return _json(200, {"ok": False, "retry": _sync.LONGPOLL_BUSY_RETRY},
+                     [("Retry-After", str(_sync.LONGPOLL_BUSY_RETRY))])
+    return _json(200, {"ok": False})
+
+async def status_stream(req: Request) -> Result:
+    t = req.args.get("ticket", "")
+    if _waiting[0] >= MAX_WAITERS:
+        return 503, [("Content-Type", "text/event-stream"), ("Retry-After", "2"), ("Cache-Control", "no-store")], \
+               b"retry: 2000\n\n"
+    async def gen():
+        _waiting[0] += 1
+        try:
+            until = time.monotonic() + _sync.SSE_TIMEOUT
+            yield "retry: 2000\n\n"
+            while time.monotonic() < until:
+                info = await ticket_store.await_ok(t, min(15, until - time.monotonic()))
+                if info is None:
+                    yield "event: gone\ndata: {}\n\n"; return
+                if info.get("ok"):
+                    yield "event: ok\ndata: " + json.dumps({"ok": True, "redirect": info.get("redirect", "/")}) + "\n\n"
+                    return
+                yield ": ping\n\n"
+        finally:
+            _waiting[0] -= 1
+    return 200, [("Content-Type", "text/event-stream"), ("Cache-Control", "no-store"), ("X-Accel-Buffering", "no")], gen()
+
+async def callback(req: Request) -> Result:
+    code  = req.args.get("code")
+    state = req.args.get("state", "")  # J|... or Q|ticket
+    if not code:
+        metrics.inc("callback_total", outcome="missing_code")
+        return _page(req, 400, "缺少 code")
+    src_flag, _, ticket = state.partition("|")
+
+    try:
+        if _sync.SINGLE_FLIGHT_ENABLED:
+            account = await single_flight.ado("code", code, lambda: _ensure_account(code),
+                                              reuse_errors=_sync._final_error)
+        else:
+            account = await _ensure_account(code)
+    except Exception as e:
+        status_code, message, headers = _sync._callback_failure(e)
+        return _page(req, status_code, message, headers)
+
+    apilogin = _sync._apilogin_url(account)
+    if src_flag == "J":
+        logging.info("pc-jump login -> %s", account)
+        metrics.inc("callback_total", outcome="jump")
+        with metrics.stage("relay"):
+            return await _relay(req, apilogin, req.args.get("return") or "/")
+
+    if ticket:
+        try:
+            await asyncio.to_thread(ticket_store.ok, ticket, account, apilogin)
+        except Exception:
+            pass
+    metrics.inc("callback_total", outcome="qrcode")
+    return 200, [("Content-Type", "text/html; charset=utf-8"), ("Cache-Control", "no-store")], \
+           _sync.SUCCESS_HTML.encode()
+
+ROUTES: Dict[Tuple[str, str], Callable[[Request], Awaitable[Result]]] = {
+    ("GET", "/dingtalk/login"): login,
+    ("GET", "/dingtalk/callback"): callback,
+    ("GET", "/dingtalk/status"): status,
+    ("GET", "/dingtalk/status/stream"): status_stream,
+}
+_LIMITED = {"/dingtalk/status": "status", "/dingtalk/status/stream": "status"}
+
+# ---------- 回调链 ----------
+async def _ensure_account(code: str) -> str:
+    with metrics.stage("dingtalk_user_token"):
+        access_token = await dingtalk_api.aget_user_access_token(code)
+    if not access_token:
+        raise RuntimeError("获取 accessToken 失败")
+    with metrics.stage("dingtalk_user_me"):
+        user = await dingtalk_api.aget_user_me(access_token)
+    ding_uid = user.get("userId") or user.get("openId")
+    if not ding_uid:
+        raise RuntimeError(f"获取钉钉用户信息失败：{user}")
+    if not _sync.SINGLE_FLIGHT_ENABLED:
+        return await _resolve_account(ding_uid, user)
+    return await single_flight.ado("uid", ding_uid, lambda: _resolve_account(ding_uid, user))
+
+async def _resolve_account(ding_uid: str, user: dict) -> str:
+    """已映射 / 已绑定且账号存在的老用户全程协程；其余情况在线程池中走同步逻辑。"""
+    with metrics.stage("account_resolve"):
+        account = _sync.ACCOUNT_MAP.get(ding_uid) or await asyncio.to_thread(bind_get, ding_uid)
+    if account:
+        with metrics.stage("zentao_user_exists"):
+            exists = await zentao_api.auser_exists(account)
+        if exists:
+            logging.info("[sso] will login account=%s ding_uid=%s", account, ding_uid)
+            await asyncio.to_thread(_sync._provision_existing, account)
+            return account
+    return await asyncio.to_thread(_sync._resolve_account, ding_uid, user)
+
+async def _relay(req: Request, apilogin_url: str, final_return: str) -> Result:
+    """调用 apilogin 拿禅道会话 Cookie，写回浏览器并 302（同 RELAY_MODE="fast"，RELAY_WARMUP 同样生效）。"""
+    headers = [("Location", iri_to_uri(final_return or "/"))]
+    try:
+        h = _sync._relay_headers(apilogin_url, req.headers.get("user-agent", "Mozilla/5.0"), req.client_ip)
+        home = f"{_cfg.ZENTAO_BASE}/"
+        follow = _sync.RELAY_FOLLOW_REDIRECTS
+        jar: Dict[str, str] = {}
+        if _sync.RELAY_WARMUP == "always":
+            jar.update((await aio_http.request("zentao", "GET", home, headers=h, timeout=8)).cookies)
+        r = await aio_http.request("zentao", "GET", apilogin_url, headers=h, cookies=jar,
+                                   follow_redirects=follow, timeout=8)
+        if not r.cookies and _sync.RELAY_WARMUP == "auto":
+            logging.info("relay: no cookie from apilogin, warm up and retry")
+            jar.update((await aio_http.request("zentao", "GET", home, headers=h, timeout=8)).cookies)
+            r = await aio_http.request("zentao", "GET", apilogin_url, headers=h, cookies=jar,
+                                       follow_redirects=follow, timeout=8)
+        jar.update(r.cookies)
+        logging.info("relay cookies got: %s", ",".join(jar))
+        headers += [("Set-Cookie", dump_cookie(k, v, path="/", httponly=True, samesite="Lax")) for k, v in jar.items()]
+        headers += [("Set-Cookie", sc) for sc in r.set_cookies]      # 兜底透传
+    except Exception:
+        logging.exception("relay apilogin failed")
+    return 302, headers, b""
+
+# ---------- 请求处理（对应 app 中的 before_request / after_request） ----------
+async def _admission(req: Request) -> Optional[Result]:
+    bucket = _LIMITED.get(req.path)
+    if not (_sync.RATE_LIMIT_ENABLED and bucket): return None
+    ok, retry_after = await asyncio.to_thread(rate_limit.allow, bucket, req.client_ip)
+    if ok: return None
+    metrics.inc("rate_limited_total", bucket=bucket, reason="ip")
+    return _json(429, {"error": "请求过于频繁，请稍后再试", "retry_after": retry_after},
+                 [("Retry-After", str(retry_after)), ("Cache-Control", "no-store")])
+
+def _log(req: Request, status_code: int, seconds: float, stages: Dict[str, float]):
+    ms = round(seconds * 1000, 1)
+    extra: Dict[str, Any] = {"route": req.path, "status": status_code, "ms": ms, "ip": req.client_ip}
+    if stages: extra["stages"] = stages
+    if req.path in _sync._SAMPLED_ROUTES: extra["sample"] = _sync._SAMPLED_ROUTES[req.path]
+    if status_code == 429: extra["sample"] = "limited"
+    logging.info("%s %s %d %.1fms", req.method, req.path, status_code, ms, extra=extra)
+    if _sync.METRICS_ENABLED:
+        metrics.observe("request_seconds", seconds, route=req.path)
+        metrics.inc("requests_total", route=req.path, status=str(status_code))
+
+async def _serve(scope, receive, send, handler: Callable[[Request], Awaitable[Result]]):
+    req = Request(scope)
+    log_pipeline.set_request_id((req.headers.get("x-request-id") or uuid.uuid4().hex[:16])[:64])
+    stages = metrics.track_stages()
+    deadline.start(_sync.REQUEST_DEADLINE)
+    t0 = time.perf_counter()
+    try:
+        try:
+            status_code, headers, body = await _admission(req) or await handler(req)
+        except Exception:
+            logging.exception("unhandled error on %s", req.path)
+            status_code, headers, body = 500, [("Content-Type", "text/plain; charset=utf-8")], b"internal error"
+        _log(req, status_code, time.perf_counter() - t0, stages)
+        headers.append(("X-Request-Id", log_pipeline.request_id()))
+        await send({"type": "http.response.start", "status": status_code,
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+        if isinstance(body, bytes):
+            await send({"type": "http.response.body", "body": body})
+        else:
+            await _stream(receive, send, body)
+    finally:
+        log_pipeline.clear_request_id()
+        deadline.clear()
+
+async def _stream(receive, send, body: AsyncIterator[str]):
+    """逐块发送 SSE；客户端断开时取消生成器（释放挂起名额）。"""
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+    watcher = asyncio.ensure_future(disconnected())
+    it = body.__aiter__()
+    try:
+        while True:
+            nxt = asyncio.ensure_future(it.__anext__())
+            await asyncio.wait({nxt, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not nxt.done():
+                nxt.cancel()
+                await asyncio.gather(nxt, return_exceptions=True)
+                return
+            try:
+                chunk = nxt.result()
+            except StopAsyncIteration:
+                break
+            await send({"type": "http.response.body", "body": chunk.encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        watcher.cancel()
+        await it.aclose()
+
+# ---------- 其余路由：交给 Flask ----------
+class _ThreadedWSGI:
+    """最小 WSGI 适配：在线程池中执行 Flask 并整体返回响应体（流式路由已由协程处理）。"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def _environ(self, scope, body: bytes) -> Dict[str, Any]:
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("127.0.0.1", 0)
+        env = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+            "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0], "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "wsgi.version": (1, 0), "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": BytesIO(body), "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True, "wsgi.multiprocess": True, "wsgi.run_once": False,
+        }
+        for k, v in scope.get("headers", []):
+            name, value = k.decode("latin-1").upper().replace("-", "_"), v.decode("latin-1")
+            if name in ("CONTENT_TYPE", "CONTENT_LENGTH"): env[name] = value; continue
+            key = "HTTP_" + name
+            env[key] = f"{env[key]},{value}" if key in env else value
+        return env
+
+    def _run(self, environ):
+        out: Dict[str, Any] = {}
+        def start_response(status, headers, exc_info=None):
+            out["status"], out["headers"] = int(status.split(" ", 1)[0]), headers
+            return lambda data: None
+        it = self.wsgi_app(environ, start_response)
+        try:
+            data = b"".join(it)
+        finally:
+            if hasattr(it, "close"): it.close()
+        return out["status"], out["headers"], data
+
+    async def __call__(self, scope, receive, send):
+        body, more = b"", True
+        while more:
+            msg = await receive()
+            body += msg.get("body", b""); more = msg.get("more_body", False)
+        status_code, headers, data = await asyncio.to_thread(self._run, self._environ(scope, body))
+        await send({"type": "http.response.start", "status": status_code,
+                    "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+        await send({"type": "http.response.body", "body": data})
+
+def _wsgi_adapter(wsgi_app):
+    try:
+        from a2wsgi import WSGIMiddleware
+        return WSGIMiddleware(wsgi_app, workers=ASYNC_THREADS)
+    except ImportError:
+        return _ThreadedWSGI(wsgi_app)
+
+_flask = _wsgi_adapter(flask_app)
+
+# ---------- ASGI 入口 ----------
+async def _lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            asyncio.get_running_loop().set_default_executor(
+                ThreadPoolExecutor(max_workers=ASYNC_THREADS, thread_name_prefix="asgi-sync"))
+            _sync.init_worker()
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        return await _flask(scope, receive, send)
+    await _serve(scope, receive, send, handler)
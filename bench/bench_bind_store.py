@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+绑定存储基准：旧实现（每次整文件读写）与 services.bind_store 的 get/put 对比
+用法：python bench/bench_bind_store.py [--size 20000] [--ops 2000] [--procs 4]
+"""
+import os, sys, json, time, random, argparse, tempfile, threading, statistics, multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import bind_store
+
+class LegacyStore:
+    """原 bind_store 实现的等价物。"""
+    def __init__(self, path): self.path, self.lock = path, threading.Lock()
+    def get_all(self):
+        if not os.path.exists(self.path): return {}
+        with self.lock, open(self.path, "r", encoding="utf-8") as f:
+            try: return json.load(f) or {}
+            except Exception: return {}
+    def save_all(self, data):
+        with self.lock, open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    def get(self, k): return self.get_all().get(k, "")
+    def put(self, k, v):
+        data = self.get_all(); data[k] = v; self.save_all(data)
+
+def _time(fn, ops):
+    lat = []
+    for i in range(ops):
+        t0 = time.perf_counter(); fn(i); lat.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(lat), statistics.mean(lat)
+
+def _worker(path, n, tag):
+    bind_store._PATH = path
+    for i in range(n): bind_store.put(f"{tag}-{i}", f"acct-{tag}-{i}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size", type=int, default=20000)
+    ap.add_argument("--ops", type=int, default=2000)
+    ap.add_argument("--procs", type=int, default=4)
+    a = ap.parse_args()
+    tmp = tempfile.mkdtemp(prefix="dt_bind_")
+    seed = {f"uid{i}": f"acct{i}" for i in range(a.size)}
+    keys = list(seed)
+
+    legacy = LegacyStore(os.path.join(tmp, "legacy.json")); legacy.save_all(seed)
+    bind_store._PATH = os.path.join(tmp, "bindings.json"); bind_store.save_all(seed)
+
+    lops = max(20, a.ops // 50)
+    print(f"bindings={a.size}")
+    print(f"{'op':<12}{'impl':<10}{'median(us)':>12}{'mean(us)':>12}")
+    for name, fn, ops in (
+        ("get", lambda i: legacy.get(random.choice(keys)), lops),
+        ("put", lambda i: legacy.put(f"new{i}", "x"), lops)):
+        m, mean = _time(fn, ops); print(f"{name:<12}{'legacy':<10}{m:>12.1f}{mean:>12.1f}")
+    for name, fn in (
+        ("get", lambda i: bind_store.get(random.choice(keys))),
+        ("put", lambda i: bind_store.put(f"new{i}", "x"))):
+        m, mean = _time(fn, a.ops); print(f"{name:<12}{'indexed':<10}{m:>12.1f}{mean:>12.1f}")
+
+    # 多进程并发写入：确认不丢绑定
+    path = os.path.join(tmp, "mp.json"); per = 500
+    ps = [multiprocessing.Process(target=_worker, args=(path, per, f"p{j}")) for j in range(a.procs)]
+    t0 = time.perf_counter()
+    for p in ps: p.start()
+    for p in ps: p.join()
+    bind_store._PATH = path; bind_store._snap_sig = bind_store._log_off = None; bind_store._reload()
+    got = len(bind_store.get_all())
+    print(f"multiprocess put: {a.procs}x{per} in {time.perf_counter() - t0:.2f}s, stored={got}, lost={a.procs * per - got}")
+
+if __name__ == "__main__":
+    main()
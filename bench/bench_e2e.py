@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+端到端压测：本地替身（钉钉 / 禅道 / SQLite 代替 MySQL）+ 按 gunicorn.conf.py 启动的网关
+- oneclick：/dingtalk/callback?state=J|... → 换 token → users/me → 确保账号 → 中继 apilogin Cookie（302）
+- qr：newticket → 状态轮询（--poll long 长轮询 / short 短轮询）→ 扫码回调 Q|ticket → 轮询拿到 ok
+      qr.notify 为回调完成到 PC 端轮询得知授权成功的延迟
+- sync：/dingtalk/sync 后台全量同步 --org-users 个钉钉用户，轮询 /dingtalk/sync/status 至完成
+每个流程在 --concurrency 个线程下跑 --duration 秒，输出各步骤 p50/p95/p99 与每秒请求数。
+未安装 gunicorn 时退回 werkzeug 多线程服务器（单进程，结果仅供相对比较）；--server uvicorn 以 ASGI 模式（asgi.py）启动。
+用法：python bench/bench_e2e.py [--flows oneclick,qr,sync] [--concurrency 16] [--duration 10]
+      [--users 500] [--mode mysql|api] [--server auto|gunicorn|werkzeug|uvicorn] [--set KEY=JSON ...]
+"""
+import os, sys, json, time, uuid, socket, random, shutil, argparse, tempfile, threading, subprocess
+import importlib.util
+import requests
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import e2e_stubs
+
+ROOT  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.dirname(os.path.abspath(__file__))
+
+# ---- 网关进程 ----
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+def _gateway_config(a, tmp, dt_url, zt_url):
+    cfg = {
+        "DT_APP_KEY": "bench", "DT_APP_SECRET": "bench",
+        "ZENTAO_BASE": zt_url, "ZENTAO_CREATE_MODE": a.mode,
+        "ZENTAO_ADMIN_TOKEN": "", "ZENTAO_TOKEN_URL": f"{zt_url}/api.php/v1/tokens",
+        "TICKET_DB": f"{tmp}/tickets.db", "TOKEN_CACHE_DB": f"{tmp}/tokens.db",
+        "SYNC_JOB_DB": f"{tmp}/sync_jobs.db", "EVENT_QUEUE_DB": f"{tmp}/events.db",
+        "METRICS_DB": f"{tmp}/metrics.db", "BIND_FILE": f"{tmp}/bindings.json",
+        "PROVISION_DB": f"{tmp}/provisioned.db", "RATE_LIMIT_DB": f"{tmp}/ratelimit.db",
+        "SINGLE_FLIGHT_DB": f"{tmp}/single_flight.db",
+        "SYNC_ADMIN_SECRET": "bench",
+        "RATE_LIMIT_ENABLED": False,         # 压测流量都来自同一 IP；需要时 --set RATE_LIMIT_ENABLED=true
+        "LOG_FILE": f"{tmp}/gateway.log", "LOG_LEVEL": "WARNING",
+    }
+    for kv in a.set or []:
+        k, _, v = kv.partition("=")
+        try: cfg[k] = json.loads(v)
+        except ValueError: cfg[k] = v
+    return cfg
+
+def start_gateway(a, tmp, dt_url, zt_url):
+    port = _free_port()
+    env = dict(os.environ, BENCH_E2E=json.dumps({
+        "config": _gateway_config(a, tmp, dt_url, zt_url), "dingtalk": dt_url,
+        "sqlite": f"{tmp}/zentao.db"}))      # API 模式加组 / 入项目仍直连数据库
+    server = a.server
+    if server == "auto":
+        server = "gunicorn" if importlib.util.find_spec("gunicorn") else "werkzeug"
+    if server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"),
+               "--chdir", ROOT, "--pythonpath", BENCH, "--bind", f"127.0.0.1:{port}",
+               "--access-logfile", f"{tmp}/access.log", "--error-logfile", f"{tmp}/error.log"]
+        if a.workers: cmd += ["--workers", str(a.workers)]
+        if a.threads: cmd += ["--threads", str(a.threads)]
+        cmd.append("e2e_gateway:app")
+    elif server == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "--app-dir", BENCH, "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(a.workers or 1), "--no-access-log", "e2e_gateway:asgi_app"]
+    else:
+        cmd = [sys.executable, os.path.join(BENCH, "e2e_gateway.py"), str(port)]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=open(f"{tmp}/stderr.log", "w"))
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gateway exited, see {tmp}/stderr.log:\n" + open(f"{tmp}/stderr.log").read()[-2000:])
+        try:
+            if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                return proc, url, server
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise SystemExit("gateway did not become healthy in 30s")
+
+# ---- 统计 ----
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples, self.errors = {}, {}
+
+    def __call__(self, op: str, seconds: float, ok: bool = True):
+        with self._lock:
+            if ok: self.samples.setdefault(op, []).append(seconds)
+            else:  self.errors[op] = self.errors.get(op, 0) + 1
+
+def _pct(xs, p):
+    return xs[min(len(xs) - 1, max(int(len(xs) * p / 100.0 + 0.5) - 1, 0))]
+
+def report(rec: Recorder, elapsed: float):
+    print(f"{'step':<20}{'n':>8}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for op in sorted(set(rec.samples) | set(rec.errors)):
+        xs = sorted(rec.samples.get(op, [])); err = rec.errors.get(op, 0)
+        if not xs:
+            print(f"{op:<20}{0:>8}{err:>6}"); continue
+        ms = lambda v: f"{v * 1000:>9.1f}"
+        print(f"{op:<20}{len(xs):>8}{err:>6}{len(xs) / elapsed:>9.1f}"
+              f"{ms(_pct(xs, 50))}{ms(_pct(xs, 95))}{ms(_pct(xs, 99))}{ms(xs[-1])}")
+
+def _timed(rec, op, fn, check):
+    t0 = time.perf_counter()
+    try:
+        r = fn(); ok = check(r)
+    except requests.RequestException:
+        r, ok = None, False
+    rec(op, time.perf_counter() - t0, ok)
+    return r if ok else None
+
+def drive(flow, concurrency: int, duration: float):
+    rec = Recorder(); stop = time.perf_counter() + duration
+    def worker():
+        s, poll = requests.Session(), requests.Session()
+        while time.perf_counter() < stop:
+            flow(s, poll, rec)
+    ts = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in ts: t.start()
+    for t in ts: t.join()
+    return rec, time.perf_counter() - t0
+
+# ---- 流程 ----
+def flow_oneclick(gw, users):
+    def run(s, _poll, rec):
+        code = f"u{random.randrange(users)}.{uuid.uuid4().hex[:8]}"
+        _timed(rec, "oneclick", lambda: s.get(f"{gw}/dingtalk/callback", allow_redirects=False, timeout=30,
+                                              params={"code": code, "state": "J|", "return": "/"}),
+               lambda r: r.status_code == 302 and "zentaosid" in r.headers.get("Set-Cookie", ""))
+    return run
+
+def flow_qr(gw, users, poll_mode: str, scan_delay: float):
+    def run(s, poll, rec):
+        r = _timed(rec, "qr.newticket", lambda: s.get(f"{gw}/dingtalk/newticket", timeout=10),
+                   lambda r: r.status_code == 200)
+        if r is None: return
+        ticket = r.json()["ticket"]; seen = {}
+        def poller():
+            end = time.time() + 30
+            while time.time() < end:
+                try:
+                    if poll_mode == "long":
+                        ok = poll.get(f"{gw}/dingtalk/status", params={"ticket": ticket, "wait": 25},
+                                      timeout=35).json().get("ok")
+                    else:
+                        rr = _timed(rec, "qr.status", lambda: poll.get(f"{gw}/dingtalk/status",
+                                    params={"ticket": ticket}, timeout=10), lambda r: r.status_code == 200)
+                        ok = rr is not None and rr.json().get("ok")
+                except (requests.RequestException, ValueError):
+                    ok = False
+                if ok:
+                    seen["t"] = time.perf_counter(); return
+                if poll_mode != "long": time.sleep(1.0)      # 旧前端每秒轮询一次
+        th = threading.Thread(target=poller, daemon=True); th.start()
+        time.sleep(scan_delay)                                # 用户扫码耗时
+        code = f"u{random.randrange(users)}.{uuid.uuid4().hex[:8]}"
+        r = _timed(rec, "qr.callback", lambda: s.get(f"{gw}/dingtalk/callback", timeout=30,
+                                                     params={"code": code, "state": f"Q|{ticket}"}),
+                   lambda r: r.status_code == 200)
+        done = time.perf_counter()
+        th.join()
+        if r is not None:
+            rec("qr.notify", seen["t"] - done if "t" in seen else 0, "t" in seen)
+    return run
+
+def run_sync(gw):
+    rec = Recorder(); s = requests.Session()
+    r = _timed(rec, "sync.start", lambda: s.get(f"{gw}/dingtalk/sync", timeout=30, headers={"X-Sync-Secret": "bench"}), lambda r: r.status_code == 202)
+    if r is None: return rec, 0.0, {}
+    url = gw + r.json()["status_url"]; t0 = time.perf_counter(); info = {}
+    while time.perf_counter() - t0 < 600:
+        rr = _timed(rec, "sync.status", lambda: s.get(url, timeout=10), lambda r: r.status_code == 200)
+        info = rr.json() if rr is not None else info
+        if info.get("status") in ("done", "failed"): break
+        time.sleep(0.25)
+    elapsed = time.perf_counter() - t0
+    rec("sync.total", elapsed, info.get("status") == "done")
+    return rec, elapsed, info
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--flows", default="oneclick,qr,sync")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--users", type=int, default=500, help="不同钉钉用户数（首次出现即新建账号）")
+    ap.add_argument("--org-users", type=int, default=5000, help="sync 流程的通讯录规模")
+    ap.add_argument("--mode", choices=("mysql", "api"), default="mysql")
+    ap.add_argument("--server", choices=("auto", "gunicorn", "werkzeug", "uvicorn"), default="auto")
+    ap.add_argument("--workers", type=int, default=0, help="覆盖 gunicorn.conf.py 的 workers")
+    ap.add_argument("--threads", type=int, default=0, help="覆盖 gunicorn.conf.py 的 threads")
+    ap.add_argument("--poll", choices=("long", "short"), default="long")
+    ap.add_argument("--scan-delay", type=float, default=0.5)
+    ap.add_argument("--dt-latency-ms", type=float, default=20.0)
+    ap.add_argument("--zt-latency-ms", type=float, default=10.0)
+    ap.add_argument("--zt-render-ms", type=float, default=30.0)
+    ap.add_argument("--set", action="append", metavar="KEY=JSON", help="覆盖网关 config 项，可重复")
+    ap.add_argument("--keep", action="store_true", help="保留临时目录（日志 / SQLite）")
+    a = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench_e2e_")
+    _, dt_url = e2e_stubs.start_dingtalk(a.org_users, a.dt_latency_ms)
+    _, zt_url = e2e_stubs.start_zentao(a.zt_render_ms, a.zt_latency_ms)
+    e2e_stubs.init_sqlite(f"{tmp}/zentao.db")
+    proc, gw, server = start_gateway(a, tmp, dt_url, zt_url)
+    print(f"gateway={gw} server={server} mode={a.mode} concurrency={a.concurrency} "
+          f"duration={a.duration}s tmp={tmp}")
+    try:
+        for flow in [f.strip() for f in a.flows.split(",") if f.strip()]:
+            print(f"\n== {flow} ==")
+            if flow == "oneclick":
+                rec, elapsed = drive(flow_oneclick(gw, a.users), a.concurrency, a.duration)
+            elif flow == "qr":
+                rec, elapsed = drive(flow_qr(gw, a.users, a.poll, a.scan_delay), a.concurrency, a.duration)
+            elif flow == "sync":
+                rec, elapsed, info = run_sync(gw)
+                print(f"status={info.get('status')} processed={info.get('processed')} "
+                      f"created={info.get('created')} users/s={info.get('processed', 0) / max(elapsed, 1e-9):.0f}")
+            else:
+                print("unknown flow"); continue
+            report(rec, elapsed)
+        print(f"\nzentao apilogin sessions={e2e_stubs.FakeZentao.sessions} "
+              f"dingtalk calls={sum(e2e_stubs.FakeDingTalk.calls.values())}")
+    finally:
+        proc.terminate()
+        try: proc.wait(10)
+        except subprocess.TimeoutExpired: proc.kill()
+        if not a.keep: shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+二维码渲染基准：每秒渲染次数
+- legacy：原实现 qrcode.make + PIL 默认 PNG
+- png / png-fast：services.qr_render（默认压缩级别 / compress_level=1），关闭缓存
+- svg：无 PIL 的 SVG 输出，关闭缓存
+- svg-mask0：SVG + 固定掩码（QR_MASK_PATTERN=0）
+- cached：同一 auth_url 重复请求（LRU 命中）
+用法：python bench/bench_qrcode.py [--seconds 2]
+"""
+import os, sys, time, uuid, argparse
+from io import BytesIO
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import qr_render
+
+def _url():
+    return ("https://login.dingtalk.com/oauth2/auth?client_id=dingxxxxxxxxxxxx"
+            "&redirect_uri=http%3A//zentao.example.cn/dingtalk/callback&response_type=code&scope=openid"
+            f"&state=Q%7C{uuid.uuid4().hex}&prompt=consent&return_url=http%3A//zentao.example.cn/")
+
+def legacy(url):
+    import qrcode
+    buf = BytesIO(); qrcode.make(url).save(buf, format="PNG"); return buf.getvalue()
+
+def _fixed_mask(r, url):
+    qr_render.MASK_PATTERN = 0
+    try: return r(url, "svg", qr_render.BOX_SIZE, qr_render.BORDER, 0)
+    finally: qr_render.MASK_PATTERN = None
+
+def rate(fn, seconds, same_url=False):
+    url = _url(); n = 0; size = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        size = len(fn(url if same_url else _url())); n += 1
+    return n / seconds, size
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=2.0)
+    a = ap.parse_args()
+    r = qr_render._render
+    cases = [
+        ("legacy",   legacy, False),
+        ("png",      lambda u: r(u, "png", qr_render.BOX_SIZE, qr_render.BORDER, qr_render.PNG_COMPRESS), False),
+        ("png-fast", lambda u: r(u, "png", qr_render.BOX_SIZE, qr_render.BORDER, 1), False),
+        ("svg",      lambda u: r(u, "svg", qr_render.BOX_SIZE, qr_render.BORDER, 0), False),
+        ("svg-mask0", lambda u: _fixed_mask(r, u), False),
+        ("cached",   lambda u: qr_render.render(u, "png"), True),
+    ]
+    print(f"{'mode':<10}{'renders/s':>12}{'bytes':>10}")
+    for name, fn, same in cases:
+        rps, size = rate(fn, a.seconds, same)
+        print(f"{name:<10}{rps:>12.1f}{size:>10}")
+
+if __name__ == "__main__":
+    main()
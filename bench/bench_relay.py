@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Cookie 中继基准：本地桩禅道（首页模拟 PHP 渲染耗时，apilogin 下发会话 Cookie 并 302 回首页）
+对比 RELAY_MODE=legacy 与 fast（RELAY_WARMUP=auto/always）的单次中继延迟与 TCP 建连数
+用法：python bench/bench_relay.py [--n 200] [--render-ms 30]
+"""
+import os, sys, time, uuid, logging, argparse, threading, statistics
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as gw
+
+class StubZentao(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 1 << 16                 # 头与正文一次写出，避免 Nagle/延迟 ACK 干扰测量
+    disable_nagle_algorithm = True
+    render_ms = 30
+    conns = set()
+
+    def setup(self):
+        super().setup(); StubZentao.conns.add(self.client_address)
+
+    def _send(self, code, body=b"", headers=()):
+        self.send_response(code)
+        for k, v in headers: self.send_header(k, v)
+        if self.close_connection: self.send_header("Connection", "close")
+        self.send_header("Content-Length", str(len(body))); self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if "f=apilogin" in self.path:
+            self._send(302, headers=[("Location", "/"),
+                                     ("Set-Cookie", f"zentaosid={uuid.uuid4().hex}; path=/")])
+        else:
+            time.sleep(self.render_ms / 1000.0)          # 模拟首页 PHP 渲染
+            self._send(200, b"<html>" + b"x" * 20000 + b"</html>",
+                       [("Content-Type", "text/html"), ("Set-Cookie", "zentaosid=warm; path=/")])
+
+    def log_message(self, *a): pass
+
+def run(mode: str, warmup: str, n: int, base: str):
+    gw.RELAY_MODE, gw.RELAY_WARMUP = mode, warmup
+    StubZentao.conns = set()
+    url = f"{base}/api.php?m=user&f=apilogin&account=bench&referer=%2F"
+    lat = []
+    for _ in range(n):
+        with gw.app.test_request_context("/dingtalk/callback", headers={"X-Forwarded-For": "10.0.0.1"}):
+            t0 = time.perf_counter()
+            resp = gw._relay_apilogin_cookies(url, "/")
+            lat.append((time.perf_counter() - t0) * 1000)
+            assert resp.status_code == 302
+    lat.sort()
+    return lat[len(lat) // 2], lat[int(len(lat) * .95)], statistics.mean(lat), len(StubZentao.conns)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=200)
+    ap.add_argument("--render-ms", type=int, default=30)
+    a = ap.parse_args()
+    StubZentao.render_ms = a.render_ms
+    logging.disable(logging.INFO)
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), StubZentao)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{srv.server_port}"
+    gw._cfg.ZENTAO_BASE = base
+
+    print(f"{'mode':<18}{'p50(ms)':>10}{'p95(ms)':>10}{'mean(ms)':>10}{'new_tcp':>9}")
+    for mode, warmup in (("legacy", "always"), ("fast", "always"), ("fast", "auto")):
+        p50, p95, mean, conns = run(mode, warmup, a.n, base)
+        print(f"{mode + '/' + warmup:<18}{p50:>10.2f}{p95:>10.2f}{mean:>10.2f}{conns:>9}")
+    srv.shutdown()
+
+if __name__ == "__main__":
+    main()
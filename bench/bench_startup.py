@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准
+- import：新进程里 import app 的耗时（中位数），及 -X importtime 排名前列的模块
+- boot：从启动网关到 /health 首次返回 200 的耗时；装有 gunicorn 时对比 SSO_PRELOAD=0/1，
+        并给出 master + worker 的 PSS 总和（preload 下依赖在 master 导入，worker 写时复制共享）
+用法：python bench/bench_startup.py [--n 5] [--workers 2]
+"""
+import os, sys, json, time, shutil, argparse, tempfile, statistics, subprocess, importlib.util
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_e2e
+
+ROOT = bench_e2e.ROOT
+
+def _env(tmp):
+    cfg = {"LOG_FILE": f"{tmp}/gateway.log", "TICKET_DB": f"{tmp}/tickets.db", "METRICS_DB": f"{tmp}/metrics.db",
+           "EVENT_QUEUE_DB": f"{tmp}/events.db", "TOKEN_CACHE_DB": f"{tmp}/tokens.db"}
+    return dict(os.environ, BENCH_E2E=json.dumps({"config": cfg}))
+
+def import_time(tmp, n):
+    code = "import time; t=time.perf_counter(); import e2e_gateway; print(time.perf_counter()-t)"
+    xs = [float(subprocess.check_output([sys.executable, "-c", code], cwd=bench_e2e.BENCH, env=_env(tmp)))
+          for _ in range(n)]
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import e2e_gateway"], cwd=bench_e2e.BENCH,
+                         env=_env(tmp), capture_output=True, text=True).stderr.splitlines()
+    rows = []
+    for line in out:
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    top = [(us, name) for us, name in rows if not name.startswith("    ")]   # 只看顶层导入
+    return statistics.median(xs), sorted(top, reverse=True)[:8]
+
+def _pss_kb(pid) -> int:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"): return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+def _tree(pid):
+    pids, todo = [], [pid]
+    while todo:
+        p = todo.pop(); pids.append(p)
+        try:
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                todo += [int(x) for x in f.read().split()]
+        except OSError:
+            pass
+    return pids
+
+def boot(tmp, server, workers, preload):
+    a = argparse.Namespace(mode="mysql", set=[], server=server, workers=workers, threads=0)
+    os.environ["SSO_PRELOAD"] = "1" if preload else "0"
+    t0 = time.perf_counter()
+    proc, url, _ = bench_e2e.start_gateway(a, tmp, "http://127.0.0.1:9", "http://127.0.0.1:9")
+    elapsed = time.perf_counter() - t0
+    time.sleep(1.0)                                   # 等其余 worker 就绪
+    pss = sum(_pss_kb(p) for p in _tree(proc.pid))
+    proc.terminate(); proc.wait(10)
+    return elapsed, pss
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=5)
+    ap.add_argument("--workers", type=int, default=2)
+    a = ap.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench_startup_")
+    med, top = import_time(tmp, a.n)
+    print(f"import app: median {med * 1000:.0f} ms over {a.n} runs")
+    for us, name in top:
+        print(f"  {us / 1000:>8.1f} ms  {name.strip()}")
+    if importlib.util.find_spec("gunicorn"):
+        cases = [("gunicorn", False), ("gunicorn", True)]
+    else:
+        print("gunicorn not installed: boot measured with werkzeug (no preload)")
+        cases = [("werkzeug", False)]
+    print(f"\n{'server':<10}{'preload':>8}{'first 200 ms':>14}{'PSS MB':>9}")
+    for server, preload in cases:
+        xs, pss = [], 0
+        for _ in range(a.n):
+            t, pss = boot(tmp, server, a.workers, preload); xs.append(t)
+        print(f"{server:<10}{str(preload):>8}{statistics.median(xs) * 1000:>14.0f}{pss / 1024:>9.1f}")
+    shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+票据存储基准：不同存量票据下 /dingtalk/status 查询（ticket_get）的延迟
+用法：python bench/bench_tickets.py [--sizes 1000,10000,100000] [--polls 2000]
+"""
+import os, sys, time, json, uuid, random, argparse, tempfile, statistics
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import ticket_store
+
+def _pct(xs, p):
+    xs = sorted(xs); return xs[min(len(xs) - 1, int(len(xs) * p))]
+
+def _fill(n: int):
+    now = int(time.time())
+    rows = [(uuid.uuid4().hex, now, now + ticket_store.TTL, "/") for _ in range(n)]
+    c = ticket_store._conn()
+    c.execute("BEGIN")
+    c.executemany("INSERT INTO tickets(t,ok,created,expires,ret) VALUES (?,0,?,?,?)", rows)
+    c.execute("COMMIT")
+    return [r[0] for r in rows]
+
+def bench_sqlite(n: int, polls: int):
+    keys = _fill(n - ticket_store.count()) if n > ticket_store.count() else []
+    keys = keys or [r[0] for r in ticket_store._conn().execute("SELECT t FROM tickets LIMIT 1000")]
+    lat = []
+    for _ in range(polls):
+        t = random.choice(keys)
+        t0 = time.perf_counter(); ticket_store.get(t); lat.append((time.perf_counter() - t0) * 1e6)
+    return lat
+
+def bench_json(n: int, polls: int, path: str):
+    """旧实现：每次轮询整文件 json.load。"""
+    data = {uuid.uuid4().hex: {"ok": False, "created": int(time.time()), "return": "/"} for _ in range(n)}
+    with open(path, "w", encoding="utf-8") as f: json.dump(data, f)
+    keys = list(data)[:1000]; lat = []
+    for _ in range(polls):
+        t = random.choice(keys)
+        t0 = time.perf_counter()
+        with open(path, "r", encoding="utf-8") as f: json.load(f).get(t)
+        lat.append((time.perf_counter() - t0) * 1e6)
+    return lat
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--polls", type=int, default=2000)
+    ap.add_argument("--json-max", type=int, default=100000, help="旧 JSON 实现测到的最大存量")
+    a = ap.parse_args()
+    tmp = tempfile.mkdtemp(prefix="dt_bench_")
+    ticket_store._PATH = os.path.join(tmp, "tickets.db")
+
+    print(f"{'impl':<8}{'tickets':>10}{'p50(us)':>12}{'p99(us)':>12}{'mean(us)':>12}")
+    for n in [int(x) for x in a.sizes.split(",")]:
+        lat = bench_sqlite(n, a.polls)
+        print(f"{'sqlite':<8}{n:>10}{_pct(lat, .5):>12.1f}{_pct(lat, .99):>12.1f}{statistics.mean(lat):>12.1f}")
+        if n <= a.json_max:
+            lat = bench_json(n, max(20, a.polls // 100), os.path.join(tmp, "tickets.json"))
+            print(f"{'json':<8}{n:>10}{_pct(lat, .5):>12.1f}{_pct(lat, .99):>12.1f}{statistics.mean(lat):>12.1f}")
+
+if __name__ == "__main__":
+    main()
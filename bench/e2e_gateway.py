@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+压测用网关入口：按环境变量 BENCH_E2E（JSON）改写 config 并把上游指向本地替身后再导入 app
+- gunicorn：gunicorn -c gunicorn.conf.py --pythonpath bench e2e_gateway:app
+- 无 gunicorn 时：python bench/e2e_gateway.py <port>（werkzeug 多线程服务器）
+- ASGI 模式：uvicorn --app-dir bench e2e_gateway:asgi_app
+BENCH_E2E = {"config": {...}, "dingtalk": "http://127.0.0.1:port", "sqlite": "/tmp/x.db" | null}
+"""
+import os, sys, json
+from functools import partial
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT); sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+_opts = json.loads(os.environ.get("BENCH_E2E") or "{}")
+
+import config
+for _k, _v in (_opts.get("config") or {}).items():
+    setattr(config, _k, _v)
+
+from services import dingtalk_api, zentao_api
+if _opts.get("dingtalk"):
+    dingtalk_api.BASE = _opts["dingtalk"] + "/v1.0"
+    dingtalk_api.OAPI = _opts["dingtalk"]
+if _opts.get("sqlite"):
+    import e2e_stubs
+    zentao_api._connect = partial(e2e_stubs.sqlite_connect, _opts["sqlite"])
+    from services import aio_db
+    aio_db.NATIVE = False           # SQLite 替身只接管同步连接，协程查询改走线程池
+
+from app import app  # noqa: E402
+from asgi import app as asgi_app  # noqa: E402
+
+__all__ = ["app", "asgi_app"]       # gunicorn / uvicorn 按 e2e_gateway:app、e2e_gateway:asgi_app 加载
+
+if __name__ == "__main__":
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)     # 不逐条记访问日志
+    make_server("127.0.0.1", int(sys.argv[1]), app, threaded=True).serve_forever()
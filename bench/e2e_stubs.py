@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+端到端压测用的本地替身（无需外网 / MySQL）
+- FakeDingTalk：OAuth（userAccessToken / accessToken）、users/me、通讯录分页、topapi 员工数与详情
+  授权码格式 "<userId>.<随机串>"，users/me 据此返回固定用户，便于控制新老用户比例
+- FakeZentao：首页（模拟 PHP 渲染耗时）、api.php?m=user&f=apilogin（下发会话 Cookie 并 302）、
+  /api.php/v1/tokens、/api.php/v1/users（分页 / 创建 / 按账号查询）
+- sqlite_connect(path)：PyMySQL 连接的最小替身（DictCursor 语义、%s 占位、INSERT IGNORE），
+  供 zentao_api 的 MySQL 模式使用；init_sqlite(path) 建 zt_user / zt_group / zt_usergroup / zt_team
+"""
+import json, time, uuid, sqlite3, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 1 << 16                 # 头与正文一次写出，避免 Nagle/延迟 ACK 干扰测量
+    disable_nagle_algorithm = True
+    latency_ms = 0.0
+
+    def _send(self, code, body=b"", headers=(), ctype="application/json"):
+        if isinstance(body, (dict, list)): body = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(code)
+        for k, v in headers: self.send_header(k, v)
+        if body: self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body))); self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b""
+        try: return json.loads(raw or b"{}")
+        except ValueError: return {}
+
+    def _sleep(self):
+        if self.latency_ms: time.sleep(self.latency_ms / 1000.0)
+
+    def log_message(self, *a): pass
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+def _serve(handler_cls, port: int = 0):
+    srv = _Server(("127.0.0.1", port), handler_cls)
+    threading.Thread(target=srv.serve_forever, name=handler_cls.__name__, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_port}"
+
+# ---- 钉钉 ----
+class FakeDingTalk(_Handler):
+    org_size = 1000
+    lock = threading.Lock()
+    calls = {}
+
+    def _count(self, key):
+        with self.lock: self.calls[key] = self.calls.get(key, 0) + 1
+
+    @staticmethod
+    def user(uid: str):
+        n = "".join(ch for ch in uid if ch.isdigit()) or "0"
+        return {"userId": uid, "name": f"用户{uid}", "deptId": int(n) % 10}
+
+    def do_POST(self):
+        u = urlparse(self.path); body = self._body(); self._sleep(); self._count(u.path)
+        if u.path == "/v1.0/oauth2/userAccessToken":
+            return self._send(200, {"accessToken": "ut:" + str(body.get("code", "")), "expireIn": 7200})
+        if u.path == "/v1.0/oauth2/accessToken":
+            return self._send(200, {"accessToken": "app-token", "expireIn": 7200})
+        if u.path == "/topapi/user/count":
+            return self._send(200, {"errcode": 0, "result": {"count": self.org_size}})
+        if u.path == "/topapi/v2/user/get":
+            return self._send(200, {"errcode": 0, "result": self.user(str(body.get("userid", "")))})
+        self._send(404, {"code": "notFound"})
+
+    def do_GET(self):
+        u = urlparse(self.path); q = parse_qs(u.query); self._sleep(); self._count(u.path)
+        if u.path == "/v1.0/contact/users/me":
+            tok = self.headers.get("x-acs-dingtalk-access-token", "")
+            if not tok.startswith("ut:"): return self._send(401, {"code": "InvalidAuthentication"})
+            return self._send(200, self.user(tok[3:].split(".", 1)[0]))
+        if u.path == "/v1.0/contact/users":
+            size = int((q.get("maxResults") or ["100"])[0]); start = int((q.get("nextToken") or ["0"])[0])
+            end = min(start + size, self.org_size)
+            users = [self.user(f"org{i}") for i in range(start, end)]
+            nxt = str(end) if end < self.org_size else None
+            return self._send(200, {"users": users, "nextToken": nxt, "hasMore": bool(nxt)})
+        self._send(404, {"code": "notFound"})
+
+# ---- 禅道 ----
+class FakeZentao(_Handler):
+    render_ms = 30.0
+    lock = threading.Lock()
+    users = {}            # account -> {"id", "account", "realname", "deleted"}
+    sessions = 0
+
+    def _page(self):
+        time.sleep(self.render_ms / 1000.0)
+        self._send(200, b"<html>" + b"x" * 20000 + b"</html>",
+                   [("Set-Cookie", "zentaosid=warm; path=/")], ctype="text/html")
+
+    def do_GET(self):
+        u = urlparse(self.path); q = parse_qs(u.query)
+        if u.path in ("/", "/index.php") and "apilogin" not in u.query:
+            return self._page()
+        if u.path.endswith("api.php") and (q.get("f") or [""])[0] == "apilogin":
+            with self.lock: FakeZentao.sessions += 1
+            return self._send(302, headers=[("Location", "/"),
+                                            ("Set-Cookie", f"zentaosid={uuid.uuid4().hex}; path=/")])
+        self._sleep()
+        if u.path == "/api.php/v1/users":
+            page = int((q.get("page") or ["1"])[0]); limit = int((q.get("limit") or ["20"])[0])
+            with self.lock: rows = sorted(self.users.values(), key=lambda r: -r["id"])
+            return self._send(200, {"page": page, "limit": limit, "total": len(rows),
+                                    "users": rows[(page - 1) * limit: page * limit]})
+        if u.path.startswith("/api.php/v1/users/"):
+            acct = u.path.rsplit("/", 1)[-1]
+            with self.lock: row = self.users.get(acct)
+            return self._send(200, row) if row else self._send(404, {"error": "not found"})
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        u = urlparse(self.path); body = self._body(); self._sleep()
+        if u.path == "/api.php/v1/tokens":
+            return self._send(201, {"token": "admin-token"})
+        if u.path == "/api.php/v1/users":
+            acct = body.get("account")
+            with self.lock:
+                if not acct or acct in self.users:
+                    return self._send(400, {"error": "account exists"})
+                row = {"id": len(self.users) + 1, "account": acct,
+                       "realname": body.get("realname") or acct, "deleted": "0"}
+                self.users[acct] = row
+            return self._send(201, row)
+        self._send(404, {"error": "not found"})
+
+def start_dingtalk(org_size: int = 1000, latency_ms: float = 0.0):
+    FakeDingTalk.org_size, FakeDingTalk.latency_ms = org_size, latency_ms
+    return _serve(FakeDingTalk)
+
+def start_zentao(render_ms: float = 30.0, latency_ms: float = 0.0):
+    FakeZentao.render_ms, FakeZentao.latency_ms = render_ms, latency_ms
+    return _serve(FakeZentao)
+
+# ---- MySQL 替身（SQLite） ----
+_TABLES = """
+CREATE TABLE IF NOT EXISTS zt_user (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, account TEXT UNIQUE, realname TEXT, dept INTEGER DEFAULT 0,
+    role TEXT, visions TEXT, deleted TEXT DEFAULT '0');
+CREATE INDEX IF NOT EXISTS idx_user_realname ON zt_user(realname);
+CREATE TABLE IF NOT EXISTS zt_group (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS zt_usergroup ("user" INTEGER, "group" INTEGER, PRIMARY KEY ("user", "group"));
+CREATE TABLE IF NOT EXISTS zt_team (root INTEGER, type TEXT, account TEXT, role TEXT, "join" TEXT,
+    days INTEGER, PRIMARY KEY (root, type, account));
+"""
+
+def init_sqlite(path: str, groups=("pm",)):
+    c = sqlite3.connect(path)
+    c.execute("PRAGMA journal_mode=WAL")
+    c.executescript(_TABLES)
+    c.executemany("INSERT OR IGNORE INTO zt_group(name) VALUES (?)", [(g,) for g in groups])
+    c.commit(); c.close()
+
+def _sql(q: str) -> str:
+    return (q.replace("%s", "?").replace("INSERT IGNORE", "INSERT OR IGNORE")
+             .replace("NOW()", "datetime('now')"))
+
+class _Cursor:
+    def __init__(self, conn):
+        self._c = conn.cursor(); self.rowcount = 0; self.lastrowid = 0
+
+    def execute(self, q, args=()):
+        self._c.execute(_sql(q), tuple(args or ()))
+        self.rowcount, self.lastrowid = self._c.rowcount, self._c.lastrowid
+        return max(self.rowcount, 0)
+
+    def executemany(self, q, rows):
+        self._c.executemany(_sql(q), [tuple(r) for r in rows])
+        self.rowcount = self._c.rowcount
+        return max(self.rowcount, 0)
+
+    def fetchone(self):
+        r = self._c.fetchone()
+        return dict(r) if r is not None else None
+
+    def fetchall(self):
+        return [dict(r) for r in self._c.fetchall()]
+
+    def close(self): self._c.close()
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+class SqliteConnection:
+    """只实现 zentao_api / db_pool 用到的 PyMySQL 接口。"""
+    def __init__(self, path: str):
+        self._c = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._c.row_factory = sqlite3.Row
+        self.open = True
+
+    def cursor(self): return _Cursor(self._c)
+    def begin(self): self._c.execute("BEGIN IMMEDIATE")
+    def commit(self):
+        if self._c.in_transaction: self._c.execute("COMMIT")
+    def rollback(self):
+        if self._c.in_transaction: self._c.execute("ROLLBACK")
+    def ping(self, reconnect=False): self._c.execute("SELECT 1")
+    def close(self):
+        self.open = False; self._c.close()
+    _force_close = close
+
+def sqlite_connect(path: str) -> SqliteConnection:
+    return SqliteConnection(path)
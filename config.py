@@ -6,11 +6,49 @@
 DT_APP_KEY = "xxxx"
 DT_APP_SECRET = "xxxxxxxxxxx"
 
+# 上游 token 缓存（钉钉应用 token / 禅道管理员 token，多 worker 共享）
+TOKEN_CACHE_DB = "/tmp/dt_tokens.db"
+TOKEN_REFRESH_MARGIN = 300       # 过期前多少秒开始后台提前刷新
+
+# 出站 HTTP（钉钉 / 禅道），每个 worker 一个 keep-alive 连接池
+HTTP_POOL_SIZE = 0               # 每个主机的连接数上限，0 = 取 gunicorn threads
+HTTP_RETRIES = 2                 # 5xx / 429 重试次数（POST 仅 429 / 503）
+HTTP_BACKOFF = 0.2               # 抖动退避基数（秒）
+HTTP_BACKOFF_MAX = 2.0           # 单次退避上限（秒）
+
+# 请求预算与熔断：回调链上所有外呼共享一个截止时间；上游连续失败后熔断，冷却后放行一个探测请求
+REQUEST_DEADLINE = 12            # 单个请求的总时间预算（秒），0 = 不限制，仅用各调用自身超时
+BREAKER_FAILURES = 5             # 连续失败（连接错误 / 超时 / 5xx）多少次后打开熔断
+BREAKER_OPEN_SECONDS = 15        # 熔断打开后多少秒进入半开探测
+
+# 回调去重：同一授权码 / 同一钉钉用户的并发回调只处理一次（跨 worker 共享锁表），结果在复用窗口内直接返回
+SINGLE_FLIGHT_ENABLED = True
+SINGLE_FLIGHT_DB = "/tmp/dt_single_flight.db"
+SINGLE_FLIGHT_REUSE = 10         # 结果复用窗口（秒）；同一授权码在窗口内重放会直接复用登录结果，不宜过长
+SINGLE_FLIGHT_LEASE = 30         # 处理中的租约（秒），worker 崩溃后到期由他人接手
+
+# 依赖探测：每个 worker 后台定时探测，/health?deep=1 只读缓存（不健康返回 503，供负载均衡摘除）
+HEALTH_CHECKS = None             # None = 按 ZENTAO_CREATE_MODE：mysql 模式 ["mysql", "zentao", "dingtalk"]，api 模式不探测 mysql
+HEALTH_INTERVAL = 10             # 探测间隔（秒）
+HEALTH_STALE = 30                # 结果超过该秒数未更新视为不健康
+ZENTAO_HEALTH_PATH = "/index.php?m=misc&f=ping"   # 禅道可达性探测路径（< 500 即健康）
+
+# ASGI 模式（uvicorn asgi:app，见 asgi.py）；同步部署（gunicorn app:app）不使用
+ASYNC_HTTP_POOL_SIZE = 100       # 每个上游的协程 HTTP 连接上限（需 httpx）
+ASYNC_DB_POOL_SIZE = 20          # 每个 worker 的协程 MySQL 连接上限（需 aiomysql）
+ASYNC_MAX_WAITERS = 1000         # 每个 worker 同时挂起的长轮询 / SSE 上限
+ASYNC_THREADS = 32               # 线程池大小：Flask 路由、首次登录建号、未安装 httpx / aiomysql 时的外呼
+
 # 禅道信息
 ZENTAO_BASE = "http://zentao.xxxx.cn"  # 禅道地址（http）
 ZENTAO_APP_CODE = "DingTalk_Logi"  # 禅道应用代号
 ZENTAO_APP_KEY = "xxxxxxxx"  # 禅道应用密钥
 
+# 登录 Cookie 中继
+RELAY_MODE = "fast"              # fast：复用连接池、不跟随跳转；legacy：原流程（预热首页 + 跟随跳转）
+RELAY_WARMUP = "auto"            # auto：apilogin 未返回 Cookie 时才预热首页；always / never
+RELAY_FOLLOW_REDIRECTS = False   # fast 模式下是否跟随 apilogin 的跳转
+
 # API Token
 ZENTAO_CREATE_MODE = "mysql"
 ZENTAO_ADMIN_TOKEN = "TOKEN"
@@ -20,6 +58,9 @@ ZENTAO_TOKEN_AUTO_LOGIN = True            # 开启自动登录取 Token
 # 账号密码均通过环境变量配置，下方配置占位
 ZENTAO_ADMIN_ACCOUNT = "admin"            # 管理员账号
 ZENTAO_ADMIN_PASSWORD = "password"   # 管理员密码
+ZENTAO_TOKEN_TTL = 1200                   # 自动登录所得 Token 视为有效的秒数（到期前提前刷新）
+ZENTAO_API_MIRROR = True                  # API 模式下在本地镜像禅道用户列表（存在性 / 姓名匹配 / 批量同步）
+ZENTAO_API_PAGE_SIZE = 500                # 拉取 /api.php/v1/users 的分页大小
 
 # 环境变量优先：ZENTAO_ADMIN_TOKEN / ZENTAO_ADMIN_ACCOUNT / ZENTAO_ADMIN_PASSWORD
 # Token 登录接口（不同版本一般相同）
@@ -33,6 +74,14 @@ MYSQL_USER = "root"
 MYSQL_PASS = "xxxxxx"
 MYSQL_TABLE_PREFIX = "zt_"
 
+# MySQL 连接池（每个 worker 进程一个池；总连接数约 workers × 池大小）
+DB_POOL_SIZE = 0                 # 0 = 取 gunicorn threads
+DB_POOL_MAX_IDLE = 300           # 空闲超过该秒数的连接回收
+DB_POOL_MAX_LIFETIME = 3600      # 连接最长存活（秒），应小于 MySQL wait_timeout
+DB_POOL_PING_AFTER = 30          # 空闲超过该秒数的连接取出时先 ping
+DB_POOL_WAIT_TIMEOUT = 10        # 池满时最长等待（秒）
+MYSQL_CONNECT_TIMEOUT = 5        # 建连超时（秒）
+
 
 # 账号生成策略：ding_userid 或 realname
 ACCOUNT_STRATEGY = "ding_userid"
@@ -45,7 +94,89 @@ AUTO_JOIN_PROJECT_ID = 0
 AUTO_JOIN_PROJECT_ROLE = "pm"
 DEFAULT_DEPT_ID = 0
 DEFAULT_PASSWORD = "123456"
+ZENTAO_GROUP_CACHE_TTL = 300     # 组名 -> 组 ID 缓存有效期（秒）
+
+# 账号缓存（user_exists / find_account_by_realname）
+ACCOUNT_CACHE_SIZE = 10000       # LRU 容量
+ACCOUNT_CACHE_TTL = 300          # 正向缓存有效期（秒）
+ACCOUNT_NEG_TTL = 30             # 负缓存（不存在 / 无匹配）有效期（秒）
+ACCOUNT_PRELOAD = False          # 启动时批量预加载账号与姓名索引（API 模式见 ZENTAO_API_MIRROR）
+ACCOUNT_REFRESH_INTERVAL = 60    # 索引增量刷新间隔（秒）
+ACCOUNT_FULL_RELOAD_EVERY = 30   # 每 N 次刷新做一次全量重建
+
+# 账号绑定存储（快照 + 追加日志）
+BIND_FILE = "bindings.json"
+BIND_COMPACT_EVERY = 1000        # 追加日志达到该行数时合并回快照
+
+# 二维码渲染
+QR_FORMAT = "png"                # 默认输出格式：png / svg（svg 不需要 PIL，渲染更快）
+QR_BOX_SIZE = 10                 # 每个模块的像素数
+QR_BORDER = 4                    # 静区宽度（模块数）
+QR_PNG_COMPRESS = 6              # PNG 压缩级别 0-9
+QR_CACHE_SIZE = 256              # 渲染结果 LRU 缓存条数，0 关闭
+QR_MASK_PATTERN = None           # 固定掩码 0-7 可省去最优掩码试算；None 自动
+
+# 扫码票据（SQLite，多 worker 共享）
+TICKET_DB = "/tmp/dt_tickets.db"
+TICKET_TTL = 600                 # 票据有效期（秒）
+TICKET_EVICT_INTERVAL = 60       # 过期票据清理间隔（秒）
+TICKET_WATCH_INTERVAL = 0.2      # 跨 worker 票据变更检测间隔（秒）
+
+# 状态长轮询 / SSE
+LONGPOLL_TIMEOUT = 25            # /dingtalk/status?wait= 最长挂起（秒）
+LONGPOLL_MAX_WAITERS = 2         # 每个 worker 同时挂起的等待数上限（gthread 下每个等待占一个线程，须小于 threads）
+                                 # 同步模式下其余页面仍按 2 秒轮询；减少状态请求需用 ASGI 模式（asgi.py，见 ASYNC_MAX_WAITERS）
+LONGPOLL_BUSY_RETRY = 2          # 等待数已满时立即返回，告知前端该秒数（>= 2）后再轮询
+SSE_TIMEOUT = 120                # /dingtalk/status/stream 最长保持（秒）
+
+# 全量同步
+SYNC_PAGE_SIZE = 100             # 钉钉通讯录分页大小
+SYNC_BATCH_SIZE = 500            # 批量插入每块行数
+SYNC_PAGE_PAUSE = 0.05           # 每页之间暂停（秒），给登录流量让出连接池
+SYNC_PLAN_LIMIT = 1000           # dry-run 返回的待创建账号上限
+SYNC_JOB_DB = "/tmp/dt_sync_jobs.db"
+SYNC_JOB_STALE = 120             # 运行中任务心跳超过该秒数视为中断，可续跑
+SYNC_ADMIN_SECRET = ""           # 管理密钥（建议用同名环境变量）：请求头 X-Sync-Secret 带上即可不用 code 触发 / 查看同步
+
+# 通讯录事件增量同步（/dingtalk/event）
+EVENT_SYNC_ENABLED = True        # 启动后台队列消费线程
+EVENT_QUEUE_DB = "/tmp/dt_events.db"
+EVENT_COALESCE_WINDOW = 5        # 同一用户在该秒数内的多次事件合并处理
+EVENT_BATCH_SIZE = 200           # 每批应用的事件数
+EVENT_POLL_INTERVAL = 1          # 队列轮询间隔（秒）
+EVENT_MAX_ATTEMPTS = 5           # 失败重试上限
+EVENT_LEASE = 300                # 认领后未完成（worker 被杀 / 重启）超过该秒数由其他 worker 重新认领
+EVENT_LEAVE_ACTION = "ignore"    # 离职事件：ignore 忽略 / delete 软删除禅道账号
+EVENT_TOKEN = ""                 # 事件回调签名 token（钉钉后台“事件订阅”中设置；建议用同名环境变量）
+EVENT_AES_KEY = ""               # 事件回调加密 aes_key（43 位；建议用同名环境变量）；需 pip install cryptography
+EVENT_OWNER_KEY = ""             # 加密消息的接收方，留空用 DT_APP_KEY（旧版企业回调填 corpId）
+EVENT_SECRET = ""                # 内部转发明文事件时的共享密钥（请求头 X-Event-Secret；建议用同名环境变量）
+
+# 准入控制（按客户端 IP 令牌桶，多 worker 共享；IP 取 X-Forwarded-For 首个地址，需由 Nginx 覆盖写入）
+# 同一出口 IP（办公室 NAT；代理未写 X-Forwarded-For 时为 127.0.0.1）共用一个桶，默认额度按数百个同时打开的扫码页估算
+RATE_LIMIT_ENABLED = True
+RATE_LIMIT_DB = "/tmp/dt_ratelimit.db"
+RATE_LIMITS = {
+    "ticket": {"per_minute": 600, "burst": 200},    # /dingtalk/newticket、无 ticket 的 /dingtalk/qrcode
+    "status": {"per_minute": 6000, "burst": 1000},  # /dingtalk/status(/stream)、带 ticket 的 /dingtalk/qrcode
+}
+TICKET_MAX_OUTSTANDING = 20000   # 未过期票据总数上限，超出时新票据请求返回 429
+
+# 登录后配权（默认组 / 自动加入项目）：按策略版本记录已配权账号，老用户登录直接跳过；未配权的交后台执行
+PROVISION_DB = "/tmp/dt_provisioned.db"
+PROVISION_POLICY_VERSION = "1"   # 改动此值可强制所有账号重新配权（默认组 / 项目 / 角色变化时会自动重新配权）
+PROVISION_WORKERS = 2            # 每个 worker 的后台配权线程数
+PROVISION_RETRIES = 3            # 失败重试次数（指数退避，起始 PROVISION_BACKOFF 秒）
+PROVISION_BACKOFF = 1.0
+
+# 指标（/metrics，Prometheus 文本格式）
+METRICS_ENABLED = True
+METRICS_DB = "/tmp/dt_metrics.db"   # 多 worker 汇总用的共享 SQLite
+METRICS_FLUSH_INTERVAL = 5       # 各 worker 把进程内增量合并到共享库的间隔（秒）
 
 # 日志
 LOG_FILE = "/var/log/dingtalk_login.log"
-LOG_LEVEL = "DEBUG"
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "json"              # json（每行一个 JSON，含 request_id / 阶段耗时）/ text
+LOG_QUEUE_SIZE = 10000           # 日志队列上限，写线程跟不上时丢弃而不阻塞请求
+LOG_SAMPLE = {"status": 0.01, "event": 0.1, "limited": 0.01}   # 高频日志保留比例：状态轮询 / 通讯录事件 / 429
@@ -1,3 +1,5 @@
+import os
+
 bind = "127.0.0.1:9000"
 workers = 2           # 核心数*2+1 估算（内存够可适当加）
 threads = 4
@@ -7,3 +9,24 @@ accesslog = "/var/log/dingtalk_login.access.log"
 errorlog  = "/var/log/dingtalk_login.error.log"
 loglevel  = "info"
 
+
+# 长轮询 / SSE 较多时可改用协程 worker（需 pip install gevent），
+# 并相应调大 config.LONGPOLL_MAX_WAITERS：
+# worker_class = "gevent"
+# worker_connections = 1000
+# 或以 ASGI 模式运行 asgi:app（需 pip install uvicorn，见 asgi.py）：
+# gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+# preload 模式（SSO_PRELOAD=1）：master 导入一次应用与依赖，worker fork 后写时复制共享，
+# 重启 / 扩容 worker 不再重复导入；日志线程、连接池、后台线程由 post_fork 在各 worker 内初始化。
+# 注意 preload 下修改代码需重启 master（HUP 不会重新导入）。
+preload_app = os.getenv("SSO_PRELOAD", "0") == "1"
+if preload_app:
+    os.environ["SSO_DEFER_INIT"] = "1"
+
+def post_fork(server, worker):
+    # 供 services.db_pool 按线程数确定每个 worker 的连接池大小
+    os.environ["GUNICORN_THREADS"] = str(server.cfg.threads)
+    if server.cfg.preload_app:
+        import app
+        app.init_worker()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+禅道账号缓存（进程内）
+- TTLCache：带过期的 LRU，支持负缓存（不存在的账号 / 无匹配的姓名），负项有效期更短
+- 预加载索引（可选）：一次批量查询得到账号集合与 realname -> 账号 索引，
+  后台按 id 增量拉取新账号，每 ACCOUNT_FULL_RELOAD_EVERY 轮做一次全量重建（覆盖禅道后台的删除/改名）；
+  本服务自己的软删除 / 改名经 on_deactivated / on_renamed 在写入时同步更新索引
+- stats() 返回命中/未命中计数
+SQL 由调用方（zentao_api）以 loader(since_id) 的形式提供，本模块不依赖数据库。
+"""
+import os, time, threading, logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import config as _cfg
+
+CACHE_SIZE        = int(getattr(_cfg, "ACCOUNT_CACHE_SIZE", 10000) or 10000)
+CACHE_TTL         = float(getattr(_cfg, "ACCOUNT_CACHE_TTL", 300) or 300)
+NEG_TTL           = float(getattr(_cfg, "ACCOUNT_NEG_TTL", 30) or 30)
+REFRESH_INTERVAL  = float(getattr(_cfg, "ACCOUNT_REFRESH_INTERVAL", 60) or 60)
+FULL_RELOAD_EVERY = int(getattr(_cfg, "ACCOUNT_FULL_RELOAD_EVERY", 30) or 30)
+
+_MISS = object()
+
+class TTLCache:
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL, neg_ttl: float = NEG_TTL):
+        self.maxsize, self.ttl, self.neg_ttl = maxsize, ttl, neg_ttl
+        self._d: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.neg_hits = self.misses = 0
+
+    def get(self, key, negative=None):
+        """命中返回值；未命中返回 _MISS。值等于 negative 视为负缓存命中。"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._d.get(key)
+            if item is None or item[0] < now:
+                if item is not None: del self._d[key]
+                self.misses += 1
+                return _MISS
+            self._d.move_to_end(key)
+            if item[1] == negative: self.neg_hits += 1
+            else: self.hits += 1
+            return item[1]
+
+    def put(self, key, value, negative: bool = False):
+        with self._lock:
+            self._d[key] = (time.monotonic() + (self.neg_ttl if negative else self.ttl), value)
+            self._d.move_to_end(key)
+            while len(self._d) > self.maxsize:
+                self._d.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock: self._d.pop(key, None)
+
+    def clear(self):
+        with self._lock: self._d.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._d), "hits": self.hits, "neg_hits": self.neg_hits, "misses": self.misses}
+
+exists_cache   = TTLCache()     # account -> bool
+realname_cache = TTLCache()     # realname -> account（"" 表示无唯一匹配）
+
+# ---- 预加载索引 ----
+_idx_lock = threading.Lock()
+_accounts: set = set()
+_by_realname: Dict[str, List[str]] = {}
+_realname_of: Dict[str, str] = {}          # account -> realname，改名 / 删除时定位旧索引项
+_max_id = 0
+_loaded = False
+_loader: Optional[Callable[[int], Iterable[Dict[str, Any]]]] = None
+_thread_pid = 0
+
+def _index_name(by_realname: Dict[str, List[str]], realname_of: Dict[str, str], acct: str, name: str):
+    if name and acct not in by_realname.setdefault(name, []):
+        by_realname[name].append(acct)
+    if name: realname_of[acct] = name
+
+def _unindex_name(acct: str) -> str:
+    """从 realname 索引移除账号，返回原姓名；调用方持有 _idx_lock。"""
+    old = _realname_of.pop(acct, "")
+    accts = _by_realname.get(old)
+    if accts and acct in accts:
+        accts.remove(acct)
+        if not accts: del _by_realname[old]
+    return old
+
+def _apply(rows: Iterable[Dict[str, Any]], accounts: set, by_realname: Dict[str, List[str]],
+           realname_of: Dict[str, str], max_id: int) -> int:
+    for r in rows:
+        acct = r["account"]; accounts.add(acct)
+        _index_name(by_realname, realname_of, acct, r.get("realname") or "")
+        max_id = max(max_id, int(r.get("id") or 0))
+    return max_id
+
+def _full_reload():
+    global _accounts, _by_realname, _realname_of, _max_id, _loaded
+    accounts, by_realname, realname_of = set(), {}, {}
+    max_id = _apply(_loader(0), accounts, by_realname, realname_of, 0)
+    with _idx_lock:
+        _accounts, _by_realname, _realname_of, _max_id, _loaded = accounts, by_realname, realname_of, max_id, True
+    logging.info("account index loaded: %d accounts", len(accounts))
+
+def _incremental():
+    global _max_id
+    rows = list(_loader(_max_id))
+    if not rows: return
+    with _idx_lock:
+        _max_id = _apply(rows, _accounts, _by_realname, _realname_of, _max_id)
+
+def _refresh_loop():
+    n = 0
+    while True:
+        try:
+            if not _loaded or n % FULL_RELOAD_EVERY == 0: _full_reload()
+            else: _incremental()
+        except Exception:
+            logging.exception("account index refresh failed")
+        n += 1
+        time.sleep(REFRESH_INTERVAL)
+
+def start_preload(loader: Callable[[int], Iterable[Dict[str, Any]]]):
+    """loader(since_id) 返回 id > since_id 的未删除账号行（account/realname/id）。"""
+    global _loader, _thread_pid
+    with _idx_lock:
+        _loader = loader
+        if _thread_pid == os.getpid(): return      # fork 后（preload 模式）在子进程重新起线程
+        _thread_pid = os.getpid()
+    threading.Thread(target=_refresh_loop, name="account-index", daemon=True).start()
+
+def index_has(account: str) -> bool:
+    """仅对正向命中有意义：索引可能尚未包含最近在禅道后台新建的账号。"""
+    with _idx_lock: return _loaded and account in _accounts
+
+def index_realname(realname: str) -> Optional[str]:
+    """
+    仅对正向命中有意义：唯一匹配时返回账号，否则（未加载 / 未命中 / 重名）返回 None，
+    由调用方回落到库查询与负缓存——索引可能尚未包含禅道后台新建或改名的账号。
+    """
+    with _idx_lock:
+        if not _loaded: return None
+        accts = _by_realname.get(realname) or []
+        return accts[0] if len(accts) == 1 else None
+
+# ---- 对外：查询 / 写入 / 失效 ----
+def lookup_exists(account: str) -> Optional[bool]:
+    if index_has(account): return True
+    v = exists_cache.get(account, negative=False)
+    return None if v is _MISS else v
+
+def remember_exists(account: str, exists: bool):
+    exists_cache.put(account, exists, negative=not exists)
+
+def lookup_realname(realname: str) -> Optional[str]:
+    v = index_realname(realname)
+    if v is not None: return v
+    v = realname_cache.get(realname, negative="")
+    return None if v is _MISS else v
+
+def remember_realname(realname: str, account: str):
+    realname_cache.put(realname, account, negative=not account)
+
+def on_created(account: str, realname: str = ""):
+    """create_user 后调用：清除负缓存并写入索引。"""
+    exists_cache.put(account, True)
+    if realname: realname_cache.invalidate(realname)
+    with _idx_lock:
+        if _loaded:
+            _accounts.add(account)
+            _index_name(_by_realname, _realname_of, account, realname)
+
+def on_renamed(account: str, realname: str):
+    """update_users 改名后调用：旧姓名不再指向该账号。"""
+    with _idx_lock:
+        old = _unindex_name(account)
+        if _loaded and account in _accounts:
+            _index_name(_by_realname, _realname_of, account, realname)
+    for name in {old, realname} - {""}: realname_cache.invalidate(name)
+
+def on_deactivated(account: str):
+    """软删除后调用：移出索引并写入负缓存，登录 / 姓名匹配不再命中该账号。"""
+    with _idx_lock:
+        _accounts.discard(account)
+        old = _unindex_name(account)
+    if old: realname_cache.invalidate(old)
+    remember_exists(account, False)
+
+def stats() -> Dict[str, Any]:
+    with _idx_lock:
+        idx = {"loaded": _loaded, "accounts": len(_accounts), "max_id": _max_id}
+    return {"exists": exists_cache.stats(), "realname": realname_cache.stats(), "index": idx}
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+协程 MySQL 访问（ASGI 模式用）
+- 装有 aiomysql 时：每个事件循环一个 aiomysql 连接池（上限 ASYNC_DB_POOL_SIZE，回收周期同 DB_POOL_MAX_LIFETIME）
+- 未安装时 NATIVE=False，由调用方在线程池中执行同步实现（经 db_pool）
+- 与 db_pool 相同：经 "mysql" 熔断器，单次查询不超过请求剩余预算
+"""
+import asyncio, importlib.util
+from typing import Any, Dict, Optional, Sequence
+import config as _cfg
+from . import breaker, deadline
+
+POOL_SIZE    = int(getattr(_cfg, "ASYNC_DB_POOL_SIZE", 20) or 20)
+MAX_LIFETIME = int(getattr(_cfg, "DB_POOL_MAX_LIFETIME", 3600) or 3600)
+QUERY_TIMEOUT = float(getattr(_cfg, "DB_POOL_WAIT_TIMEOUT", 10) or 10)
+NATIVE       = importlib.util.find_spec("aiomysql") is not None
+
+_pool = None
+_pool_loop = None
+_pool_lock: Optional[asyncio.Lock] = None
+
+async def _get_pool():
+    global _pool, _pool_loop, _pool_lock
+    loop = asyncio.get_running_loop()
+    if _pool is not None and _pool_loop is loop:
+        return _pool
+    if _pool_lock is None or _pool_loop is not loop:
+        _pool_lock, _pool_loop, _pool = asyncio.Lock(), loop, None
+    async with _pool_lock:
+        if _pool is None:
+            import aiomysql
+            _pool = await aiomysql.create_pool(
+                host=_cfg.MYSQL_HOST, port=int(_cfg.MYSQL_PORT), user=_cfg.MYSQL_USER, password=_cfg.MYSQL_PASS,
+                db=_cfg.MYSQL_DB, charset="utf8mb4", autocommit=True, minsize=0, maxsize=POOL_SIZE,
+                pool_recycle=MAX_LIFETIME, cursorclass=aiomysql.DictCursor,
+                connect_timeout=int(getattr(_cfg, "MYSQL_CONNECT_TIMEOUT", 5) or 5))
+    return _pool
+
+async def _fetchone(sql: str, args: Sequence[Any]) -> Optional[Dict[str, Any]]:
+    pool = await _get_pool()
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await cur.execute(sql, args)
+        return await cur.fetchone()
+
+async def fetchone(sql: str, args: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+    import pymysql
+    br = breaker.get("mysql")
+    br.before()
+    timeout = deadline.timeout(QUERY_TIMEOUT)
+    try:
+        row = await asyncio.wait_for(_fetchone(sql, args), timeout)
+    except asyncio.TimeoutError as e:
+        br.failure()
+        raise TimeoutError("mysql query timeout") from e
+    except pymysql.err.OperationalError:        # aiomysql 复用 PyMySQL 的异常类型
+        br.failure(); raise
+    br.success()
+    return row
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+协程 HTTP 客户端（ASGI 模式用）
+- 装有 httpx 时：每个上游一个 httpx.AsyncHTTPTransport 连接池（keep-alive，上限 ASYNC_HTTP_POOL_SIZE），
+  直接经传输层发送，不使用 httpx 客户端的 Cookie 罐（各用户的禅道会话 Cookie 互不串用）
+- 未安装 httpx 时：在线程池中用 http_client 的同步 Session 发送，接口与行为一致
+- 与同步客户端相同：同名熔断器（breaker）、请求剩余预算（deadline）、耗时钩子（http_client.add_hook）
+- 连接错误抛 ConnectionError，超时抛 TimeoutError（均为 OSError，调用方按网络错误处理）
+- 不重试；follow_redirects=True 时手动跟随（最多 5 次），跳转间携带已收到的 Cookie
+"""
+import os, json, time, asyncio, importlib.util
+from http.cookies import SimpleCookie
+from typing import Any, Dict, List, Optional
+from urllib.parse import urljoin
+import config as _cfg
+from . import breaker, deadline, http_client
+
+POOL_SIZE = int(getattr(_cfg, "ASYNC_HTTP_POOL_SIZE", 100) or 100)
+NATIVE    = importlib.util.find_spec("httpx") is not None       # httpx 在首次请求时才导入
+MAX_REDIRECTS = 5
+
+class Response:
+    __slots__ = ("status_code", "headers", "set_cookies", "content")
+
+    def __init__(self, status_code: int, headers: Dict[str, str], set_cookies: List[str], content: bytes):
+        self.status_code, self.headers, self.set_cookies, self.content = status_code, headers, set_cookies, content
+
+    def json(self) -> Any:
+        return json.loads(self.content or b"null")
+
+    @property
+    def cookies(self) -> Dict[str, str]:
+        jar: Dict[str, str] = {}
+        for sc in self.set_cookies:
+            c = SimpleCookie()
+            try: c.load(sc)
+            except Exception: continue
+            jar.update({k: m.value for k, m in c.items()})
+        return jar
+
+# ---- httpx 传输层（每个事件循环各自一组） ----
+_transports: Dict[str, Any] = {}
+_loop_id = [0, 0]        # [pid, id(loop)]
+
+def _transport(name: str):
+    import httpx
+    key = [os.getpid(), id(asyncio.get_running_loop())]
+    if _loop_id != key:
+        _transports.clear(); _loop_id[:] = key
+    t = _transports.get(name)
+    if t is None:
+        t = _transports[name] = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE), retries=0)
+    return t
+
+async def _send_native(name: str, method: str, url: str, headers: Dict[str, str], params, body, timeout) -> Response:
+    import httpx
+    req = httpx.Request(method, url, params=params, headers=headers, json=body,
+                        extensions={"timeout": httpx.Timeout(timeout).as_dict()})
+    try:
+        resp = await _transport(name).handle_async_request(req)
+        try:
+            content = await resp.aread()
+        finally:
+            await resp.aclose()
+    except httpx.TimeoutException as e:
+        raise TimeoutError(f"{name} {method} timeout: {e}") from e
+    except httpx.TransportError as e:
+        raise ConnectionError(f"{name} {method} failed: {e}") from e
+    return Response(resp.status_code, {k.lower(): v for k, v in resp.headers.items()},
+                    resp.headers.get_list("set-cookie"), content)
+
+def _send_threaded(name: str, method: str, url: str, headers: Dict[str, str], params, body, timeout) -> Response:
+    from requests import RequestException, Timeout
+    s = http_client.client(name).isolated_session(guarded=False)
+    try:
+        r = s.request(method, url, headers=headers, params=params, json=body, timeout=timeout, allow_redirects=False)
+    except Timeout as e:
+        raise TimeoutError(str(e)) from e
+    except RequestException as e:
+        raise ConnectionError(str(e)) from e
+    return Response(r.status_code, {k.lower(): v for k, v in r.headers.items()},
+                    r.raw.headers.getlist("Set-Cookie"), r.content)
+
+async def request(name: str, method: str, url: str, *, headers: Optional[Dict[str, str]] = None,
+                  params: Optional[Dict[str, Any]] = None, json: Any = None, timeout: float = 10.0,
+                  cookies: Optional[Dict[str, str]] = None, follow_redirects: bool = False) -> Response:
+    method = method.upper()
+    headers = dict(headers or {})
+    jar = dict(cookies or {})
+    seen: List[str] = []
+    for _ in range(MAX_REDIRECTS + 1):
+        if jar: headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in jar.items())
+        resp = await _send(name, method, url, headers, params, json, timeout)
+        seen += resp.set_cookies; jar.update(resp.cookies)
+        loc = resp.headers.get("location")
+        if not (follow_redirects and loc and resp.status_code in (301, 302, 303, 307, 308)):
+            break
+        url, params = urljoin(url, loc), None
+        if resp.status_code == 303: method, json = "GET", None
+    resp.set_cookies = seen                 # 跳转链上收到的全部 Set-Cookie
+    return resp
+
+async def _send(name: str, method: str, url: str, headers, params, body, timeout) -> Response:
+    br = breaker.get(name)
+    br.before()
+    t = deadline.timeout(timeout)
+    t0 = time.perf_counter()
+    try:
+        if NATIVE:
+            resp = await _send_native(name, method, url, headers, params, body, t)
+        else:
+            resp = await asyncio.to_thread(_send_threaded, name, method, url, headers, params, body, t)
+    except OSError:
+        br.failure()
+        http_client._emit(name, method, url, 0, time.perf_counter() - t0, 0)
+        raise
+    http_client._emit(name, method, url, resp.status_code, time.perf_counter() - t0, 0)
+    if resp.status_code >= 500: br.failure()
+    else: br.success()
+    return resp
@@ -1,28 +1,125 @@
 # -*- coding: utf-8 -*-
 """
 账号绑定存储：ding_uid -> zentao_account
+- bindings.json 为快照，bindings.json.log 为追加日志（每行一条 JSON）
+- 进程内保存字典，仅在快照或日志变化（stat）时增量刷新，查找 O(1)
+- 写入为追加一行，O(1)；日志超过 BIND_COMPACT_EVERY 行时合并回快照
+- 跨进程互斥使用 fcntl 文件锁（.lock），线程间使用 threading.Lock
 """
-import json, os, threading
-_PATH = "bindings.json"
+import json, os, threading, fcntl
+from contextlib import contextmanager
+import config as _cfg
+
+_PATH = getattr(_cfg, "BIND_FILE", "bindings.json") or "bindings.json"
+COMPACT_EVERY = int(getattr(_cfg, "BIND_COMPACT_EVERY", 1000) or 1000)
 _LOCK = threading.Lock()
 
-def get_all():
-    if not os.path.exists(_PATH):
-        return {}
-    with _LOCK, open(_PATH, "r", encoding="utf-8") as f:
+_data = {}
+_snap_sig = None     # 快照 (inode, mtime_ns, size)
+_log_off = 0         # 已读取的日志偏移
+_log_lines = 0       # 日志行数（用于判断是否合并）
+
+def _log_path() -> str: return _PATH + ".log"
+
+@contextmanager
+def _flock(exclusive: bool):
+    with open(_PATH + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
         try:
-            return json.load(f) or {}
-        except Exception:
-            return {}
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
 
-def save_all(data: dict):
-    with _LOCK, open(_PATH, "w", encoding="utf-8") as f:
+def _sig(path: str):
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+def _read_log(off: int):
+    """从 off 处读取完整行，返回 (新偏移, 行数)；末尾未写完的半行留待下次。"""
+    n = 0
+    try:
+        with open(_log_path(), "rb") as f:
+            f.seek(off)
+            for line in f:
+                if not line.endswith(b"\n"): break
+                off += len(line); n += 1
+                try:
+                    k, v = json.loads(line)
+                    _data[k] = v
+                except Exception:
+                    pass
+    except FileNotFoundError:
+        pass
+    return off, n
+
+def _reload(locked: bool = False):
+    global _data, _snap_sig, _log_off, _log_lines
+    if not locked:
+        with _flock(False): return _reload(True)
+    sig = _sig(_PATH)
+    data = {}
+    if sig:
+        with open(_PATH, "r", encoding="utf-8") as f:
+            try:
+                data = json.load(f) or {}
+            except Exception:
+                data = {}
+    _data, _snap_sig = data, sig
+    _log_off, _log_lines = _read_log(0)
+
+def _refresh(locked: bool = False):
+    """调用方持有 _LOCK；locked 表示已持有文件锁。"""
+    global _log_off, _log_lines
+    if _sig(_PATH) != _snap_sig:
+        _reload(locked); return
+    log = _sig(_log_path())
+    size = log[2] if log else 0
+    if size < _log_off:          # 日志被其他进程合并截断
+        _reload(locked)
+    elif size > _log_off:
+        _log_off, n = _read_log(_log_off); _log_lines += n
+
+def _write_snapshot(data: dict):
+    tmp = f"{_PATH}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, _PATH)
+
+def _compact():
+    """调用方持有 _LOCK 与排他文件锁：快照落盘后截断日志。"""
+    global _snap_sig, _log_off, _log_lines
+    _write_snapshot(_data)
+    open(_log_path(), "w").close()
+    _snap_sig, _log_off, _log_lines = _sig(_PATH), 0, 0
+
+def get_all():
+    with _LOCK:
+        _refresh()
+        return dict(_data)
+
+def save_all(data: dict):
+    global _data
+    with _LOCK, _flock(True):
+        _data = dict(data)
+        _compact()
 
 def get(ding_uid: str) -> str:
-    return get_all().get(ding_uid, "")
+    with _LOCK:
+        _refresh()
+        return _data.get(ding_uid, "")
 
 def put(ding_uid: str, account: str):
-    data = get_all()
-    data[ding_uid] = account
-    save_all(data)
+    global _log_off, _log_lines
+    with _LOCK, _flock(True):
+        _refresh(True)   # 先追上其他进程的写入，保证偏移与合并基于最新数据
+        if _data.get(ding_uid) == account: return
+        line = (json.dumps([ding_uid, account], ensure_ascii=False) + "\n").encode("utf-8")
+        with open(_log_path(), "ab") as f:
+            f.write(line)
+        _data[ding_uid] = account
+        _log_off += len(line); _log_lines += 1
+        if _log_lines >= COMPACT_EVERY:
+            _compact()
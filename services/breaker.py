@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+上游熔断器（dingtalk / zentao / mysql，各一个，进程内）
+- closed：正常放行；连续失败 BREAKER_FAILURES 次后打开
+- open：BREAKER_OPEN_SECONDS 内直接抛 CircuitOpen，不占用线程等待超时
+- half_open：冷却结束后只放行一个探测请求，成功则关闭，失败则重新打开；探测期间其余请求仍快速失败
+失败 = 连接错误 / 超时 / 5xx（由调用方 success() / failure() 上报）；4xx 说明上游在正常应答，按成功计。
+每个 worker 独立判断（几次失败即可打开），无需跨进程共享。
+"""
+import time, threading
+from contextlib import contextmanager
+from typing import Dict, Tuple, Type
+import config as _cfg
+
+FAILURES     = int(getattr(_cfg, "BREAKER_FAILURES", 5) or 5)
+OPEN_SECONDS = float(getattr(_cfg, "BREAKER_OPEN_SECONDS", 15) or 15)
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+class CircuitOpen(RuntimeError):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} unavailable (circuit open)")
+        self.name, self.retry_after = name, retry_after
+
+class Breaker:
+    def __init__(self, name: str, failures: int = FAILURES, open_seconds: float = OPEN_SECONDS):
+        self.name, self.failures, self.open_seconds = name, failures, open_seconds
+        self._lock = threading.Lock()
+        self.state, self._fails, self._opened, self._probe_at = CLOSED, 0, 0.0, 0.0
+        self.rejected = 0
+
+    def before(self):
+        """调用前检查；打开状态抛 CircuitOpen，半开时只让一个调用通过。"""
+        if self.state == CLOSED: return
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self._opened >= self.open_seconds:
+                self.state, self._probe_at = HALF_OPEN, now
+                return                                  # 本次调用即探测
+            if self.state == HALF_OPEN and now - self._probe_at >= self.open_seconds:
+                self._probe_at = now                    # 上一个探测迟迟未上报，换一个
+                return
+            if self.state == CLOSED: return
+            self.rejected += 1
+            wait = self.open_seconds - (now - self._opened) if self.state == OPEN else self.open_seconds
+            raise CircuitOpen(self.name, max(wait, 1.0))
+
+    def success(self):
+        if self.state == CLOSED and not self._fails: return
+        with self._lock:
+            self.state, self._fails = CLOSED, 0
+
+    def failure(self):
+        with self._lock:
+            self._fails += 1
+            if self.state == HALF_OPEN or self._fails >= self.failures:
+                self.state, self._opened = OPEN, time.monotonic()
+
+    @contextmanager
+    def guard(self, errors: Tuple[Type[BaseException], ...] = (Exception,)):
+        """with b.guard((OSError,)): ... —— errors 内的异常记失败，正常结束记成功。"""
+        self.before()
+        try:
+            yield
+        except errors:
+            self.failure(); raise
+        except BaseException:
+            self.success(); raise               # 业务异常不代表上游故障
+        else:
+            self.success()
+
+_breakers: Dict[str, Breaker] = {}
+_lock = threading.Lock()
+
+def get(name: str) -> Breaker:
+    b = _breakers.get(name)
+    if b is None:
+        with _lock:
+            b = _breakers.get(name) or _breakers.setdefault(name, Breaker(name))
+    return b
+
+def stats() -> Dict[str, Dict[str, object]]:
+    return {n: {"state": b.state, "state_name": _NAMES[b.state], "rejected": b.rejected}
+            for n, b in _breakers.items()}
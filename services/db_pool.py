@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+MySQL 连接池（PyMySQL）
+- 有界、线程安全：每个 worker 进程最多 size 条连接，取不到时排队等待
+- fork 安全：检测到 pid 变化时丢弃继承来的连接（只关本进程 fd，不发 QUIT）
+- 取出时健康检查：空闲超过 DB_POOL_PING_AFTER 秒先 ping
+- 回收：空闲超过 DB_POOL_MAX_IDLE 或存活超过 DB_POOL_MAX_LIFETIME 的连接关闭重建
+- 统计：stats() 返回创建/复用/等待次数与等待耗时
+- 请求预算：排队等待与借出期间的读写超时都不超过请求剩余预算（见 deadline）
+- 熔断：连接 / 查询出现 OperationalError 记入 "mysql" 熔断器，打开期间直接抛 CircuitOpen
+池大小默认取 gunicorn threads（见 gunicorn.conf.py post_fork），
+MySQL 侧总连接上限约为 workers × threads。
+"""
+import os, time, threading, logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Any
+import pymysql
+import config as _cfg
+from . import breaker, deadline
+
+POOL_SIZE     = int(getattr(_cfg, "DB_POOL_SIZE", 0) or 0)               # 0 = 按 gunicorn threads
+MAX_IDLE      = float(getattr(_cfg, "DB_POOL_MAX_IDLE", 300) or 300)     # 秒
+MAX_LIFETIME  = float(getattr(_cfg, "DB_POOL_MAX_LIFETIME", 3600) or 3600)
+PING_AFTER    = float(getattr(_cfg, "DB_POOL_PING_AFTER", 30) or 0)      # 空闲多久后取出时 ping
+WAIT_TIMEOUT  = float(getattr(_cfg, "DB_POOL_WAIT_TIMEOUT", 10) or 10)   # 排队等待上限
+
+class PoolTimeout(pymysql.err.OperationalError):
+    """等待空闲连接超时。"""
+
+def _default_size() -> int:
+    return POOL_SIZE or int(os.getenv("GUNICORN_THREADS", "0") or 0) or 4
+
+class Pool:
+    def __init__(self, connect: Callable[[], Any], size: int = 0):
+        self._connect = connect
+        self.size = size or _default_size()
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = deque()     # (conn, created, last_used)，后进先出
+        self._open = 0
+        self._stats = {"created": 0, "reused": 0, "recycled": 0, "broken": 0,
+                       "waits": 0, "wait_seconds": 0.0, "wait_max": 0.0, "timeouts": 0}
+
+    def _check_fork(self):
+        if self._pid == os.getpid(): return
+        for conn, _, _ in self._idle:
+            try: conn._force_close()
+            except Exception: pass
+        self._reset()
+
+    def _discard(self, conn, key: str):
+        self._open -= 1; self._stats[key] += 1
+        try: conn.close()
+        except Exception: pass
+
+    def _take(self, timeout: float):
+        """持锁取一条空闲连接 (conn, created, used)，或占用一个新建名额 (None, 0, 0)。"""
+        deadline = None
+        with self._cond:
+            self._check_fork()
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    conn, created, used = self._idle.pop()
+                    if now - created > MAX_LIFETIME or now - used > MAX_IDLE:
+                        self._discard(conn, "recycled"); continue
+                    return conn, created, used
+                if self._open < self.size:
+                    self._open += 1
+                    return None, 0.0, 0.0
+                if deadline is None:
+                    deadline = now + timeout; self._stats["waits"] += 1
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(2013, f"db pool exhausted (size={self.size})")
+                t0 = time.monotonic()
+                self._cond.wait(remaining)
+                waited = time.monotonic() - t0
+                self._stats["wait_seconds"] += waited
+                self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+
+    def acquire(self, timeout: float = WAIT_TIMEOUT):
+        while True:
+            conn, created, used = self._take(timeout)
+            if conn is None: break
+            if PING_AFTER and time.monotonic() - used > PING_AFTER:
+                try:
+                    conn.ping(reconnect=False)      # 锁外 ping，不阻塞其他线程
+                except Exception:
+                    with self._cond:
+                        self._discard(conn, "broken"); self._cond.notify()
+                    continue
+            with self._cond:
+                self._stats["reused"] += 1
+            return conn, created
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1; self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return conn, time.monotonic()
+
+    def release(self, conn, created: float, broken: bool = False):
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if broken or not conn.open:
+                self._discard(conn, "broken")
+            else:
+                self._idle.append((conn, created, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        br = breaker.get("mysql")
+        br.before()
+        left = deadline.timeout(None)
+        try:
+            conn, created = self.acquire(min(WAIT_TIMEOUT, left) if left else WAIT_TIMEOUT)
+        except PoolTimeout:
+            raise                    # 本进程排队，不算上游故障
+        except pymysql.err.OperationalError:
+            br.failure(); raise
+        saved = None
+        if left and hasattr(conn, "_read_timeout"):
+            # PyMySQL 每次读写前按这两个属性设置 socket 超时；归还时恢复
+            saved = conn._read_timeout, conn._write_timeout
+            conn._read_timeout = conn._write_timeout = max(deadline.remaining() or 0, deadline.MIN_TIMEOUT)
+        broken = False
+        try:
+            yield conn
+        except pymysql.err.OperationalError:
+            broken = True
+            br.failure()
+            raise
+        except Exception:
+            try: conn.rollback()     # 可能处于显式事务中
+            except Exception: broken = True
+            raise
+        else:
+            br.success()
+        finally:
+            if saved is not None:
+                conn._read_timeout, conn._write_timeout = saved
+            self.release(conn, created, broken)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self._stats, size=self.size, open=self._open, idle=len(self._idle))
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn, "recycled")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(connect: Callable[[], Any]) -> Pool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = Pool(connect)
+                logging.info("db pool size=%d pid=%d", _pool.size, os.getpid())
+    return _pool
+
+def stats() -> Dict[str, Any]:
+    return _pool.stats() if _pool else {}
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+请求级时间预算
+- app 在请求开始时 start(REQUEST_DEADLINE)，结束时 clear()；值存在 contextvar 中，只对当前请求线程生效
+  （后台线程 / 线程池不继承，沿用各调用自身的超时）
+- timeout(default)：下游调用用它代替固定超时，取 min(default, 剩余预算)；预算耗尽时直接抛 DeadlineExceeded
+  支持 requests 的 (connect, read) 元组
+- 整条回调链（钉钉换 token、取用户、MySQL、中继 apilogin）共享同一个截止时间，任何一环变慢都不会让总耗时超过预算
+"""
+import time, contextvars
+from typing import Optional, Tuple, Union
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar("deadline", default=None)
+
+MIN_TIMEOUT = 0.05      # 剩余不足该值视为已超时，不再发起调用
+
+class DeadlineExceeded(TimeoutError):
+    """本请求的时间预算已用完。"""
+
+def start(seconds: float):
+    _deadline.set(time.monotonic() + seconds if seconds and seconds > 0 else None)
+
+def clear():
+    _deadline.set(None)
+
+def remaining() -> Optional[float]:
+    """剩余秒数；未设置预算时返回 None。"""
+    d = _deadline.get()
+    return None if d is None else d - time.monotonic()
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left < MIN_TIMEOUT
+
+Timeout = Union[None, float, Tuple[float, float]]
+
+def timeout(default: Timeout = None) -> Timeout:
+    left = remaining()
+    if left is None: return default
+    if left < MIN_TIMEOUT:
+        raise DeadlineExceeded("request deadline exceeded")
+    if default is None: return left
+    if isinstance(default, tuple):
+        return tuple(min(t, left) if t else left for t in default)
+    return min(default, left)
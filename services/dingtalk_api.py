@@ -1,14 +1,37 @@
 # -*- coding: utf-8 -*-
-import requests
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from .http_client import client
+from . import aio_http
+from .token_cache import TokenManager
 
 BASE = "https://api.dingtalk.com/v1.0"
+OAPI = "https://oapi.dingtalk.com"
 
 from config import DT_APP_KEY, DT_APP_SECRET
 
+_http = client("dingtalk")   # keep-alive 连接池，避免每次调用重新 TLS 握手
+
+def _fetch_app_token():
+    resp = _http.post(f"{BASE}/oauth2/accessToken",
+                      json={"appKey": DT_APP_KEY, "appSecret": DT_APP_SECRET}, timeout=10)
+    data = resp.json()
+    return data.get("accessToken", ""), data.get("expireIn", 7200)
+
+_app_token = TokenManager("dingtalk_app", _fetch_app_token)
+
+def ping(timeout: float = 3.0):
+    """钉钉开放平台可达即可（< 500），供健康探测使用，不重试。"""
+    r = _http.get(f"{OAPI}/", timeout=timeout, allow_redirects=False, retries=0)
+    r.close()
+    if r.status_code >= 500: raise RuntimeError(f"HTTP {r.status_code}")
+
+def get_app_access_token() -> str:
+    """应用（企业内部应用）access_token：缓存至过期前，提前刷新，多 worker 共享"""
+    return _app_token.get()
+
 def get_user_access_token(auth_code: str) -> str:
     url = f"{BASE}/oauth2/userAccessToken"
-    resp = requests.post(url, json={
+    resp = _http.post(url, json={
         "clientId": DT_APP_KEY,
         "clientSecret": DT_APP_SECRET,
         "code": auth_code,
@@ -19,11 +42,61 @@ def get_user_access_token(auth_code: str) -> str:
 
 def get_user_me(access_token: str) -> Dict[str, Any]:
     url = f"{BASE}/contact/users/me"
-    resp = requests.get(url, headers={"x-acs-dingtalk-access-token": access_token}, timeout=10)
+    resp = _http.get(url, headers={"x-acs-dingtalk-access-token": access_token}, timeout=10)
     return resp.json()
 
-def list_users(access_token: str):
+# ---- 协程版（ASGI 模式回调使用） ----
+async def aget_user_access_token(auth_code: str) -> str:
+    resp = await aio_http.request("dingtalk", "POST", f"{BASE}/oauth2/userAccessToken", json={
+        "clientId": DT_APP_KEY,
+        "clientSecret": DT_APP_SECRET,
+        "code": auth_code,
+        "grantType": "authorization_code"
+    }, timeout=10)
+    return (resp.json() or {}).get("accessToken", "")
+
+async def aget_user_me(access_token: str) -> Dict[str, Any]:
+    resp = await aio_http.request("dingtalk", "GET", f"{BASE}/contact/users/me",
+                                  headers={"x-acs-dingtalk-access-token": access_token}, timeout=10)
+    return resp.json()
+
+def iter_pages(access_token: str, page_size: int = 100, token: Optional[str] = None
+               ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str], Dict[str, Any]]]:
+    """按页拉取通讯录用户（nextToken 游标），产出 (本页用户, 下一页游标, 原始响应)；可从 token 续拉。"""
     url = f"{BASE}/contact/users"
-    resp = requests.get(url, headers={"x-acs-dingtalk-access-token": access_token}, timeout=20)
+    headers = {"x-acs-dingtalk-access-token": access_token}
+    while True:
+        params = {"maxResults": page_size}
+        if token: params["nextToken"] = token
+        data = _http.get(url, headers=headers, params=params, timeout=20).json()
+        token = data.get("nextToken") or data.get("nextCursor")
+        if data.get("hasMore") is False: token = None
+        yield data.get("users", []) or [], token, data
+        if not token:
+            return
+
+def iter_users(access_token: str, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+    """逐个产出用户，不在内存中攒全量。"""
+    for users, _, _ in iter_pages(access_token, page_size):
+        yield from users
+
+def list_users(access_token: str):
+    return list(iter_users(access_token))
+
+def get_user(access_token: str, userid: str) -> Dict[str, Any]:
+    """按 userid 取用户详情（应用 access_token，旧版 topapi）"""
+    url = f"{OAPI}/topapi/v2/user/get"
+    resp = _http.post(url, params={"access_token": access_token}, json={"userid": userid}, timeout=10)
+    data = resp.json()
+    if data.get("errcode"):
+        raise RuntimeError(f"获取钉钉用户失败：{data}")
+    return data.get("result") or {}
+
+def count_users(access_token: str) -> int:
+    """企业员工总数（应用 access_token，旧版 topapi），用于同步进度估算"""
+    resp = _http.post(f"{OAPI}/topapi/user/count", params={"access_token": access_token},
+                      json={"only_active": False}, timeout=10)
     data = resp.json()
-    return data.get("users", []) or []
+    if data.get("errcode"):
+        raise RuntimeError(f"获取员工数失败：{data}")
+    return int((data.get("result") or {}).get("count") or 0)
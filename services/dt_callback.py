@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+钉钉 HTTP 事件回调验签与加解密（/dingtalk/event）
+- 推送格式：POST {"encrypt": "..."}，URL 带 msg_signature / timestamp / nonce
+- 签名：sha1(token、timestamp、nonce、encrypt 排序后拼接)，常量时间比较
+- 密文：AES-256-CBC，密钥 = base64(EVENT_AES_KEY + "=")，IV 取密钥前 16 字节，PKCS#7（块长 32）；
+  明文 = 16 字节随机串 + 4 字节网络序长度 + 消息 + 接收方（EVENT_OWNER_KEY，默认 DT_APP_KEY），接收方不符视为伪造
+- 回复须同样加密 "success" 并签名，否则钉钉判定推送失败并重试
+- AES 依赖 cryptography（pip install cryptography，首次解密时导入）；未安装或未配置 EVENT_TOKEN / EVENT_AES_KEY 时
+  ENABLED=False，加密回调一律拒绝
+"""
+import os, time, base64, hashlib, hmac, struct, secrets, importlib.util
+from typing import Dict
+import config as _cfg
+
+TOKEN   = os.getenv("EVENT_TOKEN") or getattr(_cfg, "EVENT_TOKEN", "") or ""
+AES_KEY = os.getenv("EVENT_AES_KEY") or getattr(_cfg, "EVENT_AES_KEY", "") or ""
+OWNER   = getattr(_cfg, "EVENT_OWNER_KEY", "") or getattr(_cfg, "DT_APP_KEY", "") or ""
+NATIVE  = importlib.util.find_spec("cryptography") is not None
+ENABLED = bool(TOKEN and AES_KEY and NATIVE)
+
+_BLOCK = 32
+
+class InvalidCallback(ValueError):
+    """签名不符、密文损坏或接收方不符。"""
+
+def _key() -> bytes:
+    return base64.b64decode(AES_KEY + "=")
+
+def _cipher():
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    key = _key()
+    return Cipher(algorithms.AES(key), modes.CBC(key[:16]))
+
+def sign(timestamp: str, nonce: str, encrypt: str) -> str:
+    return hashlib.sha1("".join(sorted([TOKEN, timestamp, nonce, encrypt])).encode()).hexdigest()
+
+def decrypt(signature: str, timestamp: str, nonce: str, encrypt: str) -> str:
+    """验签并解密，返回消息明文（JSON 字符串）；任何不符抛 InvalidCallback。"""
+    if not ENABLED:
+        raise InvalidCallback("event callback crypto not configured")
+    if not (signature and timestamp and nonce and encrypt):
+        raise InvalidCallback("missing signature parameters")
+    if not hmac.compare_digest(signature, sign(timestamp, nonce, encrypt)):
+        raise InvalidCallback("bad signature")
+    try:
+        d = _cipher().decryptor()
+        plain = d.update(base64.b64decode(encrypt)) + d.finalize()
+        pad = plain[-1]
+        if not 1 <= pad <= _BLOCK: raise ValueError("bad padding")
+        body = plain[16:-pad]
+        n = struct.unpack(">I", body[:4])[0]
+        msg, owner = body[4:4 + n], body[4 + n:].decode()
+        text = msg.decode()
+    except Exception as e:
+        raise InvalidCallback(f"bad ciphertext: {e}") from None
+    if OWNER and owner != OWNER:
+        raise InvalidCallback("receiver mismatch")
+    return text
+
+def encrypt(msg: str) -> str:
+    raw = msg.encode()
+    plain = secrets.token_bytes(16) + struct.pack(">I", len(raw)) + raw + OWNER.encode()
+    pad = _BLOCK - len(plain) % _BLOCK
+    e = _cipher().encryptor()
+    return base64.b64encode(e.update(plain + bytes([pad]) * pad) + e.finalize()).decode()
+
+def reply(msg: str = "success") -> Dict[str, str]:
+    """加密回复体：{"msg_signature", "timeStamp", "nonce", "encrypt"}。"""
+    ts, nonce = str(int(time.time() * 1000)), secrets.token_hex(8)
+    enc = encrypt(msg)
+    return {"msg_signature": sign(ts, nonce, enc), "timeStamp": ts, "nonce": nonce, "encrypt": enc}
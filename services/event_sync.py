@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+通讯录事件增量同步
+- parse(payload)：解析钉钉通讯录事件（user_add_org / user_modify_org / user_leave_org / org_dept_*）
+- enqueue()：写入本地 SQLite 队列（多 worker 共享），同一用户的多次事件按主键合并为一条
+- 后台线程：只取安静超过 EVENT_COALESCE_WINDOW 秒的条目，按批租用（owner / claimed_at）后经 zentao_api 应用；
+  成功后才删除，失败退回队列重试；worker 被杀 / 重启时租约（EVENT_LEASE 秒）到期后由其他 worker 重新认领
+HTTP 处理只做解析 + 一次 upsert，毫秒级返回；同步成本为 O(变更用户数)。
+"""
+import os, json, time, uuid, sqlite3, logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import config as _cfg
+from mapping import ACCOUNT_MAP, DEPT_MAP
+from . import zentao_api, provisioning, sqlite_local
+from .bind_store import get as bind_get
+
+_PATH        = getattr(_cfg, "EVENT_QUEUE_DB", "/tmp/dt_events.db") or "/tmp/dt_events.db"
+WINDOW       = float(getattr(_cfg, "EVENT_COALESCE_WINDOW", 5) or 0)     # 合并窗口（秒）
+BATCH        = int(getattr(_cfg, "EVENT_BATCH_SIZE", 200) or 200)
+POLL_EVERY   = float(getattr(_cfg, "EVENT_POLL_INTERVAL", 1) or 1)
+MAX_ATTEMPTS = int(getattr(_cfg, "EVENT_MAX_ATTEMPTS", 5) or 5)
+LEASE        = float(getattr(_cfg, "EVENT_LEASE", 300) or 300)           # 认领后未完成的最长时间（秒）
+LEAVE_ACTION = getattr(_cfg, "EVENT_LEAVE_ACTION", "ignore")            # ignore / delete（软删除）
+
+_USER_EVENTS = {"user_add_org": "add", "user_modify_org": "modify", "user_leave_org": "leave",
+                "user_active_org": "modify"}
+_DEPT_PREFIX = "org_dept_"
+
+_token_provider: Optional[Callable[[], str]] = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    key        TEXT PRIMARY KEY,      -- 用户 ID 或 dept:<部门 ID>
+    kind       TEXT NOT NULL,
+    payload    TEXT,
+    first_seen REAL NOT NULL,
+    last_seen  REAL NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    owner      TEXT,                  -- 认领者；NULL 表示待处理
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_events_last ON events(last_seen);
+"""
+
+def _migrate(c: sqlite3.Connection):
+    """旧版队列库补齐租约列。"""
+    cols = {r[1] for r in c.execute("PRAGMA table_info(events)")}
+    for col, typ in (("owner", "TEXT"), ("claimed_at", "REAL")):
+        if col not in cols:
+            try: c.execute(f"ALTER TABLE events ADD COLUMN {col} {typ}")
+            except sqlite3.OperationalError: pass       # 其他 worker 已添加
+
+def _conn() -> sqlite3.Connection:
+    return sqlite_local.connect(_PATH, _SCHEMA, migrate=_migrate)
+
+def set_token_provider(fn: Callable[[], str]):
+    """提供钉钉应用 access_token，用于新增/修改事件拉取用户详情。"""
+    global _token_provider
+    _token_provider = fn
+
+# ---- 解析 ----
+def _ids(v) -> List[str]:
+    if v is None: return []
+    if isinstance(v, (list, tuple)): return [str(x) for x in v if x]
+    return [str(v)]
+
+def parse(payload: Dict[str, Any]) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """返回 [(key, kind, payload), ...]；兼容 {EventType, UserId: [...]} 与 {headers: {eventType}, data} 两种格式。"""
+    if not isinstance(payload, dict): return []
+    etype = payload.get("EventType") or payload.get("eventType") or (payload.get("headers") or {}).get("eventType") or ""
+    body = payload.get("data", payload)
+    if isinstance(body, str):
+        try: body = json.loads(body)
+        except Exception: body = {}
+    body = body if isinstance(body, dict) else {}
+    if etype in _USER_EVENTS:
+        kind = _USER_EVENTS[etype]
+        uids = _ids(body.get("UserId") or body.get("userId") or body.get("userIds"))
+        extra = {k: body[k] for k in ("name", "deptId", "departmentId") if k in body}
+        return [(uid, kind, extra) for uid in uids]
+    if etype.startswith(_DEPT_PREFIX):
+        return [(f"dept:{d}", "dept", {"event": etype})
+                for d in _ids(body.get("DeptId") or body.get("deptId"))]
+    return []
+
+# ---- 入队（合并） ----
+def enqueue(items: List[Tuple[str, str, Dict[str, Any]]]) -> int:
+    if not items: return 0
+    now = time.time()
+    rows = [(k, kind, json.dumps(p, ensure_ascii=False), now, now) for k, kind, p in items]
+    _conn().executemany(
+        "INSERT INTO events(key,kind,payload,first_seen,last_seen) VALUES (?,?,?,?,?) "
+        "ON CONFLICT(key) DO UPDATE SET kind=excluded.kind, payload=excluded.payload, "
+        "last_seen=excluded.last_seen", rows)      # 以最后一次事件为准（新增/修改均为 upsert）
+    start_worker()
+    return len(rows)
+
+def pending() -> int:
+    return _conn().execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+# ---- 认领 / 完成 / 退回 ----
+def _claim(n: int) -> Tuple[str, List[Tuple[str, str, Dict[str, Any], int]], Dict[str, float]]:
+    """
+    原子租用最多 n 条安静期已过的事件（BEGIN IMMEDIATE 保证多 worker 不重复取），返回 (owner, 条目, {key: last_seen})。
+    租约过期的条目（认领者中途退出）计一次失败后重新认领，超过 EVENT_MAX_ATTEMPTS 丢弃。
+    """
+    c = _conn()
+    owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()     # 持续有事件的用户最多延迟 10 个窗口
+        stale = c.execute("SELECT key, attempts FROM events WHERE owner IS NOT NULL AND claimed_at<=?",
+                          (now - LEASE,)).fetchall()
+        for k, att in stale:
+            logging.warning("event %s lease expired, reclaim (attempt %d)", k, att + 1)
+            if att + 1 >= MAX_ATTEMPTS:
+                logging.error("event %s dropped after %d attempts", k, att + 1)
+                c.execute("DELETE FROM events WHERE key=?", (k,))
+            else:
+                c.execute("UPDATE events SET owner=NULL, claimed_at=NULL, attempts=? WHERE key=?", (att + 1, k))
+        rows = c.execute("SELECT key, kind, payload, attempts, last_seen FROM events "
+                         "WHERE owner IS NULL AND (last_seen<=? OR first_seen<=?) "
+                         "ORDER BY last_seen LIMIT ?", (now - WINDOW, now - 10 * WINDOW, n)).fetchall()
+        if rows:
+            c.executemany("UPDATE events SET owner=?, claimed_at=? WHERE key=?", [(owner, now, r[0]) for r in rows])
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK"); raise
+    return (owner, [(k, kind, json.loads(p or "{}"), att) for k, kind, p, att, _ in rows],
+            {r[0]: r[4] for r in rows})
+
+def _done(owner: str, seen: Dict[str, float]):
+    """应用成功后删除；处理期间又有新事件（last_seen 变化）的只释放租约，稍后再处理。"""
+    c = _conn()
+    c.executemany("DELETE FROM events WHERE key=? AND owner=? AND last_seen=?",
+                  [(k, owner, ts) for k, ts in seen.items()])
+    c.executemany("UPDATE events SET owner=NULL, claimed_at=NULL WHERE key=? AND owner=?",
+                  [(k, owner) for k in seen])
+
+def _requeue(owner: str, items):
+    """失败退回（释放租约并计数）；期间到达的新事件已合并进同一行。"""
+    now = time.time()
+    c = _conn()
+    for k, _, _, att in items:
+        if att + 1 >= MAX_ATTEMPTS:
+            logging.error("event %s dropped after %d attempts", k, att + 1)
+            c.execute("DELETE FROM events WHERE key=? AND owner=?", (k, owner))
+        else:
+            c.execute("UPDATE events SET owner=NULL, claimed_at=NULL, attempts=?, last_seen=? "
+                      "WHERE key=? AND owner=?", (att + 1, now, k, owner))
+
+# ---- 应用 ----
+def _account_of(uid: str) -> str:
+    return ACCOUNT_MAP.get(uid) or bind_get(uid) or uid
+
+def _fields(uid: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    info = dict(payload)
+    if _token_provider:
+        from . import dingtalk_api
+        try:
+            info.update(dingtalk_api.get_user(_token_provider(), uid) or {})
+        except Exception:
+            logging.warning("fetch dingtalk user %s failed", uid, exc_info=True)
+    raw_dept = info.get("departmentId") or info.get("deptId") or (info.get("dept_id_list") or [None])[0]
+    fields = {"role": "pm"}
+    if info.get("name"): fields["realname"] = info["name"]
+    if raw_dept in DEPT_MAP: fields["dept"] = DEPT_MAP[raw_dept]
+    return fields
+
+def apply_batch(items) -> Dict[str, int]:
+    report = {"created": 0, "updated": 0, "left": 0, "dept": 0, "skipped": 0, "failed": 0}
+    upserts, leaves = [], []
+    for uid, kind, payload, _ in items:
+        if kind == "dept":
+            report["dept"] += 1        # 禅道部门按 DEPT_MAP 静态映射，部门事件仅记录
+            logging.info("dept event %s: %s", uid, payload.get("event"))
+        elif kind == "leave":
+            leaves.append(_account_of(uid))
+        else:
+            upserts.append((_account_of(uid), _fields(uid, payload)))
+    if zentao_api.ZENTAO_CREATE_MODE != "mysql":
+        for account, fields in upserts:
+            if zentao_api.user_exists(account): report["skipped"] += 1; continue
+            ret = zentao_api.create_user(account, fields)
+            report["created" if ret.get("ok") else "failed"] += 1
+        report["skipped"] += len(leaves)
+        return report
+    if upserts:
+        have = zentao_api.accounts_exist([a for a, _ in upserts])
+        new = [(a, f) for a, f in upserts if a not in have]
+        old = [(a, f) for a, f in upserts if a in have]
+        r = zentao_api.create_users_bulk(new)
+        report["created"] += r["created"]; report["skipped"] += r["skipped"]; report["failed"] += r["failed"]
+        report["updated"] += zentao_api.update_users(old)
+    if leaves:
+        if LEAVE_ACTION == "delete":
+            report["left"] += zentao_api.deactivate_users(leaves)
+            for a in leaves: provisioning.forget(a)       # 复职后重新配权
+        else:
+            report["skipped"] += len(leaves)
+    return report
+
+def run_once() -> Optional[Dict[str, int]]:
+    owner, items, seen = _claim(BATCH)
+    if not items: return None
+    try:
+        report = apply_batch(items)
+    except Exception:
+        logging.exception("event batch failed, requeue %d", len(items))
+        _requeue(owner, items)
+        return None
+    _done(owner, seen)
+    logging.info("event batch applied (%d): %s", len(items), report)
+    return report
+
+def _loop():
+    while True:
+        try:
+            while run_once(): pass
+        except Exception:
+            logging.exception("event worker failed")
+        time.sleep(POLL_EVERY)
+
+def start_worker():
+    sqlite_local.start_thread("event-sync", _loop)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+依赖健康探测（每个 worker 一个后台线程）
+- register(name, fn, required=True)：fn() 正常返回即健康，抛异常即不健康
+- 后台线程每 HEALTH_INTERVAL 秒依次执行全部探测，结果（ok / 耗时 / 时间戳 / 错误）写入进程内缓存
+- snapshot()：只读缓存，O(1)，不访问任何上游；/health?deep=1 用它返回就绪状态
+- 超过 HEALTH_STALE 秒未更新的结果视为不健康（探测线程卡住 / 退出时不会一直报告旧结果）
+探测经过共享 HTTP 客户端与连接池，因此同样受熔断器约束：熔断打开时探测立即失败。
+"""
+import os, time, logging, threading
+from typing import Any, Callable, Dict, List, Tuple
+import config as _cfg
+
+INTERVAL = float(getattr(_cfg, "HEALTH_INTERVAL", 10) or 10)
+STALE    = float(getattr(_cfg, "HEALTH_STALE", 0) or 0) or INTERVAL * 3
+
+_checks: List[Tuple[str, Callable[[], Any], bool]] = []
+_results: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+_thread_pid = 0
+
+def register(name: str, fn: Callable[[], Any], required: bool = True):
+    _checks.append((name, fn, required))
+
+def run_once():
+    for name, fn, _ in _checks:
+        t0 = time.perf_counter()
+        try:
+            fn()
+            res = {"ok": True}
+        except Exception as e:
+            res = {"ok": False, "error": f"{type(e).__name__}: {e}"[:200]}
+            logging.warning("health check %s failed: %s", name, res["error"])
+        res["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        res["ts"] = time.time()
+        _results[name] = res                       # 整体替换，读者无需加锁
+
+def _loop():
+    while True:
+        try: run_once()
+        except Exception: logging.exception("health probe loop failed")
+        time.sleep(INTERVAL)
+
+def start():
+    """启动本进程的探测线程（fork 后按 pid 重新启动）。"""
+    global _thread_pid
+    if _thread_pid == os.getpid() or not _checks: return
+    with _lock:
+        if _thread_pid == os.getpid(): return
+        _thread_pid = os.getpid()
+        _results.clear()
+        threading.Thread(target=_loop, name="health-probe", daemon=True).start()
+
+def snapshot() -> Dict[str, Any]:
+    start()
+    now = time.time()
+    checks, ready = {}, True
+    for name, _, required in _checks:
+        res = _results.get(name)
+        if res is None:
+            item = {"ok": False, "error": "pending"}
+        else:
+            item = dict(res, age=round(now - res["ts"], 1))
+            if item["age"] > STALE: item.update(ok=False, error="stale")
+        item["required"] = required
+        checks[name] = item
+        if required and not item["ok"]: ready = False
+    return {"ready": ready, "pid": os.getpid(), "checks": checks}
+
+def gauges() -> List[Tuple[str, Dict[str, str], float]]:
+    out = []
+    for name, res in list(_results.items()):
+        out.append(("health_up", {"check": name}, 1 if res.get("ok") else 0))
+        out.append(("health_probe_ms", {"check": name}, res.get("ms", 0)))
+    return out
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+共享 HTTP 客户端（requests.Session + HTTPAdapter 连接池，keep-alive）
+- client(name) 按名称返回单例；每个 worker 进程各自一个 Session（fork 后按 pid 重建）
+- 有限重试 + 抖动退避：GET 重试 5xx/429；POST 只重试 429/503（服务端明确未处理）
+- isolated_session()：独立 Cookie 的 Session，但复用同一连接池（用于按用户中继 Cookie）
+- add_hook(fn)：每次请求结束回调 fn(name, method, url, status, seconds, attempt)，status 为 0 表示异常
+- 每次发送前经过同名熔断器（breaker.get(name)），超时取 min(调用方超时, 请求剩余预算)（见 deadline）；
+  剩余预算不够退避时不再重试
+requests 在首次建 Session 时才导入（约占网关导入耗时三成）；preload 模式下由 app.warm_imports() 在 master 预先导入。
+"""
+import os, time, random, logging, threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+import config as _cfg
+from . import breaker, deadline
+
+if TYPE_CHECKING:
+    import requests
+
+POOL_SIZE   = int(getattr(_cfg, "HTTP_POOL_SIZE", 0) or 0)         # 0 = 按 gunicorn threads
+RETRIES     = int(getattr(_cfg, "HTTP_RETRIES", 2) or 0)
+BACKOFF     = float(getattr(_cfg, "HTTP_BACKOFF", 0.2) or 0.2)     # 首次退避基数（秒）
+BACKOFF_MAX = float(getattr(_cfg, "HTTP_BACKOFF_MAX", 2.0) or 2.0)
+
+_RETRY_GET  = {429, 500, 502, 503, 504}
+_RETRY_POST = {429, 503}
+
+_hooks: List[Callable] = []
+
+def add_hook(fn: Callable):
+    _hooks.append(fn)
+
+def _emit(*args):
+    for fn in _hooks:
+        try: fn(*args)
+        except Exception: logging.debug("http hook failed", exc_info=True)
+
+class Client:
+    def __init__(self, name: str, pool_size: int = 0, retries: int = RETRIES):
+        self.name, self.retries = name, retries
+        self._pool_size = pool_size
+        self._lock = threading.Lock()
+        self._pid, self._s = 0, None
+
+    @property
+    def pool_size(self) -> int:
+        """建连接池时再取：preload 模式下客户端在 master 导入时创建，GUNICORN_THREADS 要到 post_fork 才设置。"""
+        return self._pool_size or POOL_SIZE or int(os.getenv("GUNICORN_THREADS", "0") or 0) or 4
+
+    @property
+    def session(self) -> "requests.Session":
+        if self._s is None or self._pid != os.getpid():
+            with self._lock:
+                if self._s is None or self._pid != os.getpid():
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    s = requests.Session()
+                    self._adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size, max_retries=0)
+                    s.mount("https://", self._adapter); s.mount("http://", self._adapter)
+                    self._s, self._pid = s, os.getpid()
+        return self._s
+
+    def isolated_session(self, guarded: bool = True) -> "requests.Session":
+        """新 Session（Cookie 互不影响）挂载共享 adapter；用完勿 close()，否则会关闭共享连接池。
+        guarded=False 时不经熔断器 / 请求预算（调用方自行处理，如 aio_http 的线程池回退）。"""
+        import requests
+        self.session
+        s = requests.Session()
+        s.mount("https://", self._adapter); s.mount("http://", self._adapter)
+        return self.guard(s) if guarded else s
+
+    def guard(self, s: "requests.Session") -> "requests.Session":
+        """让外部 Session 的请求同样经过熔断器与请求预算。"""
+        raw = s.request
+        s.request = lambda method, url, **kw: self._send(raw, method, url, kw)
+        return s
+
+    def _send(self, send: Callable, method: str, url: str, kw: dict) -> "requests.Response":
+        from requests import RequestException
+        br = breaker.get(self.name)
+        br.before()
+        kw["timeout"] = deadline.timeout(kw.get("timeout"))
+        try:
+            resp = send(method, url, **kw)
+        except RequestException:
+            br.failure(); raise
+        if resp.status_code >= 500: br.failure()
+        else: br.success()
+        return resp
+
+    def _delay(self, attempt: int, resp: Optional["requests.Response"]) -> float:
+        ra = resp.headers.get("Retry-After") if resp is not None else None
+        if ra and ra.isdigit():
+            return min(float(ra), BACKOFF_MAX)
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF * (2 ** attempt)))   # full jitter
+
+    def request(self, method: str, url: str, retries: Optional[int] = None, **kw) -> "requests.Response":
+        from requests import RequestException
+        method = method.upper()
+        retry_on = _RETRY_GET if method in ("GET", "HEAD") else _RETRY_POST
+        budget = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            try:
+                resp = self._send(self.session.request, method, url, kw)
+            except RequestException:
+                _emit(self.name, method, url, 0, time.perf_counter() - t0, attempt)
+                raise
+            _emit(self.name, method, url, resp.status_code, time.perf_counter() - t0, attempt)
+            if resp.status_code not in retry_on or attempt >= budget:
+                return resp
+            delay = self._delay(attempt, resp)
+            left = deadline.remaining()
+            if left is not None and delay + deadline.MIN_TIMEOUT >= left:
+                return resp                                # 预算不够再试一次
+            logging.info("%s %s %s -> %d, retry in %.2fs", self.name, method, url.split("?")[0], resp.status_code, delay)
+            resp.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kw) -> "requests.Response":  return self.request("GET", url, **kw)
+    def post(self, url: str, **kw) -> "requests.Response": return self.request("POST", url, **kw)
+
+_clients: Dict[str, Client] = {}
+_clients_lock = threading.Lock()
+
+def client(name: str, **opts) -> Client:
+    c = _clients.get(name)
+    if c is None:
+        with _clients_lock:
+            c = _clients.get(name) or _clients.setdefault(name, Client(name, **opts))
+    return c
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+非阻塞日志管道
+- 请求线程只把记录放进有界队列（QueueHandler），由单个写线程（QueueListener）写文件 / 控制台
+- 队列满时丢弃并计数（dropped()），绝不阻塞请求
+- LOG_FORMAT = "json"：每行一个 JSON，含 request_id 与 extra 传入的字段（route / status / ms / stages ...）
+- 采样：extra={"sample": "status"} 的记录按 LOG_SAMPLE[键] 比例保留，在入队前判定，被丢弃的记录不做格式化
+- set_request_id / clear_request_id：由 app 在请求开始 / 结束时调用，记录自动带上 request_id
+"""
+import copy, json, time, queue, atexit, logging, threading, contextvars
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+_request_id: contextvars.ContextVar = contextvars.ContextVar("request_id", default="-")
+
+_STD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "sample"}
+
+_plain = logging.Formatter()
+_listener: Optional[QueueListener] = None
+_handler: Optional["_DroppingQueueHandler"] = None
+_lock = threading.Lock()
+
+# ---- 请求上下文 ----
+def set_request_id(rid: str):
+    _request_id.set(rid)
+
+def clear_request_id():
+    _request_id.set("-")
+
+def request_id() -> str:
+    return _request_id.get()
+
+class _ContextFilter(logging.Filter):
+    """在调用线程里补上 request_id（写线程里已拿不到请求上下文）。"""
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+class _SamplingFilter(logging.Filter):
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = {k: float(v) for k, v in (rates or {}).items()}
+        self._seen: Dict[str, int] = {}
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if not key or record.levelno >= logging.WARNING: return True
+        rate = self.rates.get(key, 1.0)
+        if rate >= 1: return True
+        if rate <= 0: return False
+        n = self._seen.get(key, 0) + 1          # 计数采样：每 1/rate 条保留一条（无锁，近似即可）
+        self._seen[key] = n
+        return n % max(int(round(1 / rate)), 1) == 0
+
+class _DroppingQueueHandler(QueueHandler):
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        """只在调用线程合成消息与异常文本（参数可能随后被修改），排版留给写线程。"""
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage(); record.args = None
+        if record.exc_info:
+            record.exc_text = _plain.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+# ---- 格式 ----
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+               "level": record.levelname, "msg": record.getMessage(),
+               "request_id": getattr(record, "request_id", "-")}
+        if record.name != "root": out["logger"] = record.name
+        for k, v in record.__dict__.items():
+            if k not in _STD_ATTRS and not k.startswith("_"): out[k] = v
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text: out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(request_id)s | %(message)s"
+
+def _writers(path: str, fmt: str) -> List[logging.Handler]:
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    hs: List[logging.Handler] = [logging.StreamHandler()]
+    if path: hs.insert(0, logging.FileHandler(path, encoding="utf-8"))
+    for h in hs: h.setFormatter(formatter)
+    return hs
+
+# ---- 安装 ----
+def setup(path: str, level: str = "INFO", fmt: str = "json", queue_size: int = 10000,
+          sample: Optional[Dict[str, float]] = None):
+    """替换 root logger 的 handler 为队列 handler；重复调用（如 fork 后）会重建写线程。"""
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            try: _listener.stop()
+            except Exception: pass
+        q: queue.Queue = queue.Queue(maxsize=max(queue_size, 1))
+        h = _DroppingQueueHandler(q)
+        h.addFilter(_SamplingFilter(sample or {}))
+        h.addFilter(_ContextFilter())
+        root = logging.getLogger()
+        for old in list(root.handlers): root.removeHandler(old)
+        root.addHandler(h)
+        root.setLevel(getattr(logging, (level or "INFO").upper(), logging.INFO))
+        _listener = QueueListener(q, *_writers(path, fmt), respect_handler_level=False)
+        _listener.start()
+        _handler = h
+    return h
+
+def shutdown():
+    """刷出队列中剩余记录（进程退出时自动调用）。"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            try: _listener.stop()
+            except Exception: pass
+            _listener = None
+
+atexit.register(shutdown)
+
+def dropped() -> int:
+    return _handler.dropped if _handler else 0
+
+def stats() -> Dict[str, int]:
+    return {"dropped": dropped(), "queued": _handler.queue.qsize() if _handler else 0}
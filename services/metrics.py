@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+轻量指标（Prometheus 文本格式，无第三方依赖）
+- observe(name, seconds, **labels)：直方图（固定桶）；stage(name) 上下文管理器给回调各阶段计时
+- inc(name, **labels)：计数器；timed(op) 装饰器记录 zentao_api 各调用耗时
+- 出站 HTTP 经 http_client 钩子自动记录（上游 / 接口 / 状态类别）
+热路径只在进程内累加（一把锁 + bisect）；后台线程每 METRICS_FLUSH_INTERVAL 秒把增量合并进共享 SQLite，
+render() 先刷本进程增量再汇总所有 worker。连接池 / 缓存等进程内快照按 pid 记为 gauge，超时未更新的丢弃。
+"""
+import os, re, json, time, bisect, sqlite3, inspect, threading, logging, contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, List, Tuple
+import config as _cfg
+from . import sqlite_local
+
+ENABLED        = getattr(_cfg, "METRICS_ENABLED", True)
+_PATH          = getattr(_cfg, "METRICS_DB", "/tmp/dt_metrics.db") or "/tmp/dt_metrics.db"
+FLUSH_INTERVAL = float(getattr(_cfg, "METRICS_FLUSH_INTERVAL", 5) or 5)
+BUCKETS        = tuple(getattr(_cfg, "METRICS_BUCKETS", None) or
+                       (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+PREFIX = "sso_"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name   TEXT NOT NULL,
+    labels TEXT NOT NULL,           -- JSON（键已排序）
+    kind   TEXT NOT NULL,           -- counter / histogram
+    key    TEXT NOT NULL,           -- 直方图：桶序号 / sum / count；计数器：''
+    value  REAL NOT NULL,
+    PRIMARY KEY (name, labels, key)
+);
+CREATE TABLE IF NOT EXISTS gauges (
+    name    TEXT NOT NULL,
+    labels  TEXT NOT NULL,
+    pid     INTEGER NOT NULL,
+    value   REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (name, labels, pid)
+);
+"""
+
+_lock = threading.Lock()
+_hist: Dict[Tuple[str, Tuple], List] = {}       # (name, labels) -> [每桶计数..., +Inf, sum, count]
+_counters: Dict[Tuple[str, Tuple], float] = {}
+_collectors: List[Callable[[], List[Tuple[str, Dict[str, Any], float]]]] = []
+
+def _conn() -> sqlite3.Connection:
+    return sqlite_local.connect(_PATH, _SCHEMA)
+
+# ---- 记录（热路径） ----
+def observe(name: str, seconds: float, **labels):
+    if not ENABLED: return
+    key = (name, tuple(sorted(labels.items())))
+    i = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        h = _hist.get(key)
+        if h is None:
+            h = _hist[key] = [0] * (len(BUCKETS) + 1) + [0.0, 0]
+        h[i] += 1; h[-2] += seconds; h[-1] += 1
+    _start_flusher()
+
+def inc(name: str, value: float = 1, **labels):
+    if not ENABLED: return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _start_flusher()
+
+_stages: contextvars.ContextVar = contextvars.ContextVar("stages", default=None)
+
+def track_stages() -> Dict[str, float]:
+    """当前请求开始收集 stage 耗时（毫秒），供请求结束时写入结构化日志；线程与协程下都按请求隔离。"""
+    st: Dict[str, float] = {}
+    _stages.set(st)
+    return st
+
+@contextmanager
+def stage(name: str):
+    """回调各阶段计时：with metrics.stage("dingtalk_user_me"): ..."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        observe("stage_seconds", dt, stage=name)
+        st = _stages.get()
+        if st is not None: st[name] = round(dt * 1000, 1)
+
+def timed(op: str):
+    def deco(fn):
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def awrapper(*a, **kw):
+                t0 = time.perf_counter(); ok = "ok"
+                try:
+                    return await fn(*a, **kw)
+                except Exception:
+                    ok = "error"; raise
+                finally:
+                    observe("zentao_call_seconds", time.perf_counter() - t0, op=op, result=ok)
+            return awrapper
+        @wraps(fn)
+        def wrapper(*a, **kw):
+            t0 = time.perf_counter(); ok = "ok"
+            try:
+                return fn(*a, **kw)
+            except Exception:
+                ok = "error"; raise
+            finally:
+                observe("zentao_call_seconds", time.perf_counter() - t0, op=op, result=ok)
+        return wrapper
+    return deco
+
+def add_collector(fn: Callable[[], List[Tuple[str, Dict[str, Any], float]]]):
+    """fn() 返回 [(name, labels, value), ...]，随每次刷新按 pid 写入 gauge。"""
+    _collectors.append(fn)
+
+# ---- 出站 HTTP（http_client 钩子） ----
+_ID_SEG = re.compile(r"/users/(?!me(?:/|$))[^/]+")
+
+def _endpoint(url: str) -> str:
+    path = url.split("?", 1)[0].split("://", 1)[-1]
+    path = path[path.find("/"):] if "/" in path else "/"
+    return _ID_SEG.sub("/users/:id", path)
+
+def http_hook(upstream, method, url, status, seconds, attempt):
+    status_class = f"{status // 100}xx" if status else "error"
+    observe("upstream_seconds", seconds, upstream=upstream, method=method,
+            endpoint=_endpoint(url), status=status_class)
+    if attempt:
+        inc("upstream_retries_total", upstream=upstream)
+
+# ---- 跨进程汇总 ----
+def flush():
+    """把本进程的增量与 gauge 快照写入共享库。"""
+    with _lock:
+        hist, counters = dict(_hist), dict(_counters)
+        _hist.clear(); _counters.clear()
+    rows = []
+    for (name, labels), h in hist.items():
+        lj = json.dumps(dict(labels), ensure_ascii=False, sort_keys=True)
+        rows += [(name, lj, "histogram", str(i), v) for i, v in enumerate(h[:-2]) if v]
+        rows += [(name, lj, "histogram", "sum", h[-2]), (name, lj, "histogram", "count", h[-1])]
+    for (name, labels), v in counters.items():
+        rows.append((name, json.dumps(dict(labels), ensure_ascii=False, sort_keys=True), "counter", "", v))
+    gauges, now, pid = [], time.time(), os.getpid()
+    for fn in _collectors:
+        try:
+            gauges += [(n, json.dumps(l, ensure_ascii=False, sort_keys=True), pid, float(v), now)
+                       for n, l, v in fn()]
+        except Exception:
+            logging.debug("metrics collector failed", exc_info=True)
+    if not rows and not gauges: return
+    c = _conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        c.executemany("INSERT INTO samples(name,labels,kind,key,value) VALUES (?,?,?,?,?) "
+                      "ON CONFLICT(name,labels,key) DO UPDATE SET value=value+excluded.value", rows)
+        c.executemany("INSERT OR REPLACE INTO gauges(name,labels,pid,value,updated) VALUES (?,?,?,?,?)", gauges)
+        c.execute("COMMIT")
+    except Exception:
+        if c.in_transaction: c.execute("ROLLBACK")
+        with _lock:                                  # 写失败：增量放回，下次再刷
+            for k, h in hist.items():
+                cur = _hist.setdefault(k, [0] * len(h))
+                for i, v in enumerate(h): cur[i] += v
+            for k, v in counters.items(): _counters[k] = _counters.get(k, 0) + v
+        logging.warning("metrics flush failed", exc_info=True)
+
+def _loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try: flush()
+        except Exception: logging.debug("metrics flush failed", exc_info=True)
+
+def _start_flusher():
+    sqlite_local.start_thread("metrics-flush", _loop)
+
+# ---- Prometheus 文本格式 ----
+def _fmt_labels(labels: Dict[str, Any], **extra) -> str:
+    items = list(labels.items()) + list(extra.items())
+    if not items: return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+def _fmt_num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def render() -> str:
+    flush()
+    c = _conn()
+    samples = c.execute("SELECT name, labels, kind, key, value FROM samples ORDER BY name, labels").fetchall()
+    gauges = c.execute("SELECT name, labels, pid, value FROM gauges WHERE updated>? ORDER BY name, labels, pid",
+                       (time.time() - 3 * FLUSH_INTERVAL,)).fetchall()
+    out, typed = [], set()
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name); out.append(f"# TYPE {PREFIX}{name} {kind}")
+    hists: Dict[Tuple[str, str], Dict[str, float]] = {}
+    for name, lj, kind, key, value in samples:
+        if kind == "counter":
+            header(name, "counter")
+            out.append(f"{PREFIX}{name}{_fmt_labels(json.loads(lj))} {_fmt_num(value)}")
+        else:
+            hists.setdefault((name, lj), {})[key] = value
+    for (name, lj), h in hists.items():
+        header(name, "histogram")
+        labels, acc = json.loads(lj), 0.0
+        for i, le in enumerate(BUCKETS):
+            acc += h.get(str(i), 0)
+            out.append(f"{PREFIX}{name}_bucket{_fmt_labels(labels, le=le)} {_fmt_num(acc)}")
+        out.append(f"{PREFIX}{name}_bucket{_fmt_labels(labels, le='+Inf')} {_fmt_num(h.get('count', 0))}")
+        out.append(f"{PREFIX}{name}_sum{_fmt_labels(labels)} {_fmt_num(h.get('sum', 0))}")
+        out.append(f"{PREFIX}{name}_count{_fmt_labels(labels)} {_fmt_num(h.get('count', 0))}")
+    for name, lj, pid, value in gauges:
+        header(name, "gauge")
+        out.append(f"{PREFIX}{name}{_fmt_labels(json.loads(lj), pid=pid)} {_fmt_num(value)}")
+    return "\n".join(out) + "\n"
@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
 """
 组织架构同步与用户字段构建
+- full_sync：分页流式拉取钉钉用户 → 与禅道现有账号（一次查询）做差 → 缺失账号分块批量插入
+  支持检查点续跑与 dry-run（由 sync_jobs 在后台调度）
 """
-from typing import Dict, Any
+import time, logging
+from typing import Dict, Any, Callable, Optional
 from . import dingtalk_api, zentao_api
 from mapping import ACCOUNT_MAP, USER_FIELD_MAP, DEPT_MAP
+import config as _cfg
+
+PAGE_SIZE  = int(getattr(_cfg, "SYNC_PAGE_SIZE", 100) or 100)
+BATCH_SIZE = int(getattr(_cfg, "SYNC_BATCH_SIZE", 500) or 500)
+PAGE_PAUSE = float(getattr(_cfg, "SYNC_PAGE_PAUSE", 0.05) or 0)
+PLAN_LIMIT = int(getattr(_cfg, "SYNC_PLAN_LIMIT", 1000) or 1000)
 
 def _build_user_fields(d_user: Dict[str, Any]) -> Dict[str, Any]:
     """根据钉钉用户信息构造禅道用户字段"""
@@ -18,20 +27,57 @@ def _build_user_fields(d_user: Dict[str, Any]) -> Dict[str, Any]:
         fields["dept"] = DEPT_MAP[raw_dept]
     return fields
 
+def _account_of(d_user: Dict[str, Any]) -> str:
+    return ACCOUNT_MAP.get(d_user.get("userId")) or d_user.get("userId") or d_user.get("name")
+
 def ensure_user_exists(d_user: Dict[str, Any]) -> str:
     """确保用户存在，不存在则创建"""
-    account = ACCOUNT_MAP.get(d_user.get("userId")) or d_user.get("userId") or d_user.get("name")
+    account = _account_of(d_user)
     if not zentao_api.user_exists(account):
         fields = _build_user_fields(d_user)
         fields["role"] = "pm"  # 全员 PM
         zentao_api.create_user(account, fields)
     return account
 
-def full_sync(access_token: str) -> int:
-    """全量同步组织架构"""
-    users = dingtalk_api.list_users(access_token)
-    cnt = 0
-    for u in users:
-        ensure_user_exists(u)
-        cnt += 1
-    return cnt
+def full_sync(access_token: str, start_token: Optional[str] = None, dry_run: bool = False,
+              on_page: Optional[Callable[[Dict[str, Any], Optional[str]], None]] = None,
+              report: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    全量同步组织架构，返回 {"total", "created", "skipped", "failed", "seconds"}。
+    - start_token / report：从检查点续跑（report 为已累计的计数）
+    - on_page(report, next_token)：每页落库后回调，用于记录检查点与进度
+    - dry_run：只计算差异，待创建账号记入 report["plan"]（最多 SYNC_PLAN_LIMIT 条），不写库
+    每页处理完暂停 SYNC_PAGE_PAUSE 秒，避免长时间占用与登录共享的连接池。
+    """
+    t0 = time.monotonic()
+    existing = zentao_api.existing_accounts()
+    report = report if report is not None else {}
+    for k in ("total", "created", "skipped", "failed"): report.setdefault(k, 0)
+    if dry_run: report.setdefault("plan", []); report.setdefault("to_create", 0)
+    seen, pending = set(), []
+
+    def flush():
+        if dry_run:
+            report["to_create"] += len(pending)
+            room = PLAN_LIMIT - len(report["plan"])
+            report["plan"].extend(a for a, _ in pending[:max(room, 0)])
+        else:
+            for k, v in zentao_api.create_users_bulk(pending, BATCH_SIZE).items(): report[k] += v
+        pending.clear()
+
+    for users, next_token, _ in dingtalk_api.iter_pages(access_token, PAGE_SIZE, start_token):
+        for u in users:
+            account = _account_of(u)
+            if not account or account in seen:      # 同一用户在多个部门中重复出现
+                continue
+            seen.add(account); report["total"] += 1
+            if account in existing:
+                report["skipped"] += 1; continue
+            fields = _build_user_fields(u); fields["role"] = "pm"  # 全员 PM
+            pending.append((account, fields))
+        if pending: flush()                     # 每页落库后才推进检查点
+        if on_page: on_page(report, next_token)
+        if next_token and PAGE_PAUSE: time.sleep(PAGE_PAUSE)
+    report["seconds"] = round(report.get("seconds", 0) + time.monotonic() - t0, 3)
+    logging.info("full sync done: %s", {k: v for k, v in report.items() if k != "plan"})
+    return report
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+登录后配权（加组 / 入项目）的去重与异步化
+- 策略版本 = hash(默认组, 自动加入项目, 角色, PROVISION_POLICY_VERSION)；任一项变化即视为新策略
+- 每个账号记录“已按版本 X 配权”：进程内 dict + 共享 SQLite（多 worker、重启后仍有效）
+- ensure()：已按当前版本配权则直接返回；否则提交到后台线程池执行，失败按退避重试，成功后记标记
+  登录请求不再等待加组 / 入项目的数据库往返
+- mark()：新用户在创建事务里已完成配权，直接记标记
+"""
+import os, json, time, sqlite3, hashlib, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set
+import config as _cfg
+from . import metrics, sqlite_local
+
+_PATH    = getattr(_cfg, "PROVISION_DB", "/tmp/dt_provisioned.db") or "/tmp/dt_provisioned.db"
+VERSION  = str(getattr(_cfg, "PROVISION_POLICY_VERSION", "1") or "1")   # 手动升版可强制全员重新配权
+WORKERS  = int(getattr(_cfg, "PROVISION_WORKERS", 2) or 2)
+RETRIES  = int(getattr(_cfg, "PROVISION_RETRIES", 3) or 0)
+BACKOFF  = float(getattr(_cfg, "PROVISION_BACKOFF", 1.0) or 1.0)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS provisioned (
+    account TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    ts      REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+_lock = threading.Lock()
+_done: Dict[str, str] = {}           # account -> 已配权的策略版本
+_inflight: Set[str] = set()
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_pid = 0
+
+def _conn() -> sqlite3.Connection:
+    return sqlite_local.connect(_PATH, _SCHEMA)
+
+def policy_version(groups: List[str], project_id: int, role: str) -> str:
+    raw = json.dumps([sorted(groups or []), int(project_id or 0), role or "", VERSION])
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+def is_provisioned(account: str, version: str) -> bool:
+    if _done.get(account) == version: return True
+    try:
+        r = _conn().execute("SELECT version FROM provisioned WHERE account=?", (account,)).fetchone()
+    except sqlite3.Error:
+        logging.warning("provision marker read failed", exc_info=True); return False
+    if r and r[0] == version:
+        _done[account] = version
+        return True
+    return False
+
+def mark(account: str, version: str):
+    _done[account] = version
+    try:
+        _conn().execute("INSERT OR REPLACE INTO provisioned(account, version, ts) VALUES (?,?,?)",
+                        (account, version, time.time()))
+    except sqlite3.Error:
+        logging.warning("provision marker write failed", exc_info=True)
+
+def forget(account: str):
+    """账号被删除 / 需要重新配权时调用。"""
+    _done.pop(account, None)
+    _conn().execute("DELETE FROM provisioned WHERE account=?", (account,))
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="provision")
+                _pool_pid = os.getpid()
+                _inflight.clear()
+    return _pool
+
+def _run(account: str, version: str, fn: Callable[[], object]):
+    try:
+        for attempt in range(RETRIES + 1):
+            try:
+                fn()
+                mark(account, version)
+                metrics.inc("provision_total", result="done")
+                return
+            except Exception:
+                if attempt >= RETRIES:
+                    logging.exception("provision %s failed after %d attempts", account, attempt + 1)
+                    metrics.inc("provision_total", result="failed")
+                    return
+                logging.warning("provision %s failed, retry %d", account, attempt + 1, exc_info=True)
+                time.sleep(BACKOFF * (2 ** attempt))
+    finally:
+        with _lock: _inflight.discard(account)
+
+def ensure(account: str, version: str, fn: Callable[[], object]) -> str:
+    """返回 skipped（已配权）/ queued（已提交后台）/ pending（已有同账号任务在跑）。"""
+    if is_provisioned(account, version):
+        metrics.inc("provision_total", result="skipped")
+        return "skipped"
+    pool = _executor()
+    with _lock:
+        if account in _inflight: return "pending"
+        _inflight.add(account)
+    pool.submit(_run, account, version, fn)
+    metrics.inc("provision_total", result="queued")
+    return "queued"
+
+def stats() -> Dict[str, int]:
+    return {"cached": len(_done), "inflight": len(_inflight)}
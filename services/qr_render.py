@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+二维码渲染
+- svg：只用 qrcode 生成矩阵，手工拼 SVG 路径，未安装 Pillow 时也可用
+- png：PIL 编码，可调 box_size / border / compress_level
+- QR_MASK_PATTERN 固定掩码（0-7）可跳过 8 种掩码试算，编码约快 4 倍
+- 结果按 (内容, 格式, 参数) LRU 缓存：同一票据刷新二维码不重复渲染
+qrcode / PIL 均在首次渲染时才导入（qrcode 包导入时若已安装 Pillow 会一并加载）。
+"""
+from functools import lru_cache
+from io import BytesIO
+import config as _cfg
+
+BOX_SIZE      = int(getattr(_cfg, "QR_BOX_SIZE", 10) or 10)
+BORDER        = int(getattr(_cfg, "QR_BORDER", 4) or 0)
+PNG_COMPRESS  = int(getattr(_cfg, "QR_PNG_COMPRESS", 6) or 0)       # 0-9，越小越快、文件越大
+CACHE_SIZE    = int(getattr(_cfg, "QR_CACHE_SIZE", 256) or 0)
+MASK_PATTERN  = getattr(_cfg, "QR_MASK_PATTERN", None)               # None = 自动选最优掩码
+
+MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+def _qr(data: str, box_size: int, border: int):
+    import qrcode
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M,
+                       box_size=box_size, border=border, mask_pattern=MASK_PATTERN)
+    qr.add_data(data); qr.make(fit=True)
+    return qr
+
+def _svg(data: str, box_size: int, border: int) -> bytes:
+    m = _qr(data, box_size, border).get_matrix()      # get_matrix 已包含 border
+    n = len(m)
+    parts = []
+    for y, row in enumerate(m):            # 同一行连续黑块合并为一个矩形
+        x = 0
+        while x < n:
+            if row[x]:
+                start = x
+                while x < n and row[x]: x += 1
+                parts.append(f"M{start},{y}h{x - start}v1h-{x - start}z")
+            else:
+                x += 1
+    path = "".join(parts)
+    px = n * box_size
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{px}" height="{px}" '
+            f'viewBox="0 0 {n} {n}" shape-rendering="crispEdges">'
+            f'<rect width="{n}" height="{n}" fill="#fff"/><path d="{path}" fill="#000"/></svg>').encode()
+
+def _png(data: str, box_size: int, border: int, compress_level: int) -> bytes:
+    from qrcode.image.pil import PilImage
+    img = _qr(data, box_size, border).make_image(image_factory=PilImage)
+    buf = BytesIO(); img.save(buf, format="PNG", compress_level=compress_level)
+    return buf.getvalue()
+
+def _render(data: str, fmt: str, box_size: int, border: int, compress_level: int) -> bytes:
+    if fmt == "svg":
+        return _svg(data, box_size, border)
+    return _png(data, box_size, border, compress_level)
+
+_cached = lru_cache(maxsize=CACHE_SIZE)(_render) if CACHE_SIZE else _render
+
+def render(data: str, fmt: str = "png", box_size: int = BOX_SIZE, border: int = BORDER,
+           compress_level: int = PNG_COMPRESS) -> bytes:
+    if fmt not in MIMETYPES:
+        raise ValueError(f"unsupported qr format: {fmt}")
+    return _cached(data, fmt, box_size, border, compress_level)
+
+def cache_info():
+    return _cached.cache_info() if CACHE_SIZE else None
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+准入控制：按客户端 IP 的令牌桶限流（多 worker 共享）
+- allow(bucket, key)：单条 UPSERT ... RETURNING 在 SQLite 内完成补充 + 扣减，跨进程原子；
+  返回 (是否放行, 建议 Retry-After 秒数)
+- 被拒后本进程记住该 key 的解封时间，期间再来直接拒绝，不再访问共享库（429 足够便宜）
+- 桶参数见 config.RATE_LIMITS：{"桶名": {"per_minute": 速率, "burst": 容量}}
+- 长期未访问的桶（已回满）由后台线程定期删除
+- 默认额度按共享出口（整个办公室经同一 NAT / 代理未写 X-Forwarded-For 时所有人同一个 IP）估算，只拦明显的刷接口
+- 需要 SQLite >= 3.35（RETURNING）；更旧的版本导入时判定一次，限流整体关闭并只记一条日志
+"""
+import math, time, sqlite3, logging
+from typing import Dict, Tuple
+import config as _cfg
+from . import sqlite_local
+
+_PATH   = getattr(_cfg, "RATE_LIMIT_DB", "/tmp/dt_ratelimit.db") or "/tmp/dt_ratelimit.db"
+LIMITS  = getattr(_cfg, "RATE_LIMITS", None) or {
+    "ticket": {"per_minute": 600, "burst": 200},     # 生成票据 / 二维码
+    "status": {"per_minute": 6000, "burst": 1000},   # 状态轮询 / SSE / 刷新已有二维码
+}
+PURGE_EVERY = 300
+SUPPORTED = sqlite3.sqlite_version_info >= (3, 35, 0)
+_warned = [False]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key    TEXT PRIMARY KEY,     -- <桶名>:<IP>
+    tokens REAL NOT NULL,
+    ts     REAL NOT NULL,
+    ok     INTEGER NOT NULL DEFAULT 1
+) WITHOUT ROWID;
+"""
+
+# 补充后 >= 1 则扣 1 并放行，否则只记录补充结果；ok 随同一语句返回
+_TAKE = """
+INSERT INTO buckets(key, tokens, ts, ok) VALUES (:key, :burst - 1, :now, 1)
+ON CONFLICT(key) DO UPDATE SET
+    ok     = (MIN(:burst, tokens + (:now - ts) * :rate) >= 1),
+    tokens = MIN(:burst, tokens + (:now - ts) * :rate) - (MIN(:burst, tokens + (:now - ts) * :rate) >= 1),
+    ts     = :now
+RETURNING ok, tokens
+"""
+
+_blocked: Dict[str, float] = {}          # key -> 本进程内的解封时间（monotonic）
+
+def _conn() -> sqlite3.Connection:
+    sqlite_local.start_thread("ratelimit-purge", _purge_loop)
+    return sqlite_local.connect(_PATH, _SCHEMA, timeout=2, synchronous="OFF")   # 计数器可丢，不必等刷盘
+
+def allow(bucket: str, key: str) -> Tuple[bool, int]:
+    if not SUPPORTED:
+        if not _warned[0]:
+            _warned[0] = True
+            logging.warning("rate limit disabled: SQLite %s lacks RETURNING (needs >= 3.35)", sqlite3.sqlite_version)
+        return True, 0
+    spec = LIMITS.get(bucket)
+    if not spec: return True, 0
+    k = f"{bucket}:{key}"
+    until = _blocked.get(k)
+    if until is not None:
+        left = until - time.monotonic()
+        if left > 0: return False, max(int(math.ceil(left)), 1)
+        _blocked.pop(k, None)
+    rate = float(spec.get("per_minute", 60)) / 60.0
+    burst = float(spec.get("burst", 10))
+    try:
+        ok, tokens = _conn().execute(_TAKE, {"key": k, "burst": burst, "rate": rate, "now": time.time()}).fetchone()
+    except sqlite3.Error:
+        logging.warning("rate limit store unavailable, allowing", exc_info=True)
+        return True, 0                           # 限流存储故障时放行，不影响登录
+    if ok: return True, 0
+    wait = (1 - tokens) / rate if rate > 0 else 60.0
+    _blocked[k] = time.monotonic() + wait
+    return False, max(int(math.ceil(wait)), 1)
+
+def purge() -> int:
+    """删除已回满的桶（最长回满时间之前就没再访问过的）。"""
+    longest = max((float(s.get("burst", 10)) / (float(s.get("per_minute", 60)) / 60.0)
+                   for s in LIMITS.values()), default=0)
+    now = time.time()
+    n = _conn().execute("DELETE FROM buckets WHERE ts<?", (now - longest,)).rowcount
+    mono = time.monotonic()
+    for k, until in list(_blocked.items()):
+        if until <= mono: _blocked.pop(k, None)
+    return n
+
+def _purge_loop():
+    while True:
+        time.sleep(PURGE_EVERY)
+        try: purge()
+        except Exception: logging.exception("rate limit purge failed")
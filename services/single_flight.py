@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+回调去重（single-flight，跨线程 + 跨 worker）
+- do(kind, key, fn)：同一 kind + key 同时只有一个调用方（leader）执行 fn，其余调用方（follower）等待并复用其结果
+- 进程内：follower 等待 leader 线程的 Event，不访问共享库
+- 跨进程：共享 SQLite 锁表，一条 INSERT ... ON CONFLICT DO UPDATE ... WHERE 过期 RETURNING 原子抢占；
+  抢不到的进程轮询该行直到完成
+- 完成后结果保留 REUSE 秒：浏览器 / 钉钉 webview 重放回调时直接复用，不再调用上游
+- leader 进程崩溃时，租约（LEASE 秒）到期后由下一个调用方接手
+- ado()：协程版，供 ASGI 模式的回调使用；与 do() 共用同一锁表，两种模式的 worker 之间同样去重
+- 失败：reuse_errors(e) 为真时失败结果同样复用（如授权码已失效，重试必然失败）；否则删除记录，follower 自行重试
+key 以 sha1 存储，不落盘授权码原文；结果需可 JSON 序列化。
+"""
+import os, json, time, uuid, asyncio, sqlite3, hashlib, logging, threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import config as _cfg
+from . import deadline, metrics, sqlite_local
+
+_PATH  = getattr(_cfg, "SINGLE_FLIGHT_DB", "/tmp/dt_single_flight.db") or "/tmp/dt_single_flight.db"
+REUSE  = float(getattr(_cfg, "SINGLE_FLIGHT_REUSE", 10) or 0)      # 结果复用窗口（秒）
+LEASE  = float(getattr(_cfg, "SINGLE_FLIGHT_LEASE", 30) or 30)     # leader 租约（秒）
+WAIT   = float(getattr(_cfg, "SINGLE_FLIGHT_WAIT", 15) or 15)      # 无请求预算时 follower 最长等待
+POLL   = 0.05
+PURGE_EVERY = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS flights (
+    key     TEXT PRIMARY KEY,
+    owner   TEXT NOT NULL,
+    state   TEXT NOT NULL,          -- running / done / failed
+    result  TEXT,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# 行不存在或已过期（租约到期 / 复用窗口结束）时抢占
+_CLAIM = """
+INSERT INTO flights(key, owner, state, result, expires) VALUES (:key, :owner, 'running', NULL, :lease)
+ON CONFLICT(key) DO UPDATE SET owner=excluded.owner, state='running', result=NULL, expires=excluded.expires
+    WHERE flights.expires < :now
+RETURNING owner
+"""
+
+_ERRORS = {"PermissionError": PermissionError}
+
+class _StoreUnavailable(Exception):
+    """锁表抢占 / 读取出错：fn 尚未执行，调用方改为直接执行。fn 执行中的 sqlite3.Error 不在此列，照常抛出。"""
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+    def __init__(self):
+        self.event, self.result, self.error = threading.Event(), None, None
+
+_lock = threading.Lock()
+_calls: Dict[str, _Call] = {}
+_last_purge = [0.0]
+
+def _conn() -> sqlite3.Connection:
+    return sqlite_local.connect(_PATH, _SCHEMA)
+
+def _raise(err: Dict[str, str]):
+    raise _ERRORS.get(err.get("type", ""), RuntimeError)(err.get("msg", ""))
+
+def _wait_budget() -> float:
+    left = deadline.remaining()
+    return WAIT if left is None else min(WAIT, max(left, 0.0))
+
+def _purge(now: float):
+    if now - _last_purge[0] < PURGE_EVERY: return
+    _last_purge[0] = now
+    try: _conn().execute("DELETE FROM flights WHERE expires < ?", (now - PURGE_EVERY,))
+    except sqlite3.Error: logging.debug("single flight purge failed", exc_info=True)
+
+def _store(sql: str, args: tuple):
+    try: _conn().execute(sql, args)
+    except sqlite3.Error: logging.warning("single flight store write failed", exc_info=True)
+
+def _claim(k: str, owner: str, now: float) -> bool:
+    _purge(now)
+    try:
+        return _conn().execute(_CLAIM, {"key": k, "owner": owner, "lease": now + LEASE, "now": now}).fetchone() is not None
+    except sqlite3.Error as e:
+        raise _StoreUnavailable(e) from e
+
+def _peek(k: str, kind: str) -> Tuple[bool, Any]:
+    """(是否已有结果, 结果)；失败结果直接抛出。"""
+    try:
+        row = _conn().execute("SELECT state, result FROM flights WHERE key=?", (k,)).fetchone()
+    except sqlite3.Error as e:
+        raise _StoreUnavailable(e) from e
+    if not row or row[0] == "running": return False, None
+    metrics.inc("single_flight_total", kind=kind, role="reused")
+    if row[0] == "failed": _raise(json.loads(row[1]))
+    return True, json.loads(row[1])
+
+def _finish(k: str, owner: str, result: Any = None, error: Optional[BaseException] = None,
+            reuse_errors: Callable[[Exception], bool] = None):
+    if error is None:
+        _store("UPDATE flights SET state='done', result=?, expires=? WHERE key=? AND owner=?",
+               (json.dumps(result), time.time() + REUSE, k, owner))
+    elif isinstance(error, Exception) and reuse_errors(error):
+        _store("UPDATE flights SET state='failed', result=?, expires=? WHERE key=? AND owner=?",
+               (json.dumps({"type": type(error).__name__, "msg": str(error)}), time.time() + REUSE, k, owner))
+    else:
+        _store("DELETE FROM flights WHERE key=? AND owner=?", (k, owner))
+
+def _owner() -> str:
+    return f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def _key(kind: str, key: str) -> str:
+    return hashlib.sha1(f"{kind}:{key}".encode()).hexdigest()
+
+def _shared(k: str, fn: Callable[[], Any], reuse_errors: Callable[[Exception], bool], kind: str) -> Any:
+    """跨进程部分：抢占或等待其他 worker 的结果。"""
+    owner = _owner()
+    give_up = time.monotonic() + _wait_budget()
+    while True:
+        if _claim(k, owner, time.time()):
+            metrics.inc("single_flight_total", kind=kind, role="leader")
+            try:
+                result = fn()
+            except BaseException as e:
+                _finish(k, owner, error=e, reuse_errors=reuse_errors); raise
+            _finish(k, owner, result)
+            return result
+        done, result = _peek(k, kind)
+        if done: return result
+        if time.monotonic() >= give_up:
+            raise deadline.DeadlineExceeded(f"single flight {kind} wait timeout")
+        time.sleep(POLL)
+
+def _never(_e: Exception) -> bool:
+    return False
+
+def do(kind: str, key: str, fn: Callable[[], Any],
+       reuse_errors: Callable[[Exception], bool] = _never) -> Any:
+    """kind 区分键空间（code / uid），同时作为指标标签；reuse_errors(e) 为真的失败在复用窗口内直接返回给后来者。"""
+    k = _key(kind, key)
+    with _lock:
+        call = _calls.get(k)
+        leader = call is None
+        if leader:
+            call = _calls[k] = _Call()
+    if not leader:
+        metrics.inc("single_flight_total", kind=kind, role="follower")
+        if not call.event.wait(_wait_budget()):
+            raise deadline.DeadlineExceeded(f"single flight {kind} wait timeout")
+        if call.error is not None: raise call.error
+        return call.result
+    try:
+        try:
+            call.result = _shared(k, fn, reuse_errors, kind)
+        except _StoreUnavailable:                 # 抢占 / 读取阶段出错，fn 尚未执行
+            logging.warning("single flight store unavailable, running directly", exc_info=True)
+            call.result = fn()
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock: _calls.pop(k, None)
+        call.event.set()
+
+# ---- 协程版（ASGI 模式）：进程内 follower 等待 leader 的 Future，跨进程同样经锁表轮询 ----
+_acalls: Dict[str, "asyncio.Future"] = {}
+
+async def _ashared(k: str, fn: Callable[[], Awaitable[Any]], reuse_errors: Callable[[Exception], bool], kind: str) -> Any:
+    """锁表读写（busy timeout 5 秒）在线程池中执行，不阻塞事件循环。"""
+    owner = _owner()
+    give_up = time.monotonic() + _wait_budget()
+    while True:
+        if await asyncio.to_thread(_claim, k, owner, time.time()):
+            metrics.inc("single_flight_total", kind=kind, role="leader")
+            try:
+                result = await fn()
+            except asyncio.CancelledError as e:  # 客户端断开：当场释放锁表记录（此时再 await 可能再次被取消）
+                _finish(k, owner, error=e, reuse_errors=reuse_errors); raise
+            except BaseException as e:
+                await asyncio.to_thread(_finish, k, owner, None, e, reuse_errors); raise
+            await asyncio.to_thread(_finish, k, owner, result)
+            return result
+        done, result = await asyncio.to_thread(_peek, k, kind)
+        if done: return result
+        if time.monotonic() >= give_up:
+            raise deadline.DeadlineExceeded(f"single flight {kind} wait timeout")
+        await asyncio.sleep(POLL)
+
+async def ado(kind: str, key: str, fn: Callable[[], Awaitable[Any]],
+              reuse_errors: Callable[[Exception], bool] = _never) -> Any:
+    """do() 的协程版：fn 返回协程；等待期间不占线程。"""
+    k = _key(kind, key)
+    fut = _acalls.get(k)
+    if fut is not None:
+        metrics.inc("single_flight_total", kind=kind, role="follower")
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), _wait_budget())
+        except asyncio.TimeoutError:
+            if fut.done(): raise                            # leader 自身的超时类异常
+            raise deadline.DeadlineExceeded(f"single flight {kind} wait timeout") from None
+    fut = _acalls[k] = asyncio.get_running_loop().create_future()
+    try:
+        try:
+            result = await _ashared(k, fn, reuse_errors, kind)
+        except _StoreUnavailable:
+            logging.warning("single flight store unavailable, running directly", exc_info=True)
+            result = await fn()
+        fut.set_result(result)
+        return result
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):           # leader 的客户端断开：follower 按超时处理，稍后重试
+            e = deadline.DeadlineExceeded(f"single flight {kind} leader cancelled")
+        fut.set_exception(e); fut.exception()              # 无 follower 时不报 "never retrieved"
+        raise
+    finally:
+        _acalls.pop(k, None)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+本地 SQLite（WAL）共享存储的公共连接与后台线程（票据、限流、指标、去重、配权标记、事件队列、同步任务共用）
+- connect(path, schema)：每线程每库一条连接；按 pid 判断，fork 后（preload 模式）重建，不继承父进程句柄；
+  新建连接时设置 WAL 与 synchronous、执行建表语句，可选 migrate(conn) 补齐旧库的列
+- start_thread(name, target)：每个进程只启动一次的守护线程；fork 后子进程中再次调用会重新启动
+"""
+import os, sqlite3, threading
+from typing import Callable, Dict, Optional, Tuple
+
+_local = threading.local()
+_lock = threading.Lock()
+_started: Dict[str, int] = {}          # 线程名 -> 启动该线程的 pid
+
+def connect(path: str, schema: str = "", timeout: float = 5, synchronous: str = "NORMAL",
+            migrate: Optional[Callable[[sqlite3.Connection], None]] = None) -> sqlite3.Connection:
+    conns: Optional[Dict[Tuple[str, str], sqlite3.Connection]] = getattr(_local, "conns", None)
+    if conns is None or getattr(_local, "pid", 0) != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    c = conns.get((path, schema))
+    if c is not None:
+        return c
+    c = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute(f"PRAGMA synchronous={synchronous}")
+    if schema: c.executescript(schema)
+    if migrate: migrate(c)
+    conns[(path, schema)] = c
+    return c
+
+def start_thread(name: str, target: Callable[[], None]) -> bool:
+    """返回是否新启动了线程。"""
+    pid = os.getpid()
+    if _started.get(name) == pid: return False
+    with _lock:
+        if _started.get(name) == pid: return False
+        _started[name] = pid
+    threading.Thread(target=target, name=name, daemon=True).start()
+    return True
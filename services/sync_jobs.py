@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+全量同步后台任务
+- start(access_token, dry_run)：创建任务并在后台线程执行 org_sync.full_sync，立即返回任务 ID
+- 每页处理后把累计计数与下一页游标写入 SQLite（多 worker 共享），作为检查点
+- resume(job_id, access_token)：从检查点续跑（进程被杀或 worker 重启后）
+  access_token 一般为 dingtalk_api.get_app_access_token()，无需人工提供 code
+- status(job_id)：processed / total / rate / eta；心跳超过 SYNC_JOB_STALE 秒的 running 任务视为 interrupted
+  rate 按检查点中累计的实际运行秒数（active）计算，续跑任务不计入中断期间
+同一时间只允许一个任务运行，避免与登录流量争用 MySQL 连接池。
+"""
+import json, time, uuid, sqlite3, threading, logging
+from typing import Any, Dict, Optional
+import config as _cfg
+from . import org_sync, dingtalk_api, sqlite_local
+
+_PATH = getattr(_cfg, "SYNC_JOB_DB", "/tmp/dt_sync_jobs.db") or "/tmp/dt_sync_jobs.db"
+STALE = float(getattr(_cfg, "SYNC_JOB_STALE", 120) or 120)
+
+class JobConflict(RuntimeError):
+    """已有任务在运行。"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id         TEXT PRIMARY KEY,
+    status     TEXT NOT NULL,        -- running / done / failed
+    dry_run    INTEGER NOT NULL DEFAULT 0,
+    created    REAL NOT NULL,
+    updated    REAL NOT NULL,
+    total      INTEGER,
+    report     TEXT,                 -- 累计计数（JSON）
+    checkpoint TEXT,                 -- 下一页游标；NULL 表示从头开始
+    error      TEXT,
+    active     REAL NOT NULL DEFAULT 0   -- 累计运行秒数（各次运行之和，不含中断时间）
+);
+"""
+
+def _migrate(c: sqlite3.Connection):
+    """旧版任务库补齐 active 列。"""
+    if "active" not in {r[1] for r in c.execute("PRAGMA table_info(jobs)")}:
+        try: c.execute("ALTER TABLE jobs ADD COLUMN active REAL NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError: pass       # 其他 worker 已添加
+
+def _conn() -> sqlite3.Connection:
+    return sqlite_local.connect(_PATH, _SCHEMA, synchronous="FULL", migrate=_migrate)
+
+def _row(job_id: str) -> Optional[Dict[str, Any]]:
+    r = _conn().execute("SELECT id,status,dry_run,created,updated,total,report,checkpoint,error,active "
+                        "FROM jobs WHERE id=?", (job_id,)).fetchone()
+    if not r: return None
+    return {"id": r[0], "status": r[1], "dry_run": bool(r[2]), "created": r[3], "updated": r[4],
+            "total": r[5], "report": json.loads(r[6] or "{}"), "checkpoint": r[7], "error": r[8],
+            "active": r[9] or 0.0}
+
+def _claim(job_id: str, dry_run: bool, resume: bool):
+    """BEGIN IMMEDIATE 内检查有无存活任务，再登记/接管任务，跨 worker 互斥。"""
+    c = _conn(); now = time.time()
+    c.execute("BEGIN IMMEDIATE")
+    try:
+        busy = c.execute("SELECT id FROM jobs WHERE status='running' AND updated>? AND id<>?",
+                         (now - STALE, job_id)).fetchone()
+        if busy:
+            raise JobConflict(busy[0])
+        if resume:
+            c.execute("UPDATE jobs SET status='running', updated=?, error=NULL WHERE id=?", (now, job_id))
+        else:
+            c.execute("INSERT INTO jobs(id,status,dry_run,created,updated,report) VALUES (?,'running',?,?,?,'{}')",
+                      (job_id, int(dry_run), now, now))
+        c.execute("COMMIT")
+    except Exception:
+        c.execute("ROLLBACK"); raise
+
+def _count(access_token: str) -> Optional[int]:
+    try:
+        return dingtalk_api.count_users(access_token)
+    except Exception:
+        return None
+
+def _run(job_id: str, access_token: str, dry_run: bool, start_token: Optional[str], report: Dict[str, Any],
+         active: float = 0.0):
+    t0 = time.monotonic()
+    def on_page(rep, next_token):
+        _conn().execute("UPDATE jobs SET updated=?, report=?, checkpoint=?, active=? WHERE id=?",
+                        (time.time(), json.dumps(rep, ensure_ascii=False), next_token,
+                         active + time.monotonic() - t0, job_id))
+    try:
+        total = _count(access_token)
+        if total is not None:
+            _conn().execute("UPDATE jobs SET total=? WHERE id=?", (total, job_id))
+        rep = org_sync.full_sync(access_token, start_token=start_token, dry_run=dry_run,
+                                 on_page=on_page, report=report)
+        _conn().execute("UPDATE jobs SET status='done', updated=?, report=?, checkpoint=NULL, active=? WHERE id=?",
+                        (time.time(), json.dumps(rep, ensure_ascii=False), active + time.monotonic() - t0, job_id))
+    except Exception as e:
+        logging.exception("sync job %s failed", job_id)
+        _conn().execute("UPDATE jobs SET status='failed', updated=?, error=? WHERE id=?",
+                        (time.time(), str(e), job_id))
+
+def _spawn(job_id, access_token, dry_run, start_token, report, active=0.0):
+    threading.Thread(target=_run, args=(job_id, access_token, dry_run, start_token, report, active),
+                     name=f"sync-{job_id[:8]}", daemon=True).start()
+
+def start(access_token: str, dry_run: bool = False) -> str:
+    job_id = uuid.uuid4().hex
+    _claim(job_id, dry_run, resume=False)
+    _spawn(job_id, access_token, dry_run, None, {})
+    return job_id
+
+def resume(job_id: str, access_token: str) -> Dict[str, Any]:
+    job = _row(job_id)
+    if not job: raise KeyError(job_id)
+    if job["status"] == "done": return job
+    if job["status"] == "running" and job["updated"] > time.time() - STALE:
+        raise JobConflict(job_id)
+    _claim(job_id, job["dry_run"], resume=True)
+    _spawn(job_id, access_token, job["dry_run"], job["checkpoint"], job["report"], job["active"])
+    return _row(job_id)
+
+def status(job_id: str) -> Optional[Dict[str, Any]]:
+    job = _row(job_id)
+    if not job: return None
+    rep, now = job["report"], time.time()
+    if job["status"] == "running" and job["updated"] < now - STALE:
+        job["status"] = "interrupted"      # 可用 resume 续跑
+    processed = rep.get("total", 0)
+    elapsed = rep.get("seconds") or job["active"] or max(job["updated"] - job["created"], 1e-6)
+    rate = processed / elapsed if processed else 0.0
+    eta = None
+    if job["status"] == "running" and job["total"] and rate:
+        eta = max(job["total"] - processed, 0) / rate
+    out = {"job": job["id"], "status": job["status"], "dry_run": job["dry_run"],
+           "processed": processed, "total": job["total"], "rate": round(rate, 2),
+           "eta_seconds": None if eta is None else round(eta, 1),
+           "created": rep.get("created", 0), "skipped": rep.get("skipped", 0),
+           "failed": rep.get("failed", 0), "resumable": job["status"] in ("interrupted", "failed"),
+           "error": job["error"]}
+    if job["dry_run"]:
+        out.update({"to_create": rep.get("to_create", 0), "plan": rep.get("plan", [])})
+    return out
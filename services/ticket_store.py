@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+扫码票据存储：ticket -> {ok, created, return, account, redirect, ts}
+- SQLite（WAL）单表，主键查找 O(1)；多个 gunicorn worker 共享同一文件
+- 每张票据带过期时间，读取时过滤过期票据，后台线程定期清理
+- 更新为单条 UPDATE 语句，跨进程原子
+- wait(): 长轮询等待票据变为已授权；本进程内由 ok() 直接唤醒，
+  其他 worker 的授权由监视线程感知后唤醒（data_version 变化时再比较授权计数 ticket_seq，
+  新建 / 清理票据不唤醒等待者）；await_ok() 为协程版
+"""
+import time, uuid, sqlite3, threading, logging
+from typing import Optional, Dict, Any
+import config as _cfg
+from . import sqlite_local
+
+_PATH         = getattr(_cfg, "TICKET_DB", "/tmp/dt_tickets.db") or "/tmp/dt_tickets.db"
+TTL           = int(getattr(_cfg, "TICKET_TTL", 600) or 600)            # 票据有效期（秒）
+EVICT_EVERY   = int(getattr(_cfg, "TICKET_EVICT_INTERVAL", 60) or 60)   # 清理间隔（秒）
+WATCH_EVERY   = float(getattr(_cfg, "TICKET_WATCH_INTERVAL", 0.2) or 0.2) # 跨进程变更检测间隔（秒）
+
+_cond = threading.Condition()
+_gen = 0                 # 票据变更代数，每次唤醒 +1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    t        TEXT PRIMARY KEY,
+    ok       INTEGER NOT NULL DEFAULT 0,
+    created  INTEGER NOT NULL,
+    expires  INTEGER NOT NULL,
+    ret      TEXT,
+    account  TEXT,
+    redirect TEXT,
+    ts       INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_tickets_expires ON tickets(expires);
+CREATE TABLE IF NOT EXISTS ticket_seq (id INTEGER PRIMARY KEY CHECK (id = 1), n INTEGER NOT NULL);
+INSERT OR IGNORE INTO ticket_seq(id, n) VALUES (1, 0);
+CREATE TRIGGER IF NOT EXISTS trg_ticket_ok AFTER UPDATE OF ok ON tickets
+WHEN NEW.ok = 1 AND OLD.ok = 0
+BEGIN UPDATE ticket_seq SET n = n + 1 WHERE id = 1; END;
+"""
+
+def _conn() -> sqlite3.Connection:
+    sqlite_local.start_thread("ticket-evictor", _evict_loop)
+    return sqlite_local.connect(_PATH, _SCHEMA)
+
+def new(return_url: str) -> str:
+    t, now = uuid.uuid4().hex, int(time.time())
+    _conn().execute("INSERT INTO tickets(t,ok,created,expires,ret) VALUES (?,0,?,?,?)",
+                    (t, now, now + TTL, return_url))
+    return t
+
+def ok(t: str, account: str, redirect_url: str) -> bool:
+    """标记票据已授权；票据不存在或已过期时返回 False。"""
+    now = int(time.time())
+    cur = _conn().execute(
+        "UPDATE tickets SET ok=1, account=?, redirect=?, ts=? WHERE t=? AND expires>?",
+        (account, redirect_url, now, t, now))
+    if cur.rowcount > 0:
+        _notify(); return True
+    return False
+
+def get(t: str) -> Optional[Dict[str, Any]]:
+    if not t: return None
+    row = _conn().execute(
+        "SELECT ok, created, ret, account, redirect, ts FROM tickets WHERE t=? AND expires>?",
+        (t, int(time.time()))).fetchone()
+    if not row: return None
+    info = {"ok": bool(row[0]), "created": row[1], "return": row[2]}
+    if row[0]:
+        info.update({"account": row[3], "redirect": row[4], "ts": row[5]})
+    return info
+
+def count() -> int:
+    """未过期票据数量。"""
+    return _conn().execute("SELECT COUNT(*) FROM tickets WHERE expires>?", (int(time.time()),)).fetchone()[0]
+
+def evict() -> int:
+    """删除已过期票据，返回删除条数。"""
+    cur = _conn().execute("DELETE FROM tickets WHERE expires<=?", (int(time.time()),))
+    return cur.rowcount
+
+def wait(t: str, timeout: float) -> Optional[Dict[str, Any]]:
+    """
+    等待票据变为已授权，最多 timeout 秒；返回最后一次读取的票据（不存在为 None）。
+    """
+    deadline = time.monotonic() + max(0.0, timeout)
+    _start_watcher()
+    while True:
+        with _cond: gen = _gen
+        info = get(t)
+        if not info or info["ok"]: return info
+        remaining = deadline - time.monotonic()
+        if remaining <= 0: return info
+        with _cond:
+            if _gen == gen: _cond.wait(remaining)
+
+async def await_ok(t: str, timeout: float) -> Optional[Dict[str, Any]]:
+    """
+    wait() 的协程版（ASGI 模式）：每 WATCH_EVERY 秒比较变更代数，仅在有票据变更时重新读库（在线程池中读，
+    不阻塞事件循环），等待期间不占线程。
+    """
+    import asyncio
+    deadline = time.monotonic() + max(0.0, timeout)
+    _start_watcher()
+    seen, info = None, None
+    while True:
+        gen = _gen
+        if gen != seen:
+            seen, info = gen, await asyncio.to_thread(get, t)
+            if not info or info["ok"]: return info
+        remaining = deadline - time.monotonic()
+        if remaining <= 0: return info
+        await asyncio.sleep(min(WATCH_EVERY, remaining))
+
+def _notify():
+    global _gen
+    with _cond:
+        _gen += 1
+        _cond.notify_all()
+
+def _watch_loop():
+    """
+    本线程独占的连接轮询 data_version：其他连接（含其他 worker）提交后该值变化；
+    此时再读授权计数，仅有票据新授权时唤醒等待者。
+    """
+    c = _conn()
+    last, seq = None, None
+    while True:
+        try:
+            v = c.execute("PRAGMA data_version").fetchone()[0]
+            if v != last:
+                n = c.execute("SELECT n FROM ticket_seq WHERE id=1").fetchone()[0]
+                if seq is not None and n != seq: _notify()
+                last, seq = v, n
+        except Exception:
+            logging.exception("ticket watch failed")
+        time.sleep(WATCH_EVERY)
+
+def _start_watcher():
+    sqlite_local.start_thread("ticket-watcher", _watch_loop)
+
+def _evict_loop():
+    while True:
+        time.sleep(EVICT_EVERY)
+        try:
+            n = evict()
+            if n: logging.debug("ticket evicted: %d", n)
+        except Exception:
+            logging.exception("ticket evict failed")
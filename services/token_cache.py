@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+上游访问令牌缓存（钉钉应用 token、禅道管理员 token 共用）
+- 进程内缓存到过期前 TOKEN_REFRESH_MARGIN 秒；进入提前刷新窗口后由一个后台线程刷新，调用方继续用旧 token
+- single-flight：同一进程内并发未命中只有一个线程去取，其余等待结果；
+  跨 worker 经 fcntl 文件锁串行，取到的 token 写入共享 SQLite，其他 worker 直接复用
+- invalidate(token)：上游返回 401 时调用，仅当失效的正是当前 token 才清除，避免并发 401 反复登录
+"""
+import os, time, sqlite3, threading, logging, fcntl
+from typing import Callable, Dict, Tuple
+import config as _cfg
+
+_PATH  = getattr(_cfg, "TOKEN_CACHE_DB", "/tmp/dt_tokens.db") or "/tmp/dt_tokens.db"
+MARGIN = float(getattr(_cfg, "TOKEN_REFRESH_MARGIN", 300) or 300)    # 过期前多少秒开始提前刷新
+
+_SCHEMA = "CREATE TABLE IF NOT EXISTS tokens (name TEXT PRIMARY KEY, token TEXT, expires REAL, fetched REAL)"
+
+class TokenManager:
+    def __init__(self, name: str, fetch: Callable[[], Tuple[str, float]], shared: bool = True):
+        """fetch() 返回 (token, 有效秒数)；失败返回 ("", 0) 或抛异常。"""
+        self.name, self._fetch, self.shared = name, fetch, shared
+        self._lock = threading.Lock()
+        self._token, self._expires, self._fetched = "", 0.0, 0.0
+        self._refreshing = False
+        self.fetches = 0
+
+    # ---- 共享存储 ----
+    def _db(self) -> sqlite3.Connection:
+        new = not os.path.exists(_PATH)
+        c = sqlite3.connect(_PATH, timeout=5, isolation_level=None)
+        if new:
+            try: os.chmod(_PATH, 0o600)
+            except OSError: pass
+        c.execute(_SCHEMA)
+        return c
+
+    def _load_shared(self) -> bool:
+        if not self.shared: return False
+        try:
+            with self._db() as c:
+                r = c.execute("SELECT token, expires, fetched FROM tokens WHERE name=?", (self.name,)).fetchone()
+        except Exception:
+            logging.debug("token cache read failed", exc_info=True); return False
+        if r and r[0] and r[1] > time.time():
+            self._token, self._expires, self._fetched = r[0], r[1], r[2] or 0.0
+            return True
+        return False
+
+    def _store_shared(self):
+        if not self.shared: return
+        try:
+            with self._db() as c:
+                c.execute("INSERT OR REPLACE INTO tokens(name, token, expires, fetched) VALUES (?,?,?,?)",
+                          (self.name, self._token, self._expires, self._fetched))
+        except Exception:
+            logging.warning("token cache write failed", exc_info=True)
+
+    def _file_lock(self):
+        f = open(f"{_PATH}.{self.name}.lock", "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    # ---- 刷新 ----
+    def _refresh(self, stale: str = ""):
+        """持有 self._lock 调用。stale 为已知失效的 token：共享存储里若还是它则不复用。"""
+        f = self._file_lock() if self.shared else None
+        try:
+            if self._load_shared() and self._token != stale and self._expires - time.time() > MARGIN:
+                return        # 其他 worker 已刷新
+            tok, ttl = self._fetch()
+            self.fetches += 1
+            if tok:
+                now = time.time()
+                self._token, self._expires, self._fetched = tok, now + float(ttl or 0), now
+                self._store_shared()
+                logging.info("token %s refreshed, ttl=%ss", self.name, int(ttl or 0))
+            elif stale:
+                self._token, self._expires = "", 0.0
+        finally:
+            if f:
+                fcntl.flock(f, fcntl.LOCK_UN); f.close()
+
+    def _refresh_async(self):
+        def run():
+            try:
+                with self._lock: self._refresh()
+            except Exception:
+                logging.warning("token %s background refresh failed", self.name, exc_info=True)
+            finally:
+                self._refreshing = False
+        self._refreshing = True
+        threading.Thread(target=run, name=f"token-{self.name}", daemon=True).start()
+
+    def get(self) -> str:
+        left = self._expires - time.time()
+        if self._token and left > MARGIN:
+            return self._token
+        if self._token and left > 0:              # 提前刷新窗口：后台刷新，先用旧 token
+            if not self._refreshing and not self._lock.locked(): self._refresh_async()
+            return self._token
+        with self._lock:                          # 已过期 / 尚未获取：single-flight
+            if not (self._token and self._expires > time.time()):
+                if not self._load_shared():
+                    self._refresh()
+            # 刷新失败时不返回已过期的旧 token，由调用方按取 token 失败处理
+            return self._token if self._expires > time.time() else ""
+
+    def invalidate(self, token: str) -> str:
+        """token 被上游拒绝；返回刷新后的 token（并发调用只触发一次登录）。"""
+        with self._lock:
+            if token and token == self._token:
+                self._expires = 0.0
+                self._refresh(stale=token)
+            return self._token
+
+    def age(self) -> float:
+        return time.time() - self._fetched if self._fetched else -1.0
+
+    def stats(self) -> Dict[str, float]:
+        return {"age": round(self.age(), 1), "ttl": round(self._expires - time.time(), 1), "fetches": self.fetches}
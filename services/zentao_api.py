@@ -2,15 +2,23 @@
 """
 ZenTao API 适配（优先 MySQL 直连；兼容 API 模式）：
 - apilogin_url(account): 返回 index.php 免密登录 URL（更稳）
-- user_exists(account): 查 zt_user（未删除）
+- user_exists(account): 查 zt_user（未删除）；auser_exists 为 ASGI 模式的协程版
 - create_user(account, fields): 幂等创建用户（visions=rnd）
 - find_account_by_realname(name): 唯一匹配返回账号
 - ensure_user_groups(account, groups): 把用户加入指定组（按组名）
 - add_user_to_project(project_id, account, role): 加入项目团队
+- provision_user(account, fields, groups, project_id, role): 单连接单事务完成创建+加组+入项目
+- preload_accounts(): 启动时预加载账号索引（见 account_cache）
+- existing_accounts() / create_users_bulk(users): 批量同步用（API 模式分页拉取用户列表）
+- accounts_exist / update_users / deactivate_users: 事件增量同步用
+- ping_db() / ping_web(): 健康探测
 """
-import time, hashlib
-import os, time, hashlib, requests, pymysql
+import os, time, asyncio, hashlib, logging, threading, pymysql
 from typing import Dict, Any, Optional, List
+from . import db_pool, account_cache, metrics, deadline, aio_http, aio_db
+from .http_client import client
+from .token_cache import TokenManager
+import config as _cfg
 from config import (
     ZENTAO_BASE, ZENTAO_CREATE_MODE,
     MYSQL_HOST, MYSQL_PORT, MYSQL_DB, MYSQL_USER, MYSQL_PASS, MYSQL_TABLE_PREFIX,
@@ -18,12 +26,20 @@ from config import (
     ZENTAO_TOKEN_AUTO_LOGIN, ZENTAO_ADMIN_ACCOUNT, ZENTAO_ADMIN_PASSWORD, ZENTAO_TOKEN_URL,
 )
 
-def _db():
+GROUP_CACHE_TTL = int(getattr(_cfg, "ZENTAO_GROUP_CACHE_TTL", 300) or 300)
+HEALTH_PATH = getattr(_cfg, "ZENTAO_HEALTH_PATH", "/index.php?m=misc&f=ping") or "/"
+MYSQL_CONNECT_TIMEOUT = float(getattr(_cfg, "MYSQL_CONNECT_TIMEOUT", 5) or 5)   # 请求内再受剩余预算限制
+
+def _connect():
     return pymysql.connect(
         host=MYSQL_HOST, port=int(MYSQL_PORT), user=MYSQL_USER, password=MYSQL_PASS,
         database=MYSQL_DB, charset="utf8mb4", autocommit=True,
         cursorclass=pymysql.cursors.DictCursor,
+        connect_timeout=deadline.timeout(MYSQL_CONNECT_TIMEOUT),
     )
+def _db():
+    """从连接池借出连接（with 结束归还，不关闭）"""
+    return db_pool.get_pool(_connect).connection()
 def _tbl(name: str) -> str: return f"{MYSQL_TABLE_PREFIX}{name}"
 
 # ---- 登录 URL（index.php 更稳，不额外做存在校验） ----
@@ -34,19 +50,59 @@ def apilogin_url(account: str) -> str:
     return (f"{ZENTAO_BASE}/api.php?m=user&f=apilogin"
             f"&account={account}&code={ZENTAO_APP_CODE}&time={ts}&token={token}")
 
-# ---- 用户是否存在 ----
+# ---- 健康探测（由 services.health 后台线程调用，失败抛异常） ----
+def ping_db():
+    with _db() as conn, conn.cursor() as cur:
+        cur.execute("SELECT 1"); cur.fetchone()
+
+def ping_web(timeout: float = 3.0):
+    """禅道 Web 可达即可（< 500），不跟随跳转、不重试。"""
+    r = _zentao_http.get(f"{ZENTAO_BASE}{HEALTH_PATH}", timeout=timeout, allow_redirects=False, retries=0)
+    r.close()
+    if r.status_code >= 500: raise RuntimeError(f"HTTP {r.status_code}")
+
+# ---- 用户是否存在（经 account_cache，含负缓存） ----
+@metrics.timed("user_exists")
 def user_exists(account: str) -> bool:
+    hit = account_cache.lookup_exists(account)
+    if hit is not None: return hit
     if ZENTAO_CREATE_MODE == "api":
-        return _get_user_api(account)
-    sql = f"SELECT id FROM {_tbl('user')} WHERE account=%s AND deleted='0' LIMIT 1"
-    with _db() as conn, conn.cursor() as cur:
-        cur.execute(sql, (account,))
-        return cur.fetchone() is not None
+        found = _get_user_api(account)
+    else:
+        sql = f"SELECT id FROM {_tbl('user')} WHERE account=%s AND deleted='0' LIMIT 1"
+        with _db() as conn, conn.cursor() as cur:
+            cur.execute(sql, (account,))
+            found = cur.fetchone() is not None
+    account_cache.remember_exists(account, found)
+    return found
+
+@metrics.timed("user_exists")
+async def auser_exists(account: str) -> bool:
+    """user_exists 的协程版（ASGI 模式）：MySQL 走 aio_db，API 走 aio_http；未装对应异步客户端时在线程池中执行同步版。"""
+    hit = account_cache.lookup_exists(account)
+    if hit is not None: return hit
+    if ZENTAO_CREATE_MODE == "api":
+        if not aio_http.NATIVE: return await asyncio.to_thread(user_exists, account)
+        tok = await asyncio.to_thread(_admin_token)        # 可能需要登录取 token
+        r = await aio_http.request("zentao", "GET", f"{ZENTAO_BASE}/api.php/v1/users/{account}",
+                                   headers={"Token": tok} if tok else {}, timeout=8)
+        if r.status_code in (401, 403):                    # token 失效：走同步版（含刷新逻辑）
+            return await asyncio.to_thread(user_exists, account)
+        found = r.status_code == 200
+    else:
+        if not aio_db.NATIVE: return await asyncio.to_thread(user_exists, account)
+        sql = f"SELECT id FROM {_tbl('user')} WHERE account=%s AND deleted='0' LIMIT 1"
+        found = await aio_db.fetchone(sql, (account,)) is not None
+    account_cache.remember_exists(account, found)
+    return found
 
 # ---- 创建用户（MySQL 幂等） ----
+@metrics.timed("create_user")
 def create_user(account: str, fields: Dict[str, Any]) -> Dict[str, Any]:
     if ZENTAO_CREATE_MODE == "api":
-        return _create_user_api(account, fields)
+        ret = _create_user_api(account, fields)
+        if ret.get("ok"): account_cache.on_created(account, fields.get("realname") or "")
+        return ret
     realname = fields.get("realname") or account
     role     = fields.get("role") or "pm"
     dept     = int(fields.get("dept") or 0)
@@ -55,17 +111,166 @@ def create_user(account: str, fields: Dict[str, Any]) -> Dict[str, Any]:
            f"(dept,account,realname,role,visions,deleted) VALUES (%s,%s,%s,%s,%s,'0')")
     with _db() as conn, conn.cursor() as cur:
         cur.execute(sql, (dept, account, realname, role, visions))
+    account_cache.on_created(account, realname)
     return {"ok": True, "detail": "inserted", "mode": "mysql"}
 
+# ---- 批量：现有账号集合 / 分块批量创建 ----
+@metrics.timed("existing_accounts")
+def existing_accounts() -> set:
+    """一次查询取全部账号（含已删除，避免对其重复插入）；API 模式为分页批量拉取。"""
+    if ZENTAO_CREATE_MODE == "api":
+        return {u["account"] for u in _iter_users_api(include_deleted=True)}
+    with _db() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT account FROM {_tbl('user')}")
+        return {r["account"] for r in (cur.fetchall() or [])}
+
+@metrics.timed("create_users_bulk")
+def create_users_bulk(users: List[tuple], chunk: int = 500) -> Dict[str, int]:
+    """
+    users: [(account, fields), ...]；每 chunk 条一次 executemany（PyMySQL 合并为多行 INSERT）。
+    某块失败时逐条重试以定位失败账号。返回 {"created", "skipped", "failed"}。
+    API 模式无批量接口，逐个 POST。
+    """
+    if ZENTAO_CREATE_MODE == "api":
+        out = {"created": 0, "skipped": 0, "failed": 0}
+        for a, f in users:
+            out["created" if create_user(a, f).get("ok") else "failed"] += 1
+        return out
+    sql = (f"INSERT IGNORE INTO {_tbl('user')} "
+           f"(dept,account,realname,role,visions,deleted) VALUES (%s,%s,%s,%s,%s,'0')")
+    def row(account, f):
+        return (int(f.get("dept") or 0), account, f.get("realname") or account,
+                f.get("role") or "pm", f.get("visions") or "rnd")
+    out = {"created": 0, "skipped": 0, "failed": 0}
+    for i in range(0, len(users), chunk):
+        part = users[i:i + chunk]; failed = set()
+        try:
+            with _db() as conn, conn.cursor() as cur:
+                n = cur.executemany(sql, [row(a, f) for a, f in part]) or 0
+            out["created"] += n; out["skipped"] += len(part) - n
+        except Exception as e:
+            logging.warning("bulk insert chunk failed (%s), retry one by one", e)
+            for a, f in part:
+                try:
+                    with _db() as conn, conn.cursor() as cur:
+                        n = cur.execute(sql, row(a, f))
+                    out["created" if n else "skipped"] += 1
+                except Exception:
+                    logging.exception("create user %s failed", a)
+                    out["failed"] += 1; failed.add(a)
+        for a, f in part:
+            if a not in failed: account_cache.on_created(a, f.get("realname") or "")
+    return out
+
+@metrics.timed("accounts_exist")
+def accounts_exist(accounts: List[str]) -> set:
+    """批量存在性检查（未删除），一次 IN 查询。"""
+    if not accounts: return set()
+    fmt = ",".join(["%s"] * len(accounts))
+    with _db() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT account FROM {_tbl('user')} WHERE deleted='0' AND account IN ({fmt})", list(accounts))
+        return {r["account"] for r in (cur.fetchall() or [])}
+
+@metrics.timed("update_users")
+def update_users(users: List[tuple]) -> int:
+    """users: [(account, fields)]；只更新 fields 中给出的 realname / dept。返回影响行数。"""
+    n = 0
+    with _db() as conn, conn.cursor() as cur:
+        for account, f in users:
+            sets = [(col, f[col]) for col in ("realname", "dept") if f.get(col) not in (None, "")]
+            if not sets: continue
+            changed = cur.execute(f"UPDATE {_tbl('user')} SET " + ",".join(f"`{c}`=%s" for c, _ in sets)
+                                  + " WHERE account=%s AND deleted='0'", [v for _, v in sets] + [account])
+            n += changed
+            if changed and f.get("realname"): account_cache.on_renamed(account, f["realname"])
+    return n
+
+@metrics.timed("deactivate_users")
+def deactivate_users(accounts: List[str]) -> int:
+    """离职：软删除（deleted='1'），与禅道后台删除用户一致。"""
+    if not accounts: return 0
+    fmt = ",".join(["%s"] * len(accounts))
+    with _db() as conn, conn.cursor() as cur:
+        n = cur.execute(f"UPDATE {_tbl('user')} SET deleted='1' WHERE deleted='0' AND account IN ({fmt})", list(accounts))
+    for a in accounts: account_cache.on_deactivated(a)
+    return n
+
 # ---- 按真实姓名唯一匹配账号  ----
+@metrics.timed("find_by_realname")
 def find_account_by_realname(realname: str) -> str:
-    if not realname or ZENTAO_CREATE_MODE != "mysql":
+    if not realname:
         return ""
+    hit = account_cache.lookup_realname(realname)
+    if hit is not None: return hit
+    if ZENTAO_CREATE_MODE == "api":
+        # 本地镜像未命中（未加载、后台新建尚未增量同步、重名）：分页拉取用户列表匹配；拉取失败直接抛出，登录失败而不是误建重复账号
+        rows = [u for u in _iter_users_api() if u.get("realname") == realname and u.get("account")]
+        matched = rows[0]["account"] if len(rows) == 1 else ""
+        account_cache.remember_realname(realname, matched)
+        return matched
     sql = f"SELECT account FROM {_tbl('user')} WHERE realname=%s AND deleted='0'"
     with _db() as conn, conn.cursor() as cur:
         cur.execute(sql, (realname,))
         rows = cur.fetchall()
-        return rows[0]["account"] if rows and len(rows) == 1 else ""
+        matched = rows[0]["account"] if rows and len(rows) == 1 else ""
+    account_cache.remember_realname(realname, matched)
+    return matched
+
+# ---- 账号索引预加载（MySQL 一次批量查询 / API 分页拉取；之后按 id 增量） ----
+def _load_accounts(since_id: int = 0):
+    sql = (f"SELECT id, account, realname FROM {_tbl('user')} "
+           f"WHERE deleted='0' AND id>%s ORDER BY id")
+    with _db() as conn, conn.cursor() as cur:
+        cur.execute(sql, (since_id,))
+        return cur.fetchall() or []
+
+def preload_accounts():
+    """后台构建账号集合与 realname 索引；API 模式下即为禅道用户列表的本地镜像。"""
+    account_cache.start_preload(_load_accounts_api if ZENTAO_CREATE_MODE == "api" else _load_accounts)
+
+# ---- 组 ID / 项目团队缓存（组名很少变动；invalidate_caches() 可手动失效） ----
+_cache_lock = threading.Lock()
+_group_ids: Dict[str, int] = {}
+_group_ids_at = 0.0
+_team_known = set()              # 已确认在团队中的 (project_id, account)
+
+def invalidate_caches():
+    global _group_ids_at
+    with _cache_lock:
+        _group_ids.clear(); _group_ids_at = 0.0; _team_known.clear()
+
+def _resolve_group_ids(cur, groups: List[str]) -> List[int]:
+    global _group_ids_at
+    now = time.monotonic()
+    with _cache_lock:
+        if now - _group_ids_at > GROUP_CACHE_TTL:
+            _group_ids.clear(); _group_ids_at = now
+        missing = [g for g in groups if g not in _group_ids]
+    if missing:
+        fmt = ",".join(["%s"] * len(missing))
+        cur.execute(f"SELECT id, `name` FROM {_tbl('group')} WHERE `name` IN ({fmt})", missing)
+        found = {r["name"]: r["id"] for r in (cur.fetchall() or [])}
+        with _cache_lock: _group_ids.update(found)
+    with _cache_lock:
+        return [_group_ids[g] for g in groups if g in _group_ids]
+
+def _insert_usergroups(cur, uid: int, gids: List[int]):
+    if not gids: return
+    cur.execute(f"INSERT IGNORE INTO {_tbl('usergroup')}(`user`,`group`) VALUES "
+                + ",".join(["(%s,%s)"] * len(gids)),
+                [v for gid in gids for v in (uid, gid)])
+
+def _insert_team(cur, project_id: int, account: str, role: str) -> bool:
+    """返回是否执行了插入；调用方在提交后再记入 _team_known。"""
+    if not project_id: return False
+    with _cache_lock:
+        if (project_id, account) in _team_known: return False
+    cur.execute(
+        f"INSERT IGNORE INTO {_tbl('team')}(`root`,`type`,`account`,`role`,`join`,`days`) "
+        f"VALUES (%s,'project',%s,%s,NOW(),36500)",
+        (project_id, account, role)
+    )
+    return True
 
 # ---- 加组 ----
 def ensure_user_groups(account: str, groups: List[str]):
@@ -74,67 +279,143 @@ def ensure_user_groups(account: str, groups: List[str]):
         cur.execute(f"SELECT id FROM {_tbl('user')} WHERE account=%s AND deleted='0' LIMIT 1", (account,))
         u = cur.fetchone()
         if not u: return
-        uid = u["id"]
-        fmt = ",".join(["%s"] * len(groups))
-        cur.execute(f"SELECT id FROM {_tbl('group')} WHERE `name` IN ({fmt})", groups)
-        gids = [r["id"] for r in (cur.fetchall() or [])]
-        for gid in gids:
-            cur.execute(f"INSERT IGNORE INTO {_tbl('usergroup')}(`user`,`group`) VALUES(%s,%s)", (uid, gid))
+        _insert_usergroups(cur, u["id"], _resolve_group_ids(cur, groups))
 
 # ---- 入项目 ----
 def add_user_to_project(project_id: int, account: str, role: str = "pm"):
     if not project_id: return
     with _db() as conn, conn.cursor() as cur:
-        cur.execute(
-            f"INSERT IGNORE INTO {_tbl('team')}(`root`,`type`,`account`,`role`,`join`,`days`) "
-            f"VALUES (%s,'project',%s,%s,NOW(),36500)",
-            (project_id, account, role)
-        )
+        if _insert_team(cur, project_id, account, role):
+            with _cache_lock: _team_known.add((project_id, account))
+
+# ---- 一次性开通：创建（可选）+ 加组 + 入项目，单连接单事务 ----
+@metrics.timed("provision_user")
+def provision_user(account: str, fields: Optional[Dict[str, Any]], groups: List[str],
+                   project_id: int = 0, role: str = "pm") -> Dict[str, Any]:
+    """
+    fields 为 None 时只配权不创建。返回 {"ok", "created", "mode"}。
+    MySQL 模式下新用户：BEGIN / INSERT user / INSERT usergroup(多行) / INSERT team / COMMIT。
+    API 模式下加组 / 入项目仍走数据库：刚创建的账号配权失败时只记日志并返回 provisioned=False（由调用方交后台重试），
+    仅配权的调用照常抛出。
+    """
+    if ZENTAO_CREATE_MODE == "api":
+        ret = {"ok": True, "created": False, "mode": "api"}
+        if fields is not None and not user_exists(account):
+            ret = create_user(account, fields); ret["created"] = bool(ret.get("ok"))
+            if not ret["ok"]: return ret
+        try:
+            ensure_user_groups(account, groups)
+            add_user_to_project(project_id, account, role)
+        except Exception as e:
+            if not ret["created"]: raise
+            logging.warning("post provision failed for %s: %s", account, e)
+            ret["provisioned"] = False
+        return ret
+    created = False
+    with _db() as conn, conn.cursor() as cur:
+        conn.begin()
+        uid = 0
+        if fields is not None:
+            cur.execute(
+                f"INSERT IGNORE INTO {_tbl('user')} "
+                f"(dept,account,realname,role,visions,deleted) VALUES (%s,%s,%s,%s,%s,'0')",
+                (int(fields.get("dept") or 0), account, fields.get("realname") or account,
+                 fields.get("role") or "pm", fields.get("visions") or "rnd"))
+            created = cur.rowcount > 0
+            uid = cur.lastrowid if created else 0
+        if groups and not uid:
+            cur.execute(f"SELECT id FROM {_tbl('user')} WHERE account=%s AND deleted='0' LIMIT 1", (account,))
+            u = cur.fetchone(); uid = u["id"] if u else 0
+        if groups and uid:
+            _insert_usergroups(cur, uid, _resolve_group_ids(cur, groups))
+        joined = _insert_team(cur, project_id, account, role)
+        conn.commit()
+    if joined:
+        with _cache_lock: _team_known.add((project_id, account))
+    if created:
+        account_cache.on_created(account, fields.get("realname") or account)
+    return {"ok": True, "created": created, "mode": "mysql"}
 
 # --------- API 模式（默认Mysql模式） ---------
-_cached_token: Optional[str] = None
-def _login_and_get_token() -> Optional[str]:
+# 管理员 token：配置/环境变量中的静态 token 优先；被拒（401/403）或未配置时自动登录，
+# 由 TokenManager 记录获取时间、到期前提前刷新、并发 401 只登录一次、多 worker 共享。
+ZENTAO_TOKEN_TTL = float(getattr(_cfg, "ZENTAO_TOKEN_TTL", 1200) or 1200)
+API_PAGE_SIZE    = int(getattr(_cfg, "ZENTAO_API_PAGE_SIZE", 500) or 500)
+_zentao_http = client("zentao")
+_static_rejected = False
+
+def _login_and_get_token():
     acct = os.getenv("ZENTAO_ADMIN_ACCOUNT", ZENTAO_ADMIN_ACCOUNT or "")
     pwd  = os.getenv("ZENTAO_ADMIN_PASSWORD", ZENTAO_ADMIN_PASSWORD or "")
-    if not (acct and pwd and ZENTAO_TOKEN_URL): return None
+    if not (acct and pwd and ZENTAO_TOKEN_URL): return "", 0
     try:
-        r = requests.post(ZENTAO_TOKEN_URL, json={"account": acct, "password": pwd}, timeout=8)
+        r = _zentao_http.post(ZENTAO_TOKEN_URL, json={"account": acct, "password": pwd}, timeout=8)
         j = r.json() if r.headers.get("Content-Type","").startswith("application/json") else {}
         tok = (j or {}).get("token")
         if r.status_code in (200,201) and tok:
-            global _cached_token
-            _cached_token = tok
-            os.environ["ZENTAO_ADMIN_TOKEN"] = tok
-            return tok
+            return tok, ZENTAO_TOKEN_TTL
     except Exception:
-        pass
-    return None
+        logging.warning("zentao admin login failed", exc_info=True)
+    return "", 0
+_admin = TokenManager("zentao_admin", _login_and_get_token)
+
+def _static_token() -> str:
+    if _static_rejected: return ""
+    return os.getenv("ZENTAO_ADMIN_TOKEN", "") or (ZENTAO_ADMIN_TOKEN if ZENTAO_ADMIN_TOKEN and not ZENTAO_ADMIN_TOKEN.startswith("YOUR_") else "")
 def _admin_token() -> str:
-    global _cached_token
-    if _cached_token: return _cached_token
-    tok = os.getenv("ZENTAO_ADMIN_TOKEN", "") or (ZENTAO_ADMIN_TOKEN if ZENTAO_ADMIN_TOKEN and not ZENTAO_ADMIN_TOKEN.startswith("YOUR_") else "")
-    if tok:
-        _cached_token = tok; return tok
-    if ZENTAO_TOKEN_AUTO_LOGIN: return _login_and_get_token() or ""
+    tok = _static_token()
+    if tok: return tok
+    if ZENTAO_TOKEN_AUTO_LOGIN: return _admin.get()
     return ""
-def _auth_headers(): tok = _admin_token(); return {"Token": tok} if tok else {}
+def _after_unauthorized(tok: str) -> str:
+    """tok 被拒后取新 token；并发调用共享同一次登录。"""
+    global _static_rejected
+    if tok and tok == _static_token():
+        _static_rejected = True
+        logging.warning("static ZENTAO_ADMIN_TOKEN rejected, switch to auto login")
+        return _admin.get()
+    return _admin.invalidate(tok)
+def _api(method: str, url: str, **kw):
+    tok = _admin_token()
+    r = _zentao_http.request(method, url, headers={"Token": tok} if tok else {}, **kw)
+    if r.status_code in (401,403) and ZENTAO_TOKEN_AUTO_LOGIN:
+        new = _after_unauthorized(tok)
+        if new and new != tok:
+            r = _zentao_http.request(method, url, headers={"Token": new}, **kw)
+    return r
 def _create_user_api(account: str, fields: Dict[str, Any]) -> Dict[str, Any]:
     url = f"{ZENTAO_BASE}/api.php/v1/users"
     payload = {"account": account}; payload.update(fields or {})
     payload.setdefault("gender", "m"); payload.setdefault("password", "LlmY!2025")
-    def call():
-        r = requests.post(url, headers=_auth_headers(), json=payload, timeout=10)
-        ct = r.headers.get("Content-Type",""); data = r.json() if ct.startswith("application/json") else {"text": r.text}
-        return r.status_code, data
-    code, data = call()
-    if code in (401,403) and ZENTAO_TOKEN_AUTO_LOGIN:
-        if _login_and_get_token(): code, data = call()
-    return {"ok": code in (200,201), "detail": data, "mode": "api"}
+    r = _api("POST", url, json=payload, timeout=10)
+    ct = r.headers.get("Content-Type",""); data = r.json() if ct.startswith("application/json") else {"text": r.text}
+    return {"ok": r.status_code in (200,201), "detail": data, "mode": "api"}
 def _get_user_api(account: str) -> bool:
     url = f"{ZENTAO_BASE}/api.php/v1/users/{account}"
-    def call(): return requests.get(url, headers=_auth_headers(), timeout=8).status_code
-    code = call()
-    if code in (401,403) and ZENTAO_TOKEN_AUTO_LOGIN:
-        if _login_and_get_token(): code = call()
-    return code == 200
+    return _api("GET", url, timeout=8).status_code == 200
+
+def _iter_users_api(since_id: int = 0, include_deleted: bool = False):
+    """分页拉取 /api.php/v1/users（按 id 倒序）；增量拉取时遇到 id<=since_id 的页即停止。"""
+    url = f"{ZENTAO_BASE}/api.php/v1/users"
+    page = 1
+    while True:
+        r = _api("GET", url, params={"page": page, "limit": API_PAGE_SIZE, "order": "id_desc"}, timeout=15)
+        if r.status_code != 200:
+            raise RuntimeError(f"list zentao users failed: HTTP {r.status_code}")
+        data = r.json() or {}
+        users = data.get("users") or []
+        for u in users:
+            if int(u.get("id") or 0) <= since_id: continue
+            if include_deleted or str(u.get("deleted", "0")) in ("0", "False", "false"):
+                yield u
+        ids = [int(u.get("id") or 0) for u in users]
+        total = int(data.get("total") or 0)
+        if not users or page * API_PAGE_SIZE >= total:
+            return
+        if since_id and ids == sorted(ids, reverse=True) and ids[-1] <= since_id:
+            return
+        page += 1
 
+def _load_accounts_api(since_id: int = 0):
+    return [{"id": u.get("id"), "account": u.get("account"), "realname": u.get("realname")}
+            for u in _iter_users_api(since_id) if u.get("account")]